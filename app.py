@@ -32,6 +32,57 @@ import os
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg'}
+# Envoi des cartes en flux : corps multipart décodé et écrit par blocs, limite propre à /cartes/upload-carte
+app.config['CARTES_UPLOAD_STREAMING'] = True
+app.config['CARTES_UPLOAD_MAX_SIZE'] = 512 * 1024 * 1024
+# Images réduites des cartes (/cartes/<id>/image) : threads de génération, attente maximale (secondes)
+app.config['CARTES_DERIVATIVE_WORKERS'] = 2
+app.config['CARTES_DERIVATIVE_WAIT'] = 30
+# Délai de grâce (secondes) avant que flask cartes-store sweep supprime un fichier de carte non référencé
+app.config['CARTES_SWEEP_GRACE'] = 3600
+# Envoi des fichiers de carte par le serveur frontal : préfixe de la location interne nginx
+# (X-Accel-Redirect, ex. '/_cartes/' pointant sur UPLOAD_FOLDER/cartes), ou USE_X_SENDFILE pour Apache/lighttpd
+app.config['CARTES_X_ACCEL_REDIRECT'] = None
+app.config['USE_X_SENDFILE'] = False
+
+# Nombre maximal de fragments de site gardés en cache pour /general/user/<id>/alldata
+app.config['HIERARCHY_CACHE_SIZE'] = 256
+
+# Pagination par clé des routes de collection (/sites, /batiments, /etages, /users)
+app.config['PAGE_SIZE_DEFAULT'] = 100
+app.config['PAGE_SIZE_MAX'] = 1000
+
+# Nombre maximal de BAES par requête /baes/bulk
+app.config['BAES_BULK_MAX'] = 10000
+
+# Nombre maximal d'événements par requête /erreurs/ingest
+app.config['ERREURS_INGEST_BATCH_MAX'] = 5000
+# Écriture différée (à activer explicitement) : /erreurs/ingest répond 202 et un thread écrit par micro-lots
+app.config['ERREURS_WRITE_BEHIND'] = False
+app.config['ERREURS_QUEUE_SIZE'] = 50000
+app.config['ERREURS_QUEUE_BATCH_SIZE'] = 1000
+app.config['ERREURS_QUEUE_FLUSH_INTERVAL'] = 0.5
+# Lot en échec : nombre de nouvelles tentatives et délai initial (secondes, doublé à chaque tentative),
+# puis report dans ce fichier (défaut : instance/erreurs_dead_letter.jsonl), rejoué par flask erreurs-queue replay
+app.config['ERREURS_QUEUE_RETRIES'] = 3
+app.config['ERREURS_QUEUE_RETRY_DELAY'] = 1.0
+app.config['ERREURS_DEAD_LETTER_FILE'] = None
+# Fenêtre (secondes) de regroupement des répétitions d'une erreur ouverte ; 0 pour désactiver
+app.config['ERREURS_COALESCE_WINDOW'] = 300
+# Rétention : les erreurs fermées depuis plus de N jours sont archivées par lots (flask erreurs-retention archive)
+app.config['ERREURS_RETENTION_DAYS'] = 90
+app.config['ERREURS_ARCHIVE_BATCH'] = 1000
+# Conservation (jours) des tombstones de /changes, purgés par la même commande ; curseur plus ancien refusé (410)
+app.config['CHANGES_TOMBSTONE_DAYS'] = 30
+# Flux SSE /erreurs/stream : événements gardés par client lent, intervalle (secondes) des heartbeats
+app.config['ERREURS_STREAM_BUFFER'] = 1000
+app.config['ERREURS_STREAM_HEARTBEAT'] = 15
+# Nombre maximal de flux SSE par worker : chacun y occupe un thread, la limite doit laisser des threads libres
+app.config['ERREURS_STREAM_MAX'] = 16
+# Battements de cœur /baes/heartbeat : intervalle (secondes) de recopie en base et de détection,
+# silence (secondes) au-delà duquel une erreur_connexion est levée
+app.config['BAES_HEARTBEAT_INTERVAL'] = 30
+app.config['BAES_HEARTBEAT_TIMEOUT'] = 180
 
 logging.basicConfig(level=logging.DEBUG)
 app.logger.setLevel(logging.DEBUG)
@@ -56,6 +107,20 @@ def load_user(user_id):
 from routes import init_app as init_routes
 init_routes(app)
 
+# Commandes d'administration
+from services.baes_status import baes_status_cli
+app.cli.add_command(baes_status_cli)
+# flask erreurs-stats compact, à planifier (cron / planificateur de tâches) pour alimenter /erreurs/stats
+from services.erreur_stats import erreur_stats_cli
+app.cli.add_command(erreur_stats_cli)
+from services.erreur_retention import erreur_retention_cli
+app.cli.add_command(erreur_retention_cli)
+from services.erreur_queue import erreur_queue_cli
+app.cli.add_command(erreur_queue_cli)
+# flask cartes-store sweep, à planifier pour libérer les fichiers des cartes supprimées
+from services.carte_storage import cartes_store_cli
+app.cli.add_command(cartes_store_cli)
+
 # ... Reste de ton code (création des données par défaut, etc.)
 
 
@@ -132,4 +197,9 @@ if __name__ == '__main__':
         except Exception as e:
             app.logger.error("Erreur de connexion à la base de données : %s", e)
         create_default_data()
+    # Suivi des battements de cœur : seul le processus enfant du rechargeur sert les requêtes
+    from werkzeug.serving import is_running_from_reloader
+    from services.heartbeat import init_heartbeat_monitor
+    if is_running_from_reloader():
+        init_heartbeat_monitor(app)
     app.run(debug=True)
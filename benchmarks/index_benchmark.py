@@ -0,0 +1,265 @@
+"""
+Banc d'essai des index des clés étrangères (migration e7c41a2b9d05).
+
+Crée une base SQLite jetable (fichier temporaire supprimé en fin de mesure, par défaut), y génère un parc synthétique
+(sites -> bâtiments -> étages -> BAES -> historique d'erreurs, utilisateurs et rôles),
+puis chronomètre les requêtes des routes les plus sollicitées sans les index, puis avec.
+Le plan d'exécution de chaque requête est affiché avec --plans (SQLite uniquement).
+
+    python benchmarks/index_benchmark.py --db /tmp/baes_bench.sqlite --sites 20 --erreurs 30
+
+Une URI SQLAlchemy complète peut être passée à --db. Toutes les tables de la base sont supprimées
+puis recréées : une base autre que SQLite n'est acceptée qu'avec --allow-non-sqlite (base vide dédiée).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert, text
+from sqlalchemy.engine import make_url
+
+from models import db
+from models.site import Site
+from models.batiment import Batiment
+from models.etage import Etage
+from models.baes import Baes
+from models.historique_erreur import HistoriqueErreur, error_types
+from models.user import User
+from models.role import Role
+from models.user_site_role import UserSiteRole
+from services.baes_status import refresh_open_errors
+from services.hierarchy import Projection, get_user_site_ids, load_site_hierarchy
+
+# Index ajoutés par la migration e7c41a2b9d05, retirés pour la mesure « avant »
+INDEX_PACK = {
+    Baes: ('ix_baes_etage_id_id',),
+    Etage: ('ix_etages_batiment_id_id',),
+    Batiment: ('ix_batiments_site_id_id',),
+    HistoriqueErreur: ('ix_historique_erreur_baes_id_timestamp', 'ix_historique_erreur_open'),
+    UserSiteRole: ('ix_user_site_role_site_id', 'ix_user_site_role_role_id'),
+}
+
+
+def _indexes():
+    for model, names in INDEX_PACK.items():
+        for index in model.__table__.indexes:
+            if index.name in names:
+                yield index
+
+
+def make_app(uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    db.init_app(app)
+    return app
+
+
+def seed(args):
+    """Génère le parc par INSERT ensemblistes ; retourne l'id de l'utilisateur dont l'arbre est mesuré."""
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    stamp = {'created_at': now, 'updated_at': now}
+    db.session.execute(insert(Role.__table__), [{'id': i, 'name': f'role{i}', **stamp} for i in (1, 2, 3)])
+    db.session.execute(insert(User.__table__), [
+        {'id': i, 'login': f'user{i}', 'password': 'x', **stamp} for i in range(1, args.users + 1)])
+    db.session.execute(insert(Site.__table__), [
+        {'id': s, 'name': f'site{s}', **stamp} for s in range(1, args.sites + 1)])
+    # Chaque utilisateur a accès à quelques sites ; l'utilisateur 1 à `--user-sites` sites
+    roles = [{'user_id': 1, 'site_id': s, 'role_id': 1, **stamp} for s in range(1, args.user_sites + 1)]
+    for user_id in range(2, args.users + 1):
+        for site_id in rng.sample(range(1, args.sites + 1), min(3, args.sites)):
+            roles.append({'user_id': user_id, 'site_id': site_id, 'role_id': rng.randint(1, 3), **stamp})
+    db.session.execute(insert(UserSiteRole.__table__), roles)
+
+    batiments, etages, baes, erreurs = [], [], [], []
+    for site_id in range(1, args.sites + 1):
+        for _ in range(args.batiments):
+            batiments.append({'id': len(batiments) + 1, 'name': 'b', 'site_id': site_id, **stamp})
+    for batiment in batiments:
+        for _ in range(args.etages):
+            etages.append({'id': len(etages) + 1, 'name': 'e', 'batiment_id': batiment['id'], **stamp})
+    for etage in etages:
+        for _ in range(args.baes):
+            baes.append({'id': len(baes) + 1, 'name': f'baes{len(baes) + 1}', 'position': {'x': 1, 'y': 1},
+                         'etage_id': etage['id'], **stamp})
+    db.session.execute(insert(Batiment.__table__), batiments)
+    db.session.execute(insert(Etage.__table__), etages)
+    db.session.execute(insert(Baes.__table__), baes)
+    db.session.commit()
+
+    # L'historique est inséré par lots, dans un ordre aléatoire des BAES comme en production
+    total = len(baes) * args.erreurs
+    for _ in range(total):
+        closed = rng.random() < 0.9
+        erreurs.append({'baes_id': rng.randint(1, len(baes)), 'type_erreur': rng.choice(error_types),
+                        'is_solved': closed, 'is_ignored': False, 'occurrences': 1,
+                        'timestamp': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)), **stamp})
+        if len(erreurs) == 50000:
+            db.session.execute(insert(HistoriqueErreur.__table__), erreurs)
+            erreurs = []
+    if erreurs:
+        db.session.execute(insert(HistoriqueErreur.__table__), erreurs)
+    db.session.commit()
+    return {'sites': args.sites, 'batiments': len(batiments), 'etages': len(etages), 'baes': len(baes),
+            'erreurs': total, 'user_site_role': len(roles)}
+
+
+def scenarios(args):
+    """Requêtes mesurées : (nom, fonction sans argument)."""
+    nb_etages = args.sites * args.batiments * args.etages
+    nb_baes = nb_etages * args.baes
+    rng = random.Random(args.seed + 1)
+    etage_ids = [rng.randint(1, nb_etages) for _ in range(20)]
+    baes_ids = [rng.randint(1, nb_baes) for _ in range(20)]
+    site_ids = [rng.randint(1, args.sites) for _ in range(20)]
+
+    def alldata():
+        load_site_hierarchy(get_user_site_ids(1))
+
+    def alldata_recent():
+        load_site_hierarchy(get_user_site_ids(1), Projection(erreurs_limit=5))
+
+    def alldata_open():
+        load_site_hierarchy(get_user_site_ids(1), Projection(erreurs_open=True))
+
+    def baes_of_floor():
+        for etage_id in etage_ids:
+            Baes.query.filter(Baes.etage_id == etage_id).order_by(Baes.id).limit(100).all()
+
+    def history_of_baes():
+        for baes_id in baes_ids:
+            (HistoriqueErreur.query.filter(HistoriqueErreur.baes_id == baes_id)
+             .order_by(HistoriqueErreur.timestamp.desc()).limit(50).all())
+
+    def open_errors_of_baes():
+        refresh_open_errors(baes_ids)
+        db.session.rollback()
+
+    def users_of_site():
+        for site_id in site_ids:
+            UserSiteRole.query.filter(UserSiteRole.site_id == site_id).all()
+
+    return [
+        ('alldata (arbre complet)', alldata),
+        ('alldata erreurs_limit=5', alldata_recent),
+        ('alldata erreurs=open', alldata_open),
+        ('BAES par étage x20', baes_of_floor),
+        ('historique par BAES x20', history_of_baes),
+        ('erreurs ouvertes x20 BAES', open_errors_of_baes),
+        ('utilisateurs par site x20', users_of_site),
+    ]
+
+
+def measure(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def show_plans():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    statements = {
+        'BAES par étage': "SELECT id FROM baes WHERE etage_id = 1 ORDER BY id LIMIT 100",
+        'historique par BAES': "SELECT id FROM historique_erreur WHERE baes_id = 1 ORDER BY timestamp DESC LIMIT 50",
+        'erreurs ouvertes': "SELECT baes_id, type_erreur, count(*) FROM historique_erreur "
+                            "WHERE baes_id IN (1, 2) AND is_solved = 0 AND is_ignored = 0 GROUP BY baes_id, type_erreur",
+        'utilisateurs par site': "SELECT user_id FROM user_site_role WHERE site_id = 1",
+    }
+    for name, sql in statements.items():
+        plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        print(f"    {name:<24} {' | '.join(row[-1] for row in plan)}")
+
+
+def run(args, label):
+    if args.plans:
+        print(f"  Plans ({label}) :")
+        show_plans()
+    results = {}
+    for name, fn in scenarios(args):
+        results[name] = measure(fn, args.repeat)
+    return results
+
+
+def bench(args, uri):
+    """Recrée les tables, génère le parc et mesure les requêtes sans puis avec les index ; retourne (avant, après)."""
+    app = make_app(uri)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        counts = seed(args)
+        print(f"Parc généré en {time.perf_counter() - start:.1f} s : "
+              + ', '.join(f"{count} {name}" for name, count in counts.items()))
+
+        for index in _indexes():
+            index.drop(db.engine)
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text('ANALYZE'))
+        before = run(args, 'sans index')
+
+        for index in _indexes():
+            index.create(db.engine)
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text('ANALYZE'))
+        after = run(args, 'avec index')
+        db.session.remove()
+        # Connexions fermées avant la suppression du fichier temporaire
+        db.engine.dispose()
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Fichier SQLite ou URI SQLAlchemy (par défaut : fichier temporaire)")
+    parser.add_argument('--allow-non-sqlite', action='store_true',
+                        help="Accepte une URI autre que SQLite (toutes ses tables sont supprimées)")
+    parser.add_argument('--sites', type=int, default=10)
+    parser.add_argument('--batiments', type=int, default=4, help="Bâtiments par site")
+    parser.add_argument('--etages', type=int, default=6, help="Étages par bâtiment")
+    parser.add_argument('--baes', type=int, default=25, help="BAES par étage")
+    parser.add_argument('--erreurs', type=int, default=20, help="Erreurs par BAES (en moyenne)")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--user-sites', type=int, default=3, help="Sites de l'utilisateur mesuré par alldata")
+    parser.add_argument('--repeat', type=int, default=5, help="Meilleur temps sur N exécutions")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--plans', action='store_true', help="Affiche les plans d'exécution (SQLite)")
+    args = parser.parse_args()
+
+    temporary = None
+    if args.db is None:
+        handle, temporary = tempfile.mkstemp(prefix='baes_bench_', suffix='.sqlite')
+        os.close(handle)
+        uri = f"sqlite:///{temporary}"
+    else:
+        uri = args.db if '://' in args.db else f"sqlite:///{os.path.abspath(args.db)}"
+    # Le banc commence par drop_all() : une base de production ne doit pas pouvoir être visée par erreur
+    backend = make_url(uri).get_backend_name()
+    if backend != 'sqlite' and not args.allow_non_sqlite:
+        parser.error(f"base {backend} refusée sans --allow-non-sqlite (toutes ses tables seraient supprimées)")
+    try:
+        before, after = bench(args, uri)
+    finally:
+        if temporary is not None:
+            os.remove(temporary)
+
+    print(f"\n{'requête':<28}{'avant (ms)':>12}{'après (ms)':>12}{'gain':>8}")
+    for name in before:
+        gain = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<28}{before[name] * 1000:>12.1f}{after[name] * 1000:>12.1f}{gain:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
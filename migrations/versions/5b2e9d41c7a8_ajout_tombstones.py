@@ -0,0 +1,40 @@
+"""ajout tombstones
+
+Revision ID: 5b2e9d41c7a8
+Revises: 37d055509287
+Create Date: 2026-10-17 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e9d41c7a8'
+down_revision = '37d055509287'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(length=30), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('site_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('tombstones', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tombstones_site_id'), ['site_id'], unique=False)
+        batch_op.create_index('ix_tombstones_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_tombstones_created_at')
+        batch_op.drop_index(batch_op.f('ix_tombstones_site_id'))
+
+    op.drop_table('tombstones')
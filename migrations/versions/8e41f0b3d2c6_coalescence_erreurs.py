@@ -0,0 +1,28 @@
+"""coalescence erreurs
+
+Revision ID: 8e41f0b3d2c6
+Revises: 5b2e9d41c7a8
+Create Date: 2026-10-17 11:02:17.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41f0b3d2c6'
+down_revision = '5b2e9d41c7a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('occurrences', sa.Integer(), server_default=sa.text('1'), nullable=False))
+        batch_op.add_column(sa.Column('last_seen', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.drop_column('last_seen')
+        batch_op.drop_column('occurrences', mssql_drop_default=True)
@@ -0,0 +1,48 @@
+"""archive erreurs
+
+Revision ID: a6d3e9b0c517
+Revises: f1b28c4e7a93
+Create Date: 2026-10-17 17:42:09.530861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e9b0c517'
+down_revision = 'f1b28c4e7a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('historique_erreur_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('baes_id', sa.Integer(), nullable=False),
+    sa.Column('type_erreur', sa.Enum('erreur_connexion', 'erreur_batterie', name='type_erreur'), nullable=False),
+    sa.Column('is_solved', sa.Boolean(), nullable=False),
+    sa.Column('is_ignored', sa.Boolean(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('occurrences', sa.Integer(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('historique_erreur_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_historique_erreur_archive_baes_id'), ['baes_id'], unique=False)
+
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.create_index('ix_historique_erreur_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.drop_index('ix_historique_erreur_updated_at')
+
+    with op.batch_alter_table('historique_erreur_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_historique_erreur_archive_baes_id'))
+
+    op.drop_table('historique_erreur_archive')
@@ -0,0 +1,31 @@
+"""ajout baes heartbeat
+
+Revision ID: b94f0d6a2e18
+Revises: e7c41a2b9d05
+Create Date: 2026-10-17 20:31:12.406583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b94f0d6a2e18'
+down_revision = 'e7c41a2b9d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('baes_heartbeat',
+    sa.Column('baes_id', sa.Integer(), nullable=False),
+    sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['baes_id'], ['baes.id'], ),
+    sa.PrimaryKeyConstraint('baes_id')
+    )
+
+
+def downgrade():
+    op.drop_table('baes_heartbeat')
@@ -0,0 +1,41 @@
+"""ajout baes status
+
+Revision ID: c3a7d95e1f42
+Revises: 8e41f0b3d2c6
+Create Date: 2026-10-17 14:26:51.602377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a7d95e1f42'
+down_revision = '8e41f0b3d2c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('baes_status',
+    sa.Column('baes_id', sa.Integer(), nullable=False),
+    sa.Column('open_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('open_types', sa.JSON(), nullable=False),
+    sa.Column('error_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('last_error_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['baes_id'], ['baes.id'], ),
+    sa.PrimaryKeyConstraint('baes_id')
+    )
+    with op.batch_alter_table('baes_status', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_baes_status_open_count'), ['open_count'], unique=False)
+
+    # Le contenu initial est calculé depuis l'historique : flask baes-status rebuild
+
+
+def downgrade():
+    with op.batch_alter_table('baes_status', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_baes_status_open_count'))
+
+    op.drop_table('baes_status')
@@ -0,0 +1,26 @@
+"""index cartes chemin
+
+Revision ID: c5e2a8f17b40
+Revises: b94f0d6a2e18
+Create Date: 2026-10-17 21:05:37.192846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2a8f17b40'
+down_revision = 'b94f0d6a2e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cartes', schema=None) as batch_op:
+        batch_op.create_index('ix_cartes_chemin', ['chemin'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cartes', schema=None) as batch_op:
+        batch_op.drop_index('ix_cartes_chemin')
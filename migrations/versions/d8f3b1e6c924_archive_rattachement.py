@@ -0,0 +1,62 @@
+"""archive rattachement
+
+Revision ID: d8f3b1e6c924
+Revises: c5e2a8f17b40
+Create Date: 2026-10-17 21:05:37.184226
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3b1e6c924'
+down_revision = 'c5e2a8f17b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('historique_erreur_archive', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('baes_name', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('etage_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('etage_name', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('batiment_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('batiment_name', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('site_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('site_name', sa.String(length=50), nullable=True))
+        batch_op.create_index(batch_op.f('ix_historique_erreur_archive_site_id'), ['site_id'], unique=False)
+
+    # Lignes déjà archivées : rattachement repris des BAES encore présentes
+    op.execute("""
+        UPDATE historique_erreur_archive SET
+            baes_name = (SELECT b.name FROM baes b WHERE b.id = historique_erreur_archive.baes_id),
+            etage_id = (SELECT e.id FROM baes b JOIN etages e ON e.id = b.etage_id
+                        WHERE b.id = historique_erreur_archive.baes_id),
+            etage_name = (SELECT e.name FROM baes b JOIN etages e ON e.id = b.etage_id
+                          WHERE b.id = historique_erreur_archive.baes_id),
+            batiment_id = (SELECT t.id FROM baes b JOIN etages e ON e.id = b.etage_id
+                           JOIN batiments t ON t.id = e.batiment_id
+                           WHERE b.id = historique_erreur_archive.baes_id),
+            batiment_name = (SELECT t.name FROM baes b JOIN etages e ON e.id = b.etage_id
+                             JOIN batiments t ON t.id = e.batiment_id
+                             WHERE b.id = historique_erreur_archive.baes_id),
+            site_id = (SELECT s.id FROM baes b JOIN etages e ON e.id = b.etage_id
+                       JOIN batiments t ON t.id = e.batiment_id JOIN sites s ON s.id = t.site_id
+                       WHERE b.id = historique_erreur_archive.baes_id),
+            site_name = (SELECT s.name FROM baes b JOIN etages e ON e.id = b.etage_id
+                         JOIN batiments t ON t.id = e.batiment_id JOIN sites s ON s.id = t.site_id
+                         WHERE b.id = historique_erreur_archive.baes_id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('historique_erreur_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_historique_erreur_archive_site_id'))
+        batch_op.drop_column('site_name')
+        batch_op.drop_column('site_id')
+        batch_op.drop_column('batiment_name')
+        batch_op.drop_column('batiment_id')
+        batch_op.drop_column('etage_name')
+        batch_op.drop_column('etage_id')
+        batch_op.drop_column('baes_name')
@@ -0,0 +1,55 @@
+"""index cles etrangeres
+
+Revision ID: e7c41a2b9d05
+Revises: a6d3e9b0c517
+Create Date: 2026-10-17 19:20:44.871035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c41a2b9d05'
+down_revision = 'a6d3e9b0c517'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('baes', schema=None) as batch_op:
+        batch_op.create_index('ix_baes_etage_id_id', ['etage_id', 'id'], unique=False)
+
+    with op.batch_alter_table('etages', schema=None) as batch_op:
+        batch_op.create_index('ix_etages_batiment_id_id', ['batiment_id', 'id'], unique=False)
+
+    with op.batch_alter_table('batiments', schema=None) as batch_op:
+        batch_op.create_index('ix_batiments_site_id_id', ['site_id', 'id'], unique=False)
+
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.create_index('ix_historique_erreur_baes_id_timestamp', ['baes_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_historique_erreur_open', ['baes_id', 'is_solved', 'is_ignored', 'type_erreur'],
+                              unique=False)
+
+    with op.batch_alter_table('user_site_role', schema=None) as batch_op:
+        batch_op.create_index('ix_user_site_role_site_id', ['site_id', 'user_id'], unique=False)
+        batch_op.create_index('ix_user_site_role_role_id', ['role_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_site_role', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_site_role_role_id')
+        batch_op.drop_index('ix_user_site_role_site_id')
+
+    with op.batch_alter_table('historique_erreur', schema=None) as batch_op:
+        batch_op.drop_index('ix_historique_erreur_open')
+        batch_op.drop_index('ix_historique_erreur_baes_id_timestamp')
+
+    with op.batch_alter_table('batiments', schema=None) as batch_op:
+        batch_op.drop_index('ix_batiments_site_id_id')
+
+    with op.batch_alter_table('etages', schema=None) as batch_op:
+        batch_op.drop_index('ix_etages_batiment_id_id')
+
+    with op.batch_alter_table('baes', schema=None) as batch_op:
+        batch_op.drop_index('ix_baes_etage_id_id')
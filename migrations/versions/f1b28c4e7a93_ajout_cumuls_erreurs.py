@@ -0,0 +1,48 @@
+"""ajout cumuls erreurs
+
+Revision ID: f1b28c4e7a93
+Revises: c3a7d95e1f42
+Create Date: 2026-10-17 16:05:38.114920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b28c4e7a93'
+down_revision = 'c3a7d95e1f42'
+branch_labels = None
+depends_on = None
+
+
+def _rollup_table(name):
+    op.create_table(name,
+    sa.Column('bucket', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('etage_id', sa.Integer(), nullable=False),
+    sa.Column('type_erreur', sa.Enum('erreur_connexion', 'erreur_batterie', name='type_erreur'), nullable=False),
+    sa.Column('batiment_id', sa.Integer(), nullable=True),
+    sa.Column('site_id', sa.Integer(), nullable=True),
+    sa.Column('count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('bucket', 'etage_id', 'type_erreur')
+    )
+
+
+def upgrade():
+    _rollup_table('erreur_rollup_hour')
+    _rollup_table('erreur_rollup_day')
+    op.create_table('erreur_rollup_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('last_erreur_id', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('erreur_rollup_state')
+    op.drop_table('erreur_rollup_day')
+    op.drop_table('erreur_rollup_hour')
@@ -25,3 +25,8 @@ from .baes import Baes
 from .historique_erreur import HistoriqueErreur
 from .user import User
 from .user_site_role import UserSiteRole  # Nouveau modèle d'association
+from .tombstone import Tombstone
+from .baes_status import BaesStatus
+from .erreur_rollup import ErreurRollupHour, ErreurRollupDay, ErreurRollupState
+from .historique_erreur_archive import HistoriqueErreurArchive
+from .baes_heartbeat import BaesHeartbeat
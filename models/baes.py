@@ -6,6 +6,10 @@ from . import db
 
 class Baes(TimestampMixin,db.Model):
     __tablename__ = 'baes'
+    __table_args__ = (
+        # BAES d'un étage (arbre alldata, liste filtrée par etage_id et paginée par id)
+        db.Index('ix_baes_etage_id_id', 'etage_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     position = db.Column(db.JSON, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import DateTime
+
+from templates.TimestampMixin import TimestampMixin
+from . import db
+
+
+class BaesHeartbeat(TimestampMixin, db.Model):
+    """
+    Dernier battement de cœur connu d'une BAES, recopié périodiquement depuis la table en mémoire
+    de services.heartbeat (précision de l'ordre de l'intervalle de recopie).
+    """
+    __tablename__ = 'baes_heartbeat'
+
+    baes_id = db.Column(db.Integer, db.ForeignKey('baes.id'), primary_key=True)
+    last_seen_at = db.Column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<BaesHeartbeat baes_id={self.baes_id} last_seen_at={self.last_seen_at}>"
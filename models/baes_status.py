@@ -0,0 +1,28 @@
+from sqlalchemy import DateTime, text
+
+from templates.TimestampMixin import TimestampMixin
+from . import db
+
+
+class BaesStatus(TimestampMixin, db.Model):
+    """
+    État courant d'une BAES, projeté depuis historique_erreur (une ligne par BAES ayant déjà eu une erreur).
+
+    Tenu à jour par les chemins d'insertion et de résolution des erreurs ; reconstructible
+    à tout moment par `flask baes-status rebuild`. Une BAES sans ligne n'a jamais eu d'erreur.
+    """
+    __tablename__ = 'baes_status'
+
+    baes_id = db.Column(db.Integer, db.ForeignKey('baes.id'), primary_key=True)
+    # Nombre d'erreurs ouvertes (ni résolues ni ignorées), indexé pour lister les BAES en défaut
+    open_count = db.Column(db.Integer, default=0, server_default=text('0'), nullable=False, index=True)
+    # Détail des erreurs ouvertes par type : {type_erreur: nombre}
+    open_types = db.Column(db.JSON, nullable=False, default=dict)
+    # Nombre de lignes d'historique (hors archive) et date de la dernière occurrence connue
+    error_count = db.Column(db.Integer, default=0, server_default=text('0'), nullable=False)
+    last_error_at = db.Column(DateTime(timezone=True), nullable=True)
+
+    baes = db.relationship('Baes', backref=db.backref('status', uselist=False, lazy=True))
+
+    def __repr__(self):
+        return f"<BaesStatus baes_id={self.baes_id} open={self.open_count}>"
@@ -6,6 +6,9 @@ from . import db
 
 class Batiment(TimestampMixin,db.Model):
     __tablename__ = 'batiments'
+    __table_args__ = (
+        db.Index('ix_batiments_site_id_id', 'site_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     polygon_points = db.Column(db.JSON)
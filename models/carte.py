@@ -23,7 +23,9 @@ class Carte(TimestampMixin, db.Model):
         ),
         # Ces index garantissent l'unicité pour les valeurs non-NULL
         Index('uq_cartes_etage_id', 'etage_id', unique=True, mssql_where=text("etage_id IS NOT NULL")),
-        Index('uq_cartes_site_id', 'site_id', unique=True, mssql_where=text("site_id IS NOT NULL"))
+        Index('uq_cartes_site_id', 'site_id', unique=True, mssql_where=text("site_id IS NOT NULL")),
+        # Comptage des références d'un contenu du magasin (services.carte_storage)
+        Index('ix_cartes_chemin', 'chemin')
     )
 
     def __repr__(self):
@@ -0,0 +1,46 @@
+from sqlalchemy import DateTime, text
+
+from templates.TimestampMixin import TimestampMixin
+from . import db
+from .historique_erreur import error_types
+
+
+class _ErreurRollupMixin(TimestampMixin):
+    # Début du créneau (UTC), tronqué à l'heure ou au jour selon la table
+    bucket = db.Column(DateTime(timezone=True), primary_key=True)
+    etage_id = db.Column(db.Integer, primary_key=True)
+    type_erreur = db.Column(db.Enum(*error_types, name='type_erreur'), primary_key=True)
+    # Rattachement figé au moment de l'agrégation : les rapports restent stables si l'arbre change
+    batiment_id = db.Column(db.Integer, nullable=True)
+    site_id = db.Column(db.Integer, nullable=True)
+    count = db.Column(db.Integer, default=0, server_default=text('0'), nullable=False)
+
+
+class ErreurRollupHour(_ErreurRollupMixin, db.Model):
+    """Nombre d'erreurs par heure, étage et type (alimentée par services.erreur_stats.compact_rollups)."""
+    __tablename__ = 'erreur_rollup_hour'
+
+    def __repr__(self):
+        return f"<ErreurRollupHour {self.bucket} etage={self.etage_id} {self.type_erreur}={self.count}>"
+
+
+class ErreurRollupDay(_ErreurRollupMixin, db.Model):
+    """Nombre d'erreurs par jour, étage et type (alimentée par services.erreur_stats.compact_rollups)."""
+    __tablename__ = 'erreur_rollup_day'
+
+    def __repr__(self):
+        return f"<ErreurRollupDay {self.bucket} etage={self.etage_id} {self.type_erreur}={self.count}>"
+
+
+class ErreurRollupState(TimestampMixin, db.Model):
+    """
+    Avancement de l'agrégation : les erreurs d'id <= last_erreur_id sont comptées dans les tables
+    de cumul, les suivantes sont lues dans l'historique brut.
+    """
+    __tablename__ = 'erreur_rollup_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    last_erreur_id = db.Column(db.Integer, default=0, server_default=text('0'), nullable=False)
+
+    def __repr__(self):
+        return f"<ErreurRollupState last_erreur_id={self.last_erreur_id}>"
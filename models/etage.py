@@ -6,6 +6,9 @@ from . import db
 
 class Etage(TimestampMixin,db.Model):
     __tablename__ = 'etages'
+    __table_args__ = (
+        db.Index('ix_etages_batiment_id_id', 'batiment_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     batiment_id = db.Column(db.Integer, db.ForeignKey('batiments.id'), nullable=False)
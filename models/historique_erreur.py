@@ -24,6 +24,19 @@ class HistoriqueErreur(TimestampMixin,db.Model):
         default=current_time,
         nullable=False
     )
+    # Coalescence des répétitions : nombre d'occurrences regroupées et date de la dernière
+    # (NULL tant que l'erreur n'a été vue qu'une fois, la date est alors `timestamp`)
+    occurrences = db.Column(db.Integer, default=1, server_default=text('1'), nullable=False)
+    last_seen = db.Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Seuil de rétention : les erreurs fermées sont sélectionnées par date de dernière modification
+        db.Index('ix_historique_erreur_updated_at', 'updated_at'),
+        # Historique d'une BAES par date (erreurs_limit / erreurs_since de alldata)
+        db.Index('ix_historique_erreur_baes_id_timestamp', 'baes_id', 'timestamp'),
+        # Erreurs ouvertes d'une BAES par type (baes_status, fermetures groupées, erreurs=open)
+        db.Index('ix_historique_erreur_open', 'baes_id', 'is_solved', 'is_ignored', 'type_erreur'),
+    )
 
     def __repr__(self):
         return f"<HistoriqueErreur(baes_id={self.baes_id}, type_erreur={self.type_erreur}, timestamp={self.timestamp})>"
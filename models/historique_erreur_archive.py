@@ -0,0 +1,37 @@
+from sqlalchemy import DateTime
+
+from templates.TimestampMixin import TimestampMixin
+from . import db
+from .historique_erreur import error_types
+
+
+class HistoriqueErreurArchive(TimestampMixin, db.Model):
+    """
+    Erreurs résolues ou ignorées sorties de historique_erreur par la rétention
+    (services.erreur_retention). Les lignes gardent leur id, leurs dates et leur compteur
+    d'occurrences d'origine ; baes_id n'est pas une clé étrangère pour survivre à la
+    suppression de la BAES. Le rattachement (étage, bâtiment, site) et les noms sont recopiés
+    à l'archivage : l'export d'un site reste complet après la suppression de la BAES.
+    """
+    __tablename__ = 'historique_erreur_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    baes_id = db.Column(db.Integer, nullable=False, index=True)
+    type_erreur = db.Column(db.Enum(*error_types, name='type_erreur'), nullable=False)
+    is_solved = db.Column(db.Boolean, default=False, nullable=False)
+    is_ignored = db.Column(db.Boolean, default=False, nullable=False)
+    timestamp = db.Column(DateTime(timezone=True), nullable=False)
+    occurrences = db.Column(db.Integer, default=1, nullable=False)
+    last_seen = db.Column(DateTime(timezone=True), nullable=True)
+    archived_at = db.Column(DateTime(timezone=True), nullable=False)
+    # Rattachement au moment de l'archivage (nul pour une BAES déjà supprimée)
+    baes_name = db.Column(db.String(50), nullable=True)
+    etage_id = db.Column(db.Integer, nullable=True)
+    etage_name = db.Column(db.String(100), nullable=True)
+    batiment_id = db.Column(db.Integer, nullable=True)
+    batiment_name = db.Column(db.String(50), nullable=True)
+    site_id = db.Column(db.Integer, nullable=True, index=True)
+    site_name = db.Column(db.String(50), nullable=True)
+
+    def __repr__(self):
+        return f"<HistoriqueErreurArchive(id={self.id}, baes_id={self.baes_id}, type_erreur={self.type_erreur})>"
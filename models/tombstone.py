@@ -0,0 +1,26 @@
+from templates.TimestampMixin import TimestampMixin
+from . import db
+
+
+class Tombstone(TimestampMixin, db.Model):
+    """
+    Trace d'une suppression, utilisée par la synchronisation incrémentale (/general/user/<id>/changes).
+
+    `created_at` correspond à l'instant de la suppression. `user_id` n'est renseigné que
+    pour les retraits d'accès (suppression d'une association UserSiteRole).
+    """
+    __tablename__ = 'tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(30), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # Site de rattachement de la ligne supprimée, pour filtrer selon les accès de l'utilisateur
+    site_id = db.Column(db.Integer, nullable=True, index=True)
+    user_id = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_tombstones_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<Tombstone {self.entity_type}#{self.entity_id}>"
@@ -3,6 +3,12 @@ from templates.TimestampMixin import TimestampMixin
 
 class UserSiteRole(TimestampMixin, db.Model):
     __tablename__ = 'user_site_role'
+    # La clé primaire (user_id, site_id, role_id) sert les recherches par utilisateur ;
+    # ces index servent les recherches inverses (utilisateurs d'un site, associations d'un rôle).
+    __table_args__ = (
+        db.Index('ix_user_site_role_site_id', 'site_id', 'user_id'),
+        db.Index('ix_user_site_role_role_id', 'role_id'),
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), primary_key=True)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), primary_key=True)
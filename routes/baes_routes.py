@@ -1,8 +1,659 @@
 # routes/baes_routes.py
 from flask import Blueprint, request, jsonify, current_app
 from flasgger import swag_from
-from models.batiment import Batiment
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import contains_eager, defer
+from models.baes import Baes
+from models.baes_heartbeat import BaesHeartbeat
+from models.baes_status import BaesStatus
+from models.etage import Etage
+from models.historique_erreur import HistoriqueErreur
+from templates.TimestampMixin import current_time
 from models import db
+from services.baes_status import status_to_dict
+from services.bulk import chunked
+from services.changes import record_baes_moves, record_deleted
+from services.heartbeat import get_heartbeat_monitor
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, int_arg, keyset_page, page_params,
+                                 set_link_header)
 
 
-baes_bp = Blueprint('baes_bp', __name__)
\ No newline at end of file
+baes_bp = Blueprint('baes_bp', __name__)
+
+DEFAULT_BULK_MAX = 10000
+NAME_MAX_LENGTH = Baes.__table__.c.name.type.length
+
+BAES_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'id': {'type': 'integer', 'example': 1},
+        'name': {'type': 'string', 'example': 'BAES 1'},
+        'position': {'type': 'object', 'example': {'lat': 48.8566, 'lng': 2.3522}},
+        'etage_id': {'type': 'integer', 'example': 1}
+    }
+}
+
+BAES_STATUS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'baes_id': {'type': 'integer', 'example': 1},
+        'name': {'type': 'string', 'example': 'BAES 1'},
+        'open_count': {'type': 'integer', 'example': 1},
+        'open_types': {'type': 'object', 'example': {'erreur_batterie': 1}},
+        'error_count': {'type': 'integer', 'example': 12},
+        'last_error_at': {'type': 'string', 'example': '2025-04-03T12:40:12Z'}
+    }
+}
+
+
+def _baes_dict(b):
+    return {
+        'id': b.id,
+        'name': b.name,
+        'position': b.position,
+        'etage_id': b.etage_id
+    }
+
+
+def _status_dict(b):
+    return {'baes_id': b.id, 'name': b.name, **status_to_dict(b.status)}
+
+
+def _is_id(value):
+    """Vrai pour un entier JSON (bool, sous-classe de int, exclu : true ne doit pas désigner l'id 1)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _name_error(name):
+    """Motif de refus d'un nom de BAES, ou None s'il est valide."""
+    if not isinstance(name, str) or not name.strip():
+        return 'Le champ name doit être une chaîne non vide'
+    if len(name) > NAME_MAX_LENGTH:
+        return f'Le champ name ne doit pas dépasser {NAME_MAX_LENGTH} caractères'
+    return None
+
+
+def _existing_names(names):
+    """Retourne {name: id} des BAES existantes parmi `names` (une requête IN par tranche)."""
+    found = {}
+    for chunk in chunked(names):
+        found.update(db.session.query(Baes.name, Baes.id).filter(Baes.name.in_(chunk)).all())
+    return found
+
+
+def _existing_etage_ids(etage_ids):
+    found = set()
+    for chunk in chunked(etage_ids):
+        found.update(etage_id for (etage_id,) in db.session.query(Etage.id).filter(Etage.id.in_(chunk)).all())
+    return found
+
+
+def _bulk_payload():
+    """Lit le tableau JSON d'une requête bulk ; retourne (items, réponse d'erreur)."""
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        return None, (jsonify({'error': 'Un tableau JSON non vide est attendu'}), 400)
+    bulk_max = current_app.config.get('BAES_BULK_MAX', DEFAULT_BULK_MAX)
+    if len(items) > bulk_max:
+        return None, (jsonify({'error': f'Au plus {bulk_max} BAES par requête'}), 413)
+    return items, None
+
+
+@baes_bp.route('/', methods=['GET'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': 'Récupère la liste des BAES, paginée par id (en-tête Link vers la page suivante).',
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'etage_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les BAES de cet étage"
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Liste des BAES.',
+            'schema': {'type': 'array', 'items': BAES_SCHEMA}
+        },
+        400: {'description': 'Paramètres invalides.'},
+        500: {'description': 'Erreur interne.'}
+    }
+})
+def get_baes_list():
+    try:
+        limit, after = page_params()
+        etage_id = int_arg('etage_id')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = Baes.query
+        if etage_id is not None:
+            query = query.filter(Baes.etage_id == etage_id)
+        baes, next_after = keyset_page(query, Baes.id, limit, after)
+        return set_link_header(jsonify([_baes_dict(b) for b in baes]), limit, next_after), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_baes_list: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/<int:baes_id>', methods=['GET'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': 'Récupère une BAES par son ID.',
+    'parameters': [
+        {
+            'name': 'baes_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': 'ID de la BAES à récupérer'
+        }
+    ],
+    'responses': {
+        200: {'description': 'Détails de la BAES.', 'schema': BAES_SCHEMA},
+        404: {'description': 'BAES non trouvée.'}
+    }
+})
+def get_baes(baes_id):
+    try:
+        baes = Baes.query.get(baes_id)
+        if not baes:
+            return jsonify({'error': 'BAES non trouvée'}), 404
+        return jsonify(_baes_dict(baes)), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/status', methods=['GET'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "État courant des BAES (erreurs ouvertes par type, dernière erreur), lu dans la table "
+                   "baes_status sans parcourir l'historique. Paginé par id (en-tête Link vers la page suivante).",
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'etage_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les BAES de cet étage"
+        },
+        {
+            'name': 'en_defaut',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'description': "Ne retourne que les BAES ayant au moins une erreur ouverte"
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'États des BAES.',
+            'schema': {'type': 'array', 'items': BAES_STATUS_SCHEMA}
+        },
+        400: {'description': 'Paramètres invalides.'},
+        500: {'description': 'Erreur interne.'}
+    }
+})
+def get_baes_status_list():
+    try:
+        limit, after = page_params()
+        etage_id = int_arg('etage_id')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    en_defaut = request.args.get('en_defaut', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        query = Baes.query.options(defer(Baes.position))
+        if en_defaut:
+            query = query.join(BaesStatus, BaesStatus.baes_id == Baes.id).filter(BaesStatus.open_count > 0)
+        else:
+            query = query.outerjoin(BaesStatus, BaesStatus.baes_id == Baes.id)
+        query = query.options(contains_eager(Baes.status))
+        if etage_id is not None:
+            query = query.filter(Baes.etage_id == etage_id)
+        baes, next_after = keyset_page(query, Baes.id, limit, after)
+        return set_link_header(jsonify([_status_dict(b) for b in baes]), limit, next_after), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_baes_status_list: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/<int:baes_id>/status', methods=['GET'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "État courant d'une BAES, lu dans la table baes_status.",
+    'parameters': [
+        {
+            'name': 'baes_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': 'ID de la BAES'
+        }
+    ],
+    'responses': {
+        200: {'description': 'État de la BAES.', 'schema': BAES_STATUS_SCHEMA},
+        404: {'description': 'BAES non trouvée.'}
+    }
+})
+def get_baes_status(baes_id):
+    try:
+        baes = Baes.query.get(baes_id)
+        if not baes:
+            return jsonify({'error': 'BAES non trouvée'}), 404
+        return jsonify(_status_dict(baes)), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_baes_status: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/', methods=['POST'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Crée une nouvelle BAES.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string', 'example': 'BAES 1'},
+                    'position': {'type': 'object', 'example': {'lat': 48.8566, 'lng': 2.3522}},
+                    'etage_id': {'type': 'integer', 'example': 1}
+                },
+                'required': ['name', 'position', 'etage_id']
+            }
+        }
+    ],
+    'responses': {
+        201: {'description': 'BAES créée avec succès.', 'schema': BAES_SCHEMA},
+        400: {'description': 'Mauvaise requête.'},
+        404: {'description': 'Étage non trouvé.'},
+        409: {'description': 'Une BAES porte déjà ce nom.'}
+    }
+})
+def create_baes():
+    try:
+        data = request.get_json()
+        if not data or 'name' not in data or data.get('position') is None or 'etage_id' not in data:
+            return jsonify({'error': 'Les champs name, position et etage_id sont requis'}), 400
+        name_error = _name_error(data['name'])
+        if name_error:
+            return jsonify({'error': name_error}), 400
+        if not _is_id(data['etage_id']):
+            return jsonify({'error': 'Le champ etage_id doit être un entier'}), 400
+        if not Etage.query.get(data['etage_id']):
+            return jsonify({'error': 'Étage non trouvé'}), 404
+        if Baes.query.filter_by(name=data['name']).first():
+            return jsonify({'error': 'Une BAES porte déjà ce nom'}), 409
+        baes = Baes(name=data['name'], position=data['position'], etage_id=data['etage_id'])
+        db.session.add(baes)
+        db.session.commit()
+        return jsonify(_baes_dict(baes)), 201
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in create_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/<int:baes_id>', methods=['PUT'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Met à jour une BAES existante.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'baes_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "ID de la BAES à mettre à jour"
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string', 'example': 'BAES mise à jour'},
+                    'position': {'type': 'object', 'example': {'lat': 48.8566, 'lng': 2.3522}},
+                    'etage_id': {'type': 'integer', 'example': 2}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {'description': 'BAES mise à jour avec succès.', 'schema': BAES_SCHEMA},
+        400: {'description': 'Mauvaise requête.'},
+        404: {'description': 'BAES ou étage non trouvé.'},
+        409: {'description': 'Une autre BAES porte déjà ce nom.'}
+    }
+})
+def update_baes(baes_id):
+    try:
+        baes = Baes.query.get(baes_id)
+        if not baes:
+            return jsonify({'error': 'BAES non trouvée'}), 404
+        data = request.get_json() or {}
+        if 'name' in data:
+            name_error = _name_error(data['name'])
+            if name_error:
+                return jsonify({'error': name_error}), 400
+        if 'etage_id' in data and not _is_id(data['etage_id']):
+            return jsonify({'error': 'Le champ etage_id doit être un entier'}), 400
+        if 'name' in data and data['name'] != baes.name:
+            if Baes.query.filter_by(name=data['name']).first():
+                return jsonify({'error': 'Une BAES porte déjà ce nom'}), 409
+            baes.name = data['name']
+        if data.get('position') is not None:
+            baes.position = data['position']
+        if 'etage_id' in data:
+            if not Etage.query.get(data['etage_id']):
+                return jsonify({'error': 'Étage non trouvé'}), 404
+            baes.etage_id = data['etage_id']
+        db.session.commit()
+        return jsonify(_baes_dict(baes)), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in update_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/<int:baes_id>', methods=['DELETE'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Supprime une BAES par son ID, ainsi que son historique d'erreurs.",
+    'parameters': [
+        {
+            'name': 'baes_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "ID de la BAES à supprimer"
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'BAES supprimée avec succès.',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'message': {'type': 'string', 'example': 'BAES supprimée avec succès'}
+                }
+            }
+        },
+        404: {'description': 'BAES non trouvée.'}
+    }
+})
+def delete_baes(baes_id):
+    try:
+        baes = Baes.query.get(baes_id)
+        if not baes:
+            return jsonify({'error': 'BAES non trouvée'}), 404
+        BaesHeartbeat.query.filter_by(baes_id=baes_id).delete()
+        # Historique supprimé en une instruction, sans charger les erreurs une à une ;
+        # le DELETE Core échappe au listener des tombstones, qui sont donc écrites ici
+        site_id = baes.etage.batiment.site_id
+        table = HistoriqueErreur.__table__
+        erreur_ids = db.session.execute(
+            delete(table).where(table.c.baes_id == baes_id).returning(table.c.id)).scalars().all()
+        record_deleted('historique_erreur', [(erreur_id, site_id) for erreur_id in erreur_ids])
+        if baes.status is not None:
+            db.session.delete(baes.status)
+        db.session.delete(baes)
+        db.session.commit()
+        return jsonify({'message': 'BAES supprimée avec succès'}), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in delete_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/bulk', methods=['POST'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Crée des BAES en masse. Le lot est validé en une passe (noms uniques d'au plus 50 caractères, "
+                   "étages existants) puis inséré par un executemany ; en cas d'erreur, rien n'est inséré.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'name': {'type': 'string', 'example': 'BAES 1'},
+                        'position': {'type': 'object', 'example': {'lat': 48.8566, 'lng': 2.3522}},
+                        'etage_id': {'type': 'integer', 'example': 1}
+                    },
+                    'required': ['name', 'position', 'etage_id']
+                }
+            }
+        }
+    ],
+    'responses': {
+        201: {
+            'description': 'BAES créées.',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'created': {'type': 'integer', 'example': 2},
+                    'baes': {'type': 'array', 'items': BAES_SCHEMA}
+                }
+            }
+        },
+        400: {'description': "Lot invalide ; `errors` liste les éléments refusés (index et motif)."},
+        413: {'description': 'Lot trop volumineux.'}
+    }
+})
+def bulk_create_baes():
+    items, error = _bulk_payload()
+    if error:
+        return error
+    try:
+        errors = []
+        rows = []
+        seen_names = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or 'name' not in item or item.get('position') is None \
+                    or not _is_id(item.get('etage_id')):
+                errors.append({'index': index, 'error': 'Les champs name, position et etage_id sont requis'})
+                continue
+            name_error = _name_error(item['name'])
+            if name_error:
+                errors.append({'index': index, 'error': name_error})
+                continue
+            if item['name'] in seen_names:
+                errors.append({'index': index, 'error': 'Nom en double dans le lot'})
+                continue
+            seen_names.add(item['name'])
+            rows.append({'index': index, 'name': item['name'], 'position': item['position'],
+                         'etage_id': item['etage_id']})
+
+        existing = _existing_names(seen_names)
+        etage_ids = _existing_etage_ids({row['etage_id'] for row in rows})
+        for row in rows:
+            if row['name'] in existing:
+                errors.append({'index': row['index'], 'error': 'Une BAES porte déjà ce nom'})
+            elif row['etage_id'] not in etage_ids:
+                errors.append({'index': row['index'], 'error': 'Étage non trouvé'})
+        if errors:
+            errors.sort(key=lambda err: err['index'])
+            return jsonify({'error': 'Lot invalide, aucune BAES créée', 'errors': errors}), 400
+
+        now = current_time()
+        db.session.execute(insert(Baes), [
+            {'name': row['name'], 'position': row['position'], 'etage_id': row['etage_id'],
+             'created_at': now, 'updated_at': now}
+            for row in rows
+        ])
+        db.session.commit()
+
+        ids = _existing_names(seen_names)
+        created = [{'id': ids[row['name']], 'name': row['name'], 'position': row['position'],
+                    'etage_id': row['etage_id']} for row in rows]
+        return jsonify({'created': len(created), 'baes': created}), 201
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in bulk_create_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/bulk', methods=['PUT'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Met à jour des BAES en masse, identifiées par leur id. Seuls les champs fournis sont modifiés ; "
+                   "en cas d'erreur, rien n'est modifié.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'integer', 'example': 1},
+                        'name': {'type': 'string', 'example': 'BAES 1'},
+                        'position': {'type': 'object', 'example': {'lat': 48.8566, 'lng': 2.3522}},
+                        'etage_id': {'type': 'integer', 'example': 1}
+                    },
+                    'required': ['id']
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'BAES mises à jour.',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'updated': {'type': 'integer', 'example': 2}
+                }
+            }
+        },
+        400: {'description': "Lot invalide ; `errors` liste les éléments refusés (index et motif)."},
+        413: {'description': 'Lot trop volumineux.'}
+    }
+})
+def bulk_update_baes():
+    items, error = _bulk_payload()
+    if error:
+        return error
+    try:
+        errors = []
+        rows = []
+        seen_ids = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not _is_id(item.get('id')):
+                errors.append({'index': index, 'error': 'Le champ id est requis'})
+                continue
+            if item['id'] in seen_ids:
+                errors.append({'index': index, 'error': 'Id en double dans le lot'})
+                continue
+            seen_ids.add(item['id'])
+            if item.get('name') is not None and _name_error(item['name']):
+                errors.append({'index': index, 'error': _name_error(item['name'])})
+                continue
+            if item.get('etage_id') is not None and not _is_id(item['etage_id']):
+                errors.append({'index': index, 'error': 'Le champ etage_id doit être un entier'})
+                continue
+            row = {'index': index, 'id': item['id']}
+            for field in ('name', 'position', 'etage_id'):
+                if item.get(field) is not None:
+                    row[field] = item[field]
+            rows.append(row)
+
+        existing_ids = set()
+        for chunk in chunked(seen_ids):
+            existing_ids.update(baes_id for (baes_id,) in db.session.query(Baes.id).filter(Baes.id.in_(chunk)).all())
+        renamed = {row['name']: row for row in rows if 'name' in row}
+        taken = _existing_names(renamed)
+        etage_ids = _existing_etage_ids({row['etage_id'] for row in rows if 'etage_id' in row})
+        new_names = set()
+        for row in rows:
+            if row['id'] not in existing_ids:
+                errors.append({'index': row['index'], 'error': 'BAES non trouvée'})
+            elif 'name' in row and (taken.get(row['name'], row['id']) != row['id'] or row['name'] in new_names):
+                errors.append({'index': row['index'], 'error': 'Une BAES porte déjà ce nom'})
+            elif 'etage_id' in row and row['etage_id'] not in etage_ids:
+                errors.append({'index': row['index'], 'error': 'Étage non trouvé'})
+            if 'name' in row:
+                new_names.add(row['name'])
+        if errors:
+            errors.sort(key=lambda err: err['index'])
+            return jsonify({'error': 'Lot invalide, aucune BAES modifiée', 'errors': errors}), 400
+
+        now = current_time()
+        params = []
+        for row in rows:
+            row.pop('index')
+            row['updated_at'] = now
+            params.append(row)
+        # L'UPDATE Core contourne before_flush : les changements de site sont tracés ici
+        record_baes_moves({row['id']: row['etage_id'] for row in params if 'etage_id' in row})
+        # UPDATE par clé primaire exécuté en executemany (regroupé par jeu de colonnes)
+        db.session.execute(update(Baes), params)
+        db.session.commit()
+        return jsonify({'updated': len(params)}), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in bulk_update_baes: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@baes_bp.route('/heartbeat', methods=['POST'])
+@swag_from({
+    'tags': ['BAES CRUD'],
+    'description': "Battements de cœur envoyés par les passerelles pour un lot de BAES. "
+                   "Seule une table en mémoire est mise à jour ; elle est recopiée en base toutes les "
+                   "BAES_HEARTBEAT_INTERVAL secondes par requêtes ensemblistes. Une BAES muette depuis plus de "
+                   "BAES_HEARTBEAT_TIMEOUT secondes reçoit une erreur_connexion, résolue à la reprise des battements.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {'type': 'array', 'items': {'type': 'integer'}, 'example': [12, 13, 14]}
+        }
+    ],
+    'responses': {
+        200: {
+            'description': "Battements enregistrés (les ids inconnus sont listés).",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'accepted': {'type': 'integer', 'example': 3},
+                    'rejected': {'type': 'array', 'items': {'type': 'integer'}, 'example': []}
+                }
+            }
+        },
+        400: {'description': "Un tableau JSON non vide d'ids de BAES est attendu."},
+        413: {'description': 'Lot trop volumineux.'}
+    }
+})
+def baes_heartbeat():
+    baes_ids, error = _bulk_payload()
+    if error:
+        return error
+    if not all(_is_id(baes_id) for baes_id in baes_ids):
+        return jsonify({'error': "Un tableau JSON d'ids de BAES est attendu"}), 400
+    try:
+        accepted, rejected = get_heartbeat_monitor().beat(baes_ids)
+        return jsonify({'accepted': accepted, 'rejected': rejected}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in baes_heartbeat: {e}")
+        return jsonify({'error': str(e)}), 500
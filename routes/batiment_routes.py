@@ -3,6 +3,9 @@ from flask import Blueprint, request, jsonify, current_app
 from flasgger import swag_from
 from models.batiment import Batiment
 from models import db
+from services.conditional import conditional_response, page_etag
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, int_arg, keyset_page, page_params,
+                                 set_link_header)
 
 
 batiment_bp = Blueprint('batiment_bp', __name__)
@@ -10,7 +13,16 @@ batiment_bp = Blueprint('batiment_bp', __name__)
 @batiment_bp.route('/', methods=['GET'])
 @swag_from({
     'tags': ['Batiment CRUD'],
-    'description': 'Récupère la liste de tous les bâtiments.',
+    'description': 'Récupère la liste des bâtiments, paginée par id (en-tête Link vers la page suivante).',
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'site_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les bâtiments de ce site"
+        }
+    ],
     'responses': {
         200: {
             'description': 'Liste des bâtiments.',
@@ -32,14 +44,27 @@ batiment_bp = Blueprint('batiment_bp', __name__)
 })
 def get_batiments():
     try:
-        batiments = Batiment.query.all()
-        result = [{
-            'id': b.id,
-            'name': b.name,
-            'polygon_points': b.polygon_points,
-            'site_id': b.site_id
-        } for b in batiments]
-        return jsonify(result), 200
+        limit, after = page_params()
+        site_id = int_arg('site_id')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = Batiment.query
+        if site_id is not None:
+            query = query.filter(Batiment.site_id == site_id)
+        etag = page_etag(query, Batiment, limit, after)
+
+        def build():
+            batiments, next_after = keyset_page(query, Batiment.id, limit, after)
+            result = [{
+                'id': b.id,
+                'name': b.name,
+                'polygon_points': b.polygon_points,
+                'site_id': b.site_id
+            } for b in batiments]
+            return set_link_header(jsonify(result), limit, next_after), 200
+
+        return conditional_response(etag, build)
     except Exception as e:
         current_app.logger.error(f"Error in get_batiments: {e}")
         return jsonify({'error': str(e)}), 500
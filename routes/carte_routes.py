@@ -1,22 +1,164 @@
 # routes/carte_routes.py
 
+import mimetypes
 import os
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from werkzeug.utils import secure_filename
+
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, send_from_directory
 from flasgger import swag_from
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from models.carte import Carte
 from models import db
+from services.carte_images import IMAGE_SIZES, carte_image_path, enqueue_derivatives
+from services.carte_storage import content_digest, resolve_path, store_root, store_stream
+from services.carte_tiles import TilesUnavailable, carte_tile_path, tile_pyramid
+from services.carte_upload import read_streaming_upload
+from services.conditional import compute_etag, conditional_response
 
 carte_bp = Blueprint('carte_bp', __name__)
 
+DEFAULT_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+
+# Un fichier rangé sous son empreinte ne change jamais : il peut rester en cache un an
+CONTENT_MAX_AGE = 365 * 24 * 3600
+# Original envoyé à la place d'une taille réduite indisponible : cache court, la taille sera prête ensuite
+FALLBACK_MAX_AGE = 60
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
+
+def _send_stored(path, carte, variant=None, fallback=False):
+    """
+    Envoie un fichier du magasin sans recopier ses octets dans Python.
+
+    Un fichier rangé sous son empreinte reçoit un ETag fort tiré du condensat (suffixé par la
+    variante : taille réduite, tuile) et un Cache-Control immutable d'un an. Un original envoyé
+    en repli d'une taille réduite (`fallback`) garde l'ETag de l'original et n'est mis en cache
+    que FALLBACK_MAX_AGE secondes, sans immutable : l'URL servira la taille réduite ensuite. Avec
+    CARTES_X_ACCEL_REDIRECT, la réponse ne porte qu'un en-tête X-Accel-Redirect et nginx envoie
+    le fichier ; sinon send_file gère Range et If-Range, et délègue l'envoi au serveur
+    (X-Sendfile si USE_X_SENDFILE, sinon wsgi.file_wrapper / sendfile).
+    """
+    digest = content_digest(carte.chemin)
+    if fallback:
+        variant = None
+    etag = (f"{digest}-{variant}" if variant else digest) if digest else True
+    max_age = (FALLBACK_MAX_AGE if fallback else CONTENT_MAX_AGE) if digest else 0
+
+    accel_prefix = current_app.config.get('CARTES_X_ACCEL_REDIRECT')
+    root = os.path.abspath(store_root())
+    if accel_prefix and digest and os.path.abspath(path).startswith(root + os.sep):
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + \
+            os.path.relpath(path, root).replace(os.sep, '/')
+        response.set_etag(etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Accel-Redirect', None)
+    else:
+        try:
+            response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+        except RequestedRangeNotSatisfiable as e:
+            # Réponse 416 (avec Content-Range: bytes */taille) plutôt qu'une erreur interne
+            return e.get_response()
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if digest:
+        if not fallback:
+            response.cache_control.immutable = True
+    else:
+        # Ancien chemin : le fichier a pu être remplacé sous le même nom, le client revalide
+        response.cache_control.no_cache = True
+    return response
+
+
+def _carte_params(form):
+    """Valide les paramètres d'une carte envoyés avec le fichier ; retourne (paramètres, réponse d'erreur)."""
+    # Récupérer les paramètres de configuration de la carte
+    try:
+        center_lat = float(form.get('center_lat', 0.0))
+        center_lng = float(form.get('center_lng', 0.0))
+        zoom = float(form.get('zoom', 1.0))
+    except ValueError:
+        return None, (jsonify({'error': 'Paramètres invalides pour la configuration de la carte'}), 400)
+
+    # Récupérer les paramètres d'association
+    site_id = form.get('site_id')
+    etage_id = form.get('etage_id')
+
+    # Convertir en int s'ils sont renseignés
+    try:
+        site_id = int(site_id) if site_id is not None and site_id != '' else None
+        etage_id = int(etage_id) if etage_id is not None and etage_id != '' else None
+    except ValueError:
+        return None, (jsonify({'error': 'site_id et etage_id doivent être des entiers'}), 400)
+
+    # Vérifier que exactement l'un des deux est renseigné.
+    if (site_id is None and etage_id is None) or (site_id is not None and etage_id is not None):
+        return None, (jsonify({'error': 'Vous devez fournir soit site_id, soit etage_id (mais pas les deux)'}), 400)
+
+    return {'center_lat': center_lat, 'center_lng': center_lng, 'zoom': zoom,
+            'site_id': site_id, 'etage_id': etage_id}, None
+
+
+def _receive_buffered():
+    """Envoi classique : Werkzeug a déjà lu le corps ; retourne (paramètres, chemin, réponse d'erreur)."""
+    # Vérifier la présence du fichier dans la requête
+    if 'file' not in request.files:
+        return None, None, (jsonify({'error': 'Aucun fichier fourni'}), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return None, None, (jsonify({'error': 'Nom de fichier vide'}), 400)
+
+    if not file or not allowed_file(file.filename):
+        return None, None, (jsonify({'error': 'Extension de fichier non autorisée'}), 400)
+
+    params, error = _carte_params(request.form)
+    if error:
+        return None, None, error
+
+    # Le fichier est rangé sous son empreinte SHA-256 : deux plans identiques partagent un fichier
+    # et deux plans différents de même nom ne s'écrasent plus
+    return params, store_stream(file.stream, file.filename.rsplit('.', 1)[1]), None
+
+
+def _receive_streamed():
+    """
+    Envoi en flux : le corps multipart est décodé au fil de la lecture et le fichier écrit par blocs
+    dans le magasin, sans passer par request.files ; retourne (paramètres, chemin, réponse d'erreur).
+    """
+    # Limite propre à cette route, au-delà de MAX_CONTENT_LENGTH : la mémoire ne dépend pas de la taille
+    request.max_content_length = current_app.config.get('CARTES_UPLOAD_MAX_SIZE', DEFAULT_UPLOAD_MAX_SIZE)
+    try:
+        form, filename, writer = read_streaming_upload(request.stream, request.content_type or '')
+    except ValueError as e:
+        return None, None, (jsonify({'error': str(e)}), 400)
+
+    error = None
+    if not filename:
+        error = (jsonify({'error': 'Nom de fichier vide'}), 400)
+    elif not allowed_file(filename):
+        error = (jsonify({'error': 'Extension de fichier non autorisée'}), 400)
+    elif writer.image_type is None:
+        error = (jsonify({'error': "Le contenu du fichier n'est pas une image reconnue"}), 400)
+    else:
+        params, error = _carte_params(form)
+    if error:
+        writer.abort()
+        return None, None, error
+    return params, writer.commit(writer.image_type), None
+
+
 @carte_bp.route('/upload-carte', methods=['POST'])
 @swag_from({
     'tags': ['Carte CRUD'],
     'description': "Upload d'une carte avec ses paramètres (centre, zoom) et son association à un site ou un étage. "
-                   "Vous devez fournir l'ID du site (`site_id`) ou l'ID de l'étage (`etage_id`), mais pas les deux ni aucun.",
+                   "Vous devez fournir l'ID du site (`site_id`) ou l'ID de l'étage (`etage_id`), mais pas les deux ni aucun. "
+                   "Le fichier est stocké sous son empreinte SHA-256 (`chemin` = adresse de contenu) ; "
+                   "un plan déjà envoyé n'est pas stocké une seconde fois. "
+                   "En mode flux (CARTES_UPLOAD_STREAMING), le corps est décodé et écrit par blocs au fil de la "
+                   "réception, jusqu'à CARTES_UPLOAD_MAX_SIZE octets, et le contenu doit être une image png ou jpg.",
     'consumes': ['multipart/form-data'],
     'parameters': [
         {
@@ -76,7 +218,7 @@ def allowed_file(filename):
                         'type': 'object',
                         'properties': {
                             'id': {'type': 'integer', 'example': 1},
-                            'chemin': {'type': 'string', 'example': '/path/to/image.png'},
+                            'chemin': {'type': 'string', 'example': '9f/86/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08.png'},
                             'center_lat': {'type': 'number', 'example': 48.8566},
                             'center_lng': {'type': 'number', 'example': 2.3522},
                             'zoom': {'type': 'number', 'example': 1.0},
@@ -91,59 +233,29 @@ def allowed_file(filename):
     }
 })
 def upload_carte():
-    # Vérifier la présence du fichier dans la requête
-    if 'file' not in request.files:
-        return jsonify({'error': 'Aucun fichier fourni'}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'Nom de fichier vide'}), 400
-
-    if not file or not allowed_file(file.filename):
-        return jsonify({'error': 'Extension de fichier non autorisée'}), 400
-
-    filename = secure_filename(file.filename)
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    file_path = os.path.join(upload_folder, filename)
-    file.save(file_path)
-
-    # Récupérer les paramètres de configuration de la carte depuis request.form
-    try:
-        center_lat = float(request.form.get('center_lat', 0.0))
-        center_lng = float(request.form.get('center_lng', 0.0))
-        zoom = float(request.form.get('zoom', 1.0))
-    except ValueError:
-        return jsonify({'error': 'Paramètres invalides pour la configuration de la carte'}), 400
-
-    # Récupérer les paramètres d'association
-    site_id = request.form.get('site_id')
-    etage_id = request.form.get('etage_id')
-
-    # Convertir en int s'ils sont renseignés
-    site_id = int(site_id) if site_id is not None and site_id != '' else None
-    etage_id = int(etage_id) if etage_id is not None and etage_id != '' else None
-
-    # Vérifier que exactement l'un des deux est renseigné.
-    if (site_id is None and etage_id is None) or (site_id is not None and etage_id is not None):
-        return jsonify({'error': 'Vous devez fournir soit site_id, soit etage_id (mais pas les deux)'}), 400
+    if current_app.config.get('CARTES_UPLOAD_STREAMING', False):
+        params, file_path, error = _receive_streamed()
+    else:
+        params, file_path, error = _receive_buffered()
+    if error:
+        return error
 
     # Créer l'objet Carte en renseignant la bonne association
-    carte = Carte(
-        chemin=file_path,
-        center_lat=center_lat,
-        center_lng=center_lng,
-        zoom=zoom,
-        site_id=site_id,
-        etage_id=etage_id
-    )
+    carte = Carte(chemin=file_path, **params)
     try:
         db.session.add(carte)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
+        # Le contenu éventuellement orphelin est laissé au balayage (flask cartes-store sweep)
         return jsonify({'error': f'Erreur lors de la sauvegarde de la carte: {str(e)}'}), 500
 
+    # Les images réduites sont préparées en arrière-plan pour le premier affichage
+    try:
+        enqueue_derivatives(file_path)
+    except Exception as e:
+        current_app.logger.error(f"Error in upload_carte (images réduites): {e}")
+
     return jsonify({
         'message': 'Fichier uploadé avec succès',
         'carte': {
@@ -191,16 +303,249 @@ def upload_carte():
     }
 })
 def get_carte_by_id(idCarte):
-    carte = Carte.query.get(idCarte)
-    if carte is None:
-        return jsonify({'error': 'Carte non trouvée'}), 404
+    etag = compute_etag([(Carte, Carte.query.filter_by(id=idCarte))])
 
-    return jsonify({
-        'id': carte.id,
-        'chemin': carte.chemin,
-        'center_lat': carte.center_lat,
-        'center_lng': carte.center_lng,
-        'zoom': carte.zoom,
-        'site_id': carte.site_id,
-        'etage_id': carte.etage_id
-    }), 200
+    def build():
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+
+        return jsonify({
+            'id': carte.id,
+            'chemin': carte.chemin,
+            'center_lat': carte.center_lat,
+            'center_lng': carte.center_lng,
+            'zoom': carte.zoom,
+            'site_id': carte.site_id,
+            'etage_id': carte.etage_id
+        }), 200
+
+    return conditional_response(etag, build)
+
+
+@carte_bp.route('/<int:idCarte>', methods=['DELETE'])
+@swag_from({
+    'tags': ['Carte CRUD'],
+    'description': "Supprime une carte. Le fichier n'est pas supprimé immédiatement : le balayage périodique "
+                   "(flask cartes-store sweep) le retire du stockage une fois qu'aucune carte ne référence "
+                   "plus ce contenu depuis le délai de grâce (CARTES_SWEEP_GRACE).",
+    'parameters': [
+        {
+            'name': 'idCarte',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "Identifiant de la carte à supprimer."
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': "Carte supprimée avec succès.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'message': {'type': 'string', 'example': 'Carte supprimée avec succès'}
+                }
+            }
+        },
+        '404': {
+            'description': "Carte non trouvée."
+        }
+    }
+})
+def delete_carte(idCarte):
+    try:
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+        db.session.delete(carte)
+        db.session.commit()
+        # Le fichier, partagé par toutes les cartes de même contenu, est supprimé par le balayage
+        # (flask cartes-store sweep) une fois sans référence depuis CARTES_SWEEP_GRACE secondes
+        return jsonify({'message': 'Carte supprimée avec succès'}), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in delete_carte: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@carte_bp.route('/<int:idCarte>/image', methods=['GET'])
+@swag_from({
+    'tags': ['Carte CRUD'],
+    'description': "Renvoie l'image de la carte à la taille demandée : `thumb` (300 px), `medium` (1600 px) "
+                   "ou `full` (fichier d'origine). Les tailles réduites sont générées en arrière-plan à l'upload "
+                   "et gardées en cache disque ; une taille manquante est régénérée à la demande.",
+    'parameters': [
+        {
+            'name': 'idCarte',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "Identifiant de la carte."
+        },
+        {
+            'name': 'size',
+            'in': 'query',
+            'type': 'string',
+            'enum': list(IMAGE_SIZES),
+            'default': 'full',
+            'required': False,
+            'description': "Taille de l'image."
+        }
+    ],
+    'produces': ['image/png', 'image/jpeg'],
+    'responses': {
+        '200': {'description': "Image de la carte (l'original, en cache court, si la taille réduite n'est pas encore prête)."},
+        '400': {'description': "Taille inconnue."},
+        '404': {'description': "Carte ou fichier non trouvé."}
+    }
+})
+def get_carte_image(idCarte):
+    size = request.args.get('size', 'full')
+    if size not in IMAGE_SIZES:
+        return jsonify({'error': f"size doit valoir : {', '.join(IMAGE_SIZES)}"}), 400
+    try:
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+        try:
+            path, fallback = carte_image_path(carte.chemin, size)
+        except FileNotFoundError:
+            return jsonify({'error': 'Fichier de la carte introuvable'}), 404
+        return _send_stored(path, carte, None if size == 'full' else size, fallback)
+    except Exception as e:
+        current_app.logger.error(f"Error in get_carte_image: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@carte_bp.route('/<int:idCarte>/tiles', methods=['GET'])
+@swag_from({
+    'tags': ['Carte CRUD'],
+    'description': "Décrit la pyramide de tuiles de la carte (dimensions, taille des tuiles, niveau maximal) "
+                   "et le modèle d'URL des tuiles, pour un affichage progressif dans une visionneuse.",
+    'parameters': [
+        {
+            'name': 'idCarte',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "Identifiant de la carte."
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': "Pyramide de tuiles de la carte.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'width': {'type': 'integer', 'example': 12000},
+                    'height': {'type': 'integer', 'example': 8000},
+                    'tile_size': {'type': 'integer', 'example': 256},
+                    'max_zoom': {'type': 'integer', 'example': 6},
+                    'format': {'type': 'string', 'example': 'jpg'},
+                    'zoom': {'type': 'number', 'example': 1.0},
+                    'url': {'type': 'string', 'example': '/cartes/1/tiles/{z}/{x}/{y}'}
+                }
+            }
+        },
+        '404': {'description': "Carte ou fichier non trouvé."},
+        '503': {'description': "Tuiles indisponibles pour cette image."}
+    }
+})
+def get_carte_tiles(idCarte):
+    try:
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+        try:
+            pyramid = tile_pyramid(carte.chemin)
+        except FileNotFoundError:
+            return jsonify({'error': 'Fichier de la carte introuvable'}), 404
+        except TilesUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        pyramid['zoom'] = carte.zoom
+        pyramid['url'] = f"{request.script_root}/cartes/{carte.id}/tiles/{{z}}/{{x}}/{{y}}"
+        return jsonify(pyramid), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_carte_tiles: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@carte_bp.route('/<int:idCarte>/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@swag_from({
+    'tags': ['Carte CRUD'],
+    'description': "Renvoie la tuile z/x/y (256 px) de la carte. Le niveau est découpé à la première demande "
+                   "d'une de ses tuiles puis gardé en cache disque.",
+    'parameters': [
+        {'name': 'idCarte', 'in': 'path', 'type': 'integer', 'required': True, 'description': "Identifiant de la carte."},
+        {'name': 'z', 'in': 'path', 'type': 'integer', 'required': True, 'description': "Niveau (0 à max_zoom)."},
+        {'name': 'x', 'in': 'path', 'type': 'integer', 'required': True, 'description': "Colonne."},
+        {'name': 'y', 'in': 'path', 'type': 'integer', 'required': True, 'description': "Ligne."}
+    ],
+    'produces': ['image/png', 'image/jpeg'],
+    'responses': {
+        '200': {'description': "Tuile."},
+        '404': {'description': "Carte non trouvée ou tuile hors de la pyramide."},
+        '503': {'description': "Tuiles indisponibles, ou découpe encore en cours (réessayer après Retry-After)."}
+    }
+})
+def get_carte_tile(idCarte, z, x, y):
+    try:
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+        try:
+            path = carte_tile_path(carte.chemin, z, x, y)
+        except FileNotFoundError:
+            return jsonify({'error': 'Fichier de la carte introuvable'}), 404
+        except TilesUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        except TimeoutError:
+            response = jsonify({'error': 'Découpe de la carte en cours'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        if path is None:
+            return jsonify({'error': 'Tuile hors de la carte'}), 404
+        return _send_stored(path, carte, f"{z}-{x}-{y}")
+    except Exception as e:
+        current_app.logger.error(f"Error in get_carte_tile: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@carte_bp.route('/<int:idCarte>/file', methods=['GET'])
+@swag_from({
+    'tags': ['Carte CRUD'],
+    'description': "Renvoie le fichier d'origine de la carte. ETag fort tiré de l'empreinte SHA-256 du contenu, "
+                   "requêtes conditionnelles (If-None-Match, If-Range) et partielles (Range) prises en charge, "
+                   "Cache-Control immutable pour les fichiers rangés sous leur empreinte. L'envoi est délégué au "
+                   "serveur frontal : X-Accel-Redirect (CARTES_X_ACCEL_REDIRECT) ou X-Sendfile (USE_X_SENDFILE).",
+    'parameters': [
+        {
+            'name': 'idCarte',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "Identifiant de la carte."
+        }
+    ],
+    'produces': ['image/png', 'image/jpeg'],
+    'responses': {
+        '200': {'description': "Fichier de la carte."},
+        '206': {'description': "Partie du fichier demandée par Range."},
+        '304': {'description': "Le client possède déjà cette version."},
+        '404': {'description': "Carte ou fichier non trouvé."},
+        '416': {'description': "Plage demandée hors du fichier."}
+    }
+})
+def get_carte_file(idCarte):
+    try:
+        carte = Carte.query.get(idCarte)
+        if carte is None:
+            return jsonify({'error': 'Carte non trouvée'}), 404
+        path = resolve_path(carte.chemin)
+        if not os.path.isfile(path):
+            return jsonify({'error': 'Fichier de la carte introuvable'}), 404
+        return _send_stored(path, carte)
+    except Exception as e:
+        current_app.logger.error(f"Error in get_carte_file: {e}")
+        return jsonify({'error': str(e)}), 500
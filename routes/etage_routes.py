@@ -3,13 +3,25 @@ from flask import Blueprint, request, jsonify, current_app
 from flasgger import swag_from
 from models.etage import Etage
 from models import db
+from services.conditional import conditional_response, page_etag
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, int_arg, keyset_page, page_params,
+                                 set_link_header)
 
 etage_bp = Blueprint('etage_bp', __name__)
 
 @etage_bp.route('/', methods=['GET'])
 @swag_from({
     'tags': ['Etage CRUD'],
-    'description': 'Récupère la liste de tous les étages.',
+    'description': 'Récupère la liste des étages, paginée par id (en-tête Link vers la page suivante).',
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'batiment_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les étages de ce bâtiment"
+        }
+    ],
     'responses': {
         200: {
             'description': 'Liste des étages.',
@@ -30,9 +42,22 @@ etage_bp = Blueprint('etage_bp', __name__)
 })
 def get_etages():
     try:
-        etages = Etage.query.all()
-        result = [{'id': e.id, 'name': e.name, 'batiment_id': e.batiment_id} for e in etages]
-        return jsonify(result), 200
+        limit, after = page_params()
+        batiment_id = int_arg('batiment_id')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = Etage.query
+        if batiment_id is not None:
+            query = query.filter(Etage.batiment_id == batiment_id)
+        etag = page_etag(query, Etage, limit, after)
+
+        def build():
+            etages, next_after = keyset_page(query, Etage.id, limit, after)
+            result = [{'id': e.id, 'name': e.name, 'batiment_id': e.batiment_id} for e in etages]
+            return set_link_header(jsonify(result), limit, next_after), 200
+
+        return conditional_response(etag, build)
     except Exception as e:
         current_app.logger.error(f"Error in get_etages: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flasgger import swag_from
 from models.user import User
 from models.site import Site
@@ -6,56 +6,157 @@ from models.batiment import Batiment
 from models.etage import Etage
 from models.baes import Baes
 from models.historique_erreur import HistoriqueErreur
+from services.baes_status import status_to_dict
+from services.changes import DEFAULT_OVERLAP_SECONDS, DEFAULT_TOMBSTONE_DAYS, collect_changes, cursor_expired
+from services.conditional import compute_etag, conditional_response
+from services.hierarchy import (FULL_PROJECTION, LEVELS, PROJECTABLE_FIELDS, Projection,
+                                get_user_site_ids, hierarchy_etag_scopes, load_site_hierarchy,
+                                site_validators)
+from services.hierarchy_cache import get_hierarchy_cache
 
 general_routes_bp = Blueprint('general_routes_bp', __name__)
 
-def historique_erreur_to_dict(err: HistoriqueErreur) -> dict:
-    return {
+# Les sérialiseurs acceptent une hiérarchie préchargée (services.hierarchy.SiteHierarchy),
+# dont ils respectent la projection (profondeur et champs).
+# Sans elle, ils retombent sur les relations paresseuses des modèles et renvoient tout.
+
+def _projection(hierarchy) -> Projection:
+    return hierarchy.projection if hierarchy is not None else FULL_PROJECTION
+
+def _project(data: dict, projection: Projection) -> dict:
+    return {key: value for key, value in data.items() if key == 'id' or projection.wants(key)}
+
+def historique_erreur_to_dict(err: HistoriqueErreur, hierarchy=None) -> dict:
+    return _project({
         'id': err.id,
         'type_erreur': err.type_erreur,
         'timestamp': err.timestamp.isoformat(),
-    }
+        'occurrences': err.occurrences,
+        'last_seen': err.last_seen.isoformat() if err.last_seen else None,
+    }, _projection(hierarchy))
 
-def baes_to_dict(b: Baes) -> dict:
-    return {
-        'id': b.id,
-        'name': b.name,
-        'position': b.position,
-        'erreurs': [historique_erreur_to_dict(e) for e in b.erreurs] if b.erreurs else [],
-    }
+def _baes_fields(b: Baes, hierarchy) -> dict:
+    projection = _projection(hierarchy)
+    data = {'id': b.id, 'name': b.name}
+    if projection.wants('position'):
+        data['position'] = b.position
+    if projection.wants('status'):
+        # État courant lu dans baes_status (O(1) par BAES, quel que soit l'historique)
+        data['status'] = status_to_dict(hierarchy.status_of(b) if hierarchy is not None else b.status)
+    return _project(data, projection)
+
+def baes_to_dict(b: Baes, hierarchy=None) -> dict:
+    data = _baes_fields(b, hierarchy)
+    if _projection(hierarchy).includes('erreurs'):
+        erreurs = hierarchy.erreurs_of(b) if hierarchy is not None else b.erreurs
+        data['erreurs'] = [historique_erreur_to_dict(e, hierarchy) for e in erreurs] if erreurs else []
+    return data
 
-def etage_to_dict(e: Etage) -> dict:
-    return {
-        'id': e.id,
-        'name': e.name,
-        'baes': [baes_to_dict(b) for b in e.baes] if e.baes else [],
+def _etage_fields(e: Etage, hierarchy) -> dict:
+    projection = _projection(hierarchy)
+    data = _project({'id': e.id, 'name': e.name}, projection)
+    if projection.wants('carte'):
+        carte = hierarchy.carte_of_etage(e) if hierarchy is not None else e.carte
         # Retourne uniquement l'id de la carte de l'étage, s'il existe
-        'carte': {'id': e.carte.id} if e.carte else None,
-    }
+        data['carte'] = {'id': carte.id} if carte else None
+    return data
 
-def batiment_to_dict(bat: Batiment) -> dict:
-    return {
-        'id': bat.id,
-        'name': bat.name,
-        'polygon_points': bat.polygon_points,
-        'etages': [etage_to_dict(e) for e in bat.etages] if bat.etages else [],
-    }
+def etage_to_dict(e: Etage, hierarchy=None) -> dict:
+    data = _etage_fields(e, hierarchy)
+    if _projection(hierarchy).includes('baes'):
+        baes = hierarchy.baes_of(e) if hierarchy is not None else e.baes
+        data['baes'] = [baes_to_dict(b, hierarchy) for b in baes] if baes else []
+    return data
+
+def _batiment_fields(bat: Batiment, hierarchy) -> dict:
+    projection = _projection(hierarchy)
+    data = {'id': bat.id, 'name': bat.name}
+    if projection.wants('polygon_points'):
+        data['polygon_points'] = bat.polygon_points
+    return _project(data, projection)
 
-def site_to_dict(s: Site) -> dict:
-    return {
-        'id': s.id,
-        'name': s.name,
-        'batiments': [batiment_to_dict(bat) for bat in s.batiments] if s.batiments else [],
+def batiment_to_dict(bat: Batiment, hierarchy=None) -> dict:
+    data = _batiment_fields(bat, hierarchy)
+    if _projection(hierarchy).includes('etage'):
+        etages = hierarchy.etages_of(bat) if hierarchy is not None else bat.etages
+        data['etages'] = [etage_to_dict(e, hierarchy) for e in etages] if etages else []
+    return data
+
+def _site_fields(s: Site, hierarchy) -> dict:
+    projection = _projection(hierarchy)
+    data = _project({'id': s.id, 'name': s.name}, projection)
+    if projection.wants('carte'):
+        carte = hierarchy.carte_of_site(s) if hierarchy is not None else s.carte
         # Retourne uniquement l'id de la carte du site, s'il existe
-        'carte': {'id': s.carte.id} if s.carte else None,
-    }
+        data['carte'] = {'id': carte.id} if carte else None
+    return data
+
+def site_to_dict(s: Site, hierarchy=None) -> dict:
+    data = _site_fields(s, hierarchy)
+    if _projection(hierarchy).includes('batiment'):
+        batiments = hierarchy.batiments_of(s) if hierarchy is not None else s.batiments
+        data['batiments'] = [batiment_to_dict(bat, hierarchy) for bat in batiments] if batiments else []
+    return data
+
+_CHILDREN_MARKER = '\x00children\x00'
+
+def _split_around_children(data: dict, key: str):
+    """Encode un nœud sans ses enfants : retourne le JSON avant et après la liste `key`."""
+    dumps = current_app.json.dumps
+    data[key] = _CHILDREN_MARKER
+    head, tail = dumps(data).split(dumps(_CHILDREN_MARKER), 1)
+    return head + '[', ']' + tail
+
+def _iter_site_json(s: Site, hierarchy):
+    """
+    Encode un site en JSON par morceaux, avec le même schéma que site_to_dict.
+
+    Les clés sont émises triées comme le fait jsonify ; chaque morceau produit
+    contient un BAES complet (avec ses erreurs) précédé de l'encadrement accumulé.
+    """
+    dumps = current_app.json.dumps
+    if not hierarchy.projection.includes('baes'):
+        # Sans BAES, un site est assez petit pour être encodé d'un bloc
+        yield dumps(site_to_dict(s, hierarchy))
+        return
+
+    pending, site_tail = _split_around_children(_site_fields(s, hierarchy), 'batiments')
+    for i, bat in enumerate(hierarchy.batiments_of(s)):
+        head, bat_tail = _split_around_children(_batiment_fields(bat, hierarchy), 'etages')
+        pending += (', ' if i else '') + head
+        for j, e in enumerate(hierarchy.etages_of(bat)):
+            head, etage_tail = _split_around_children(_etage_fields(e, hierarchy), 'baes')
+            pending += (', ' if j else '') + head
+            for k, b in enumerate(hierarchy.baes_of(e)):
+                yield pending + (', ' if k else '') + dumps(baes_to_dict(b, hierarchy))
+                pending = ''
+            pending += etage_tail
+        pending += bat_tail
+    yield pending + site_tail
+
+def _stream_sites(site_ids, projection):
+    """Génère la réponse {"sites": [...]} en chargeant un seul site à la fois."""
+    yield '{"sites": ['
+    first = True
+    for site_id in site_ids:
+        hierarchy = load_site_hierarchy([site_id], projection)
+        for site in hierarchy.sites:
+            if not first:
+                yield ', '
+            first = False
+            yield from _iter_site_json(site, hierarchy)
+        # La session ne garde que des références faibles : le site est libéré ici
+        del hierarchy
+    yield ']}'
 
 @swag_from({
     'tags': ['general'],
     'description': "Retourne pour un utilisateur donné l'ensemble des sites auxquels il a accès, "
                    "ainsi que pour chaque site, la liste de ses bâtiments, pour chaque bâtiment, la liste de ses étages, "
                    "pour chaque étage, la liste de ses BAES et, pour chaque BAES, l'historique de ses erreurs. "
-                   "Pour les cartes, seule l'id est retournée.",
+                   "Pour les cartes, seule l'id est retournée. "
+                   "`depth` arrête l'arbre à un niveau donné et `fields` restreint les champs renvoyés ; "
+                   "les tables non demandées ne sont pas interrogées.",
     'parameters': [
         {
             'name': 'user_id',
@@ -63,6 +164,56 @@ def site_to_dict(s: Site) -> dict:
             'type': 'integer',
             'required': True,
             'description': "L'ID de l'utilisateur"
+        },
+        {
+            'name': 'stream',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'default': False,
+            'description': "Si vrai, la réponse est envoyée en JSON chunké, site par site et BAES par BAES, "
+                           "sans construire l'arbre complet en mémoire."
+        },
+        {
+            'name': 'depth',
+            'in': 'query',
+            'type': 'string',
+            'enum': list(LEVELS),
+            'required': False,
+            'default': 'erreurs',
+            'description': "Niveau le plus profond renvoyé (site, batiment, etage, baes ou erreurs)"
+        },
+        {
+            'name': 'fields',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Liste de champs séparés par des virgules, parmi : "
+                           + ', '.join(sorted(PROJECTABLE_FIELDS)) + ". L'id est toujours renvoyé."
+        },
+        {
+            'name': 'erreurs',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['all', 'open'],
+            'required': False,
+            'default': 'all',
+            'description': "'open' ne renvoie que les erreurs ni résolues ni ignorées"
+        },
+        {
+            'name': 'erreurs_limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Nombre maximal d'erreurs par BAES (les plus récentes)"
+        },
+        {
+            'name': 'erreurs_since',
+            'in': 'query',
+            'type': 'string',
+            'format': 'date-time',
+            'required': False,
+            'description': "Ne renvoie que les erreurs postérieures à cette date (ISO 8601)"
         }
     ],
     'responses': {
@@ -101,6 +252,15 @@ def site_to_dict(s: Site) -> dict:
                                                                     'id': {'type': 'integer', 'example': 1},
                                                                     'name': {'type': 'string', 'example': "BAES 1"},
                                                                     'position': {'type': 'object'},
+                                                                    'status': {
+                                                                        'type': 'object',
+                                                                        'properties': {
+                                                                            'open_count': {'type': 'integer', 'example': 1},
+                                                                            'open_types': {'type': 'object', 'example': {'erreur_batterie': 1}},
+                                                                            'error_count': {'type': 'integer', 'example': 12},
+                                                                            'last_error_at': {'type': 'string', 'example': "2025-04-03T12:40:12Z"}
+                                                                        }
+                                                                    },
                                                                     'erreurs': {
                                                                         'type': 'array',
                                                                         'items': {
@@ -108,7 +268,9 @@ def site_to_dict(s: Site) -> dict:
                                                                             'properties': {
                                                                                 'id': {'type': 'integer', 'example': 1},
                                                                                 'type_erreur': {'type': 'string', 'example': "erreur_connexion"},
-                                                                                'timestamp': {'type': 'string', 'example': "2025-04-03T12:34:56Z"}
+                                                                                'timestamp': {'type': 'string', 'example': "2025-04-03T12:34:56Z"},
+                                                                                'occurrences': {'type': 'integer', 'example': 1},
+                                                                                'last_seen': {'type': 'string', 'example': "2025-04-03T12:40:12Z"}
                                                                             }
                                                                         }
                                                                     }
@@ -155,14 +317,129 @@ def get_all_user_site_data(user_id):
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé.'}), 404
 
-    # Récupération des sites distincts via l'association user_site_roles
-    sites = []
-    seen = set()
-    for assoc in user.user_site_roles.all():
-        site = assoc.site
-        if site and site.id not in seen:
-            seen.add(site.id)
-            sites.append(site)
+    try:
+        projection = Projection.from_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    site_ids = get_user_site_ids(user.id)
+    validators = site_validators(site_ids)
+    etag = compute_etag(hierarchy_etag_scopes(user.id), extra=[validators[site_id] for site_id in site_ids])
+    return conditional_response(etag, lambda: _build_alldata_response(site_ids, projection, validators))
+
+
+def _build_alldata_response(site_ids, projection, validators):
+    if request.args.get('stream', 'false').lower() in ('1', 'true', 'yes'):
+        return Response(stream_with_context(_stream_sites(site_ids, projection)),
+                        status=200, mimetype='application/json')
+
+    # Chargement ensembliste : le nombre de requêtes ne dépend pas de la taille de l'arbre.
+    # Les fragments par site sont servis depuis le cache, sous le validateur lu en base pour l'ETag ;
+    # seuls les sites absents ou modifiés depuis sont rechargés
+    cache = get_hierarchy_cache()
+    fragments = {}
+    for site_id in site_ids:
+        fragment = cache.get(site_id, validators[site_id], projection.key)
+        if fragment is not None:
+            fragments[site_id] = fragment
 
-    sites_data = [site_to_dict(site) for site in sites]
+    missing = [site_id for site_id in site_ids if site_id not in fragments]
+    if missing:
+        hierarchy = load_site_hierarchy(missing, projection)
+        for site in hierarchy.sites:
+            fragments[site.id] = site_to_dict(site, hierarchy)
+            cache.set(site.id, validators[site.id], fragments[site.id], projection.key)
+
+    sites_data = [fragments[site_id] for site_id in site_ids if site_id in fragments]
     return jsonify({'sites': sites_data}), 200
+
+
+
+@general_routes_bp.route('/user/<int:user_id>/changes', methods=['GET'])
+@swag_from({
+    'tags': ['general'],
+    'description': "Synchronisation incrémentale : retourne les sites, bâtiments, étages, BAES, cartes et erreurs "
+                   "créés, modifiés ou supprimés depuis le curseur `since`, à plat avec l'id de leur parent. "
+                   "Le curseur renvoyé est à repasser tel quel au poll suivant ; sans `since`, "
+                   "toute la hiérarchie est renvoyée (sans suppressions). Un curseur plus ancien que la "
+                   "conservation des suppressions (CHANGES_TOMBSTONE_DAYS) est refusé : le client repart sans `since`.",
+    'parameters': [
+        {
+            'name': 'user_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "L'ID de l'utilisateur"
+        },
+        {
+            'name': 'since',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Curseur retourné par l'appel précédent"
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': "Changements depuis le curseur.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'cursor': {'type': 'integer', 'example': 1760692364318204},
+                    'changes': {
+                        'type': 'object',
+                        'example': {'baes': [{'id': 4, 'name': 'BAES 4', 'position': {}, 'etage_id': 2}],
+                                    'historique_erreur': []}
+                    },
+                    'deleted': {
+                        'type': 'object',
+                        'example': {'baes': [7], 'sites': []}
+                    }
+                }
+            }
+        },
+        '400': {'description': "Curseur invalide."},
+        '404': {'description': "Utilisateur non trouvé."},
+        '410': {'description': "Curseur expiré : resynchroniser sans `since`."}
+    }
+})
+def get_user_changes(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'Utilisateur non trouvé.'}), 404
+
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'Curseur invalide.'}), 400
+    if since < 0:
+        return jsonify({'error': 'Curseur invalide.'}), 400
+    if cursor_expired(since, current_app.config.get('CHANGES_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS)):
+        return jsonify({'error': 'Curseur expiré, resynchroniser sans since.'}), 410
+
+    site_ids = get_user_site_ids(user.id)
+    overlap = current_app.config.get('CHANGES_OVERLAP_SECONDS', DEFAULT_OVERLAP_SECONDS)
+    return jsonify(collect_changes(user.id, site_ids, since, overlap)), 200
+
+
+@general_routes_bp.route('/cache/stats', methods=['GET'])
+@swag_from({
+    'tags': ['general'],
+    'description': "Retourne les statistiques du cache de la hiérarchie (taille, succès, échecs).",
+    'responses': {
+        '200': {
+            'description': "Statistiques du cache.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'size': {'type': 'integer', 'example': 12},
+                    'maxsize': {'type': 'integer', 'example': 256},
+                    'hits': {'type': 'integer', 'example': 340},
+                    'misses': {'type': 'integer', 'example': 15}
+                }
+            }
+        }
+    }
+})
+def get_hierarchy_cache_stats():
+    return jsonify(get_hierarchy_cache().stats()), 200
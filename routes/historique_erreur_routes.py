@@ -1,8 +1,647 @@
 # routes/historique_erreur_routes.py
-from flask import Blueprint, request, jsonify, current_app
+import math
+from datetime import datetime
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flasgger import swag_from
-from models.batiment import Batiment
+from flask_login import current_user
+from models.historique_erreur import HistoriqueErreur, error_types
+from models.historique_erreur_archive import HistoriqueErreurArchive
+from models.site import Site
 from models import db
+from services.baes_status import refresh_open_errors
+from services.erreur_coalescing import get_coalescer
+from services.erreur_events import get_event_broker, publish_erreurs
+from services.erreur_export import FORMATS, iter_csv, iter_export_rows, iter_ndjson
+from services.hierarchy import get_user_site_ids
+from services.erreur_ingestion import insert_events, validate_events
+from services.erreur_queue import get_write_queue, write_queue_stats
+from services.erreur_resolution import close_erreurs, parse_close_request
+from services.erreur_stats import BUCKETS, GROUP_BY, StatsError, error_stats, parse_stats_args
+from services.heartbeat import get_heartbeat_monitor
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, int_arg, keyset_page, page_params,
+                                 set_link_header)
+
+
+historique_erreur_bp = Blueprint('historique_erreur_bp', __name__)
+
+DEFAULT_INGEST_BATCH_MAX = 5000
+DEFAULT_STREAM_HEARTBEAT = 15
+
+
+def _erreur_dict(err):
+    return {
+        'id': err.id,
+        'baes_id': err.baes_id,
+        'type_erreur': err.type_erreur,
+        'is_solved': err.is_solved,
+        'is_ignored': err.is_ignored,
+        'timestamp': err.timestamp.isoformat(),
+        'occurrences': err.occurrences,
+        'last_seen': err.last_seen.isoformat() if err.last_seen else None
+    }
+
+
+@historique_erreur_bp.route('/ingest', methods=['POST'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Ingestion d'un lot d'événements d'erreur envoyés par les passerelles. "
+                   "Le lot est validé d'un bloc puis inséré par un INSERT ensembliste ; "
+                   "les événements invalides sont rejetés individuellement. "
+                   "Les répétitions d'une erreur encore ouverte (même BAES, même type) dans la fenêtre "
+                   "ERREURS_COALESCE_WINDOW incrémentent `occurrences` au lieu de créer une ligne. "
+                   "En écriture différée (ERREURS_WRITE_BEHIND), le lot est mis en file et la réponse "
+                   "est un 202 immédiat ; si la file est pleine, un 429 avec Retry-After est renvoyé.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'baes_id': {'type': 'integer', 'example': 12},
+                        'baes_name': {'type': 'string', 'example': 'BAES 12'},
+                        'type_erreur': {'type': 'string', 'enum': list(error_types), 'example': 'erreur_connexion'},
+                        'timestamp': {'type': 'string', 'example': '2025-04-03T12:34:56Z'}
+                    },
+                    'required': ['type_erreur']
+                }
+            }
+        }
+    ],
+    'responses': {
+        201: {
+            'description': "Événements insérés (les rejets éventuels sont listés).",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'inserted': {'type': 'integer', 'example': 120},
+                    'coalesced': {'type': 'integer', 'example': 30},
+                    'rejected': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'index': {'type': 'integer', 'example': 3},
+                                'error': {'type': 'string', 'example': 'BAES non trouvée'}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        202: {
+            'description': "Événements valides mis en file d'écriture (les rejets éventuels sont listés).",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'queued': {'type': 'integer', 'example': 120},
+                    'rejected': {'type': 'array', 'items': {'type': 'object'}}
+                }
+            }
+        },
+        400: {'description': "Lot vide ou entièrement invalide."},
+        413: {'description': "Lot trop volumineux."},
+        429: {'description': "File d'écriture pleine, réessayer après Retry-After secondes."}
+    }
+})
+def ingest_erreurs():
+    events = request.get_json(silent=True)
+    if not isinstance(events, list) or not events:
+        return jsonify({'error': 'Un tableau JSON non vide est attendu'}), 400
+    batch_max = current_app.config.get('ERREURS_INGEST_BATCH_MAX', DEFAULT_INGEST_BATCH_MAX)
+    if len(events) > batch_max:
+        return jsonify({'error': f'Au plus {batch_max} événements par requête'}), 413
+    try:
+        rows, rejected = validate_events(events)
+        if not rows:
+            return jsonify({'error': 'Aucun événement valide', 'inserted': 0, 'rejected': rejected}), 400
+        if current_app.config.get('ERREURS_WRITE_BEHIND', False):
+            write_queue = get_write_queue()
+            if not write_queue.submit(rows):
+                response = jsonify({'error': "File d'écriture pleine, réessayez plus tard"})
+                response.headers['Retry-After'] = str(max(1, math.ceil(write_queue.flush_interval * 2)))
+                return response, 429
+            return jsonify({'queued': len(rows), 'rejected': rejected}), 202
+        inserted, coalesced = insert_events(rows)
+        return jsonify({'inserted': inserted, 'coalesced': coalesced, 'rejected': rejected}), 201
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in ingest_erreurs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@historique_erreur_bp.route('/ingest/stats', methods=['GET'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "État de la file d'écriture différée, du regroupement des répétitions et des flux SSE "
+                   "du worker courant.",
+    'responses': {
+        200: {
+            'description': "Statistiques de la file.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'enabled': {'type': 'boolean', 'example': False},
+                    'queued': {'type': 'integer', 'example': 0},
+                    'maxsize': {'type': 'integer', 'example': 50000},
+                    'written': {'type': 'integer', 'example': 125000},
+                    'retried': {'type': 'integer', 'example': 0},
+                    'dead_lettered': {'type': 'integer', 'example': 0},
+                    'failed': {'type': 'integer', 'example': 0},
+                    'coalescing': {
+                        'type': 'object',
+                        'properties': {
+                            'window_seconds': {'type': 'number', 'example': 300},
+                            'tracked': {'type': 'integer', 'example': 412},
+                            'coalesced': {'type': 'integer', 'example': 9120}
+                        }
+                    },
+                    'stream': {
+                        'type': 'object',
+                        'properties': {
+                            'subscribers': {'type': 'integer', 'example': 12},
+                            'max_subscribers': {'type': 'integer', 'example': 16},
+                            'rejected': {'type': 'integer', 'example': 0},
+                            'overflowed': {'type': 'integer', 'example': 0}
+                        }
+                    }
+                }
+            }
+        }
+    }
+})
+def get_ingest_stats():
+    stats = write_queue_stats()
+    stats['coalescing'] = get_coalescer().stats()
+    stats['stream'] = get_event_broker().stats()
+    stats['heartbeat'] = get_heartbeat_monitor().stats()
+    return jsonify(stats), 200
+
+
+@historique_erreur_bp.route('/stats', methods=['GET'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Nombre d'erreurs par créneau (heure, jour ou mois) et par site, bâtiment, étage et/ou type, "
+                   "sur [from, to) étendu aux créneaux entiers. Servi par les tables de cumul horaire et "
+                   "journalière (alimentées par `flask erreurs-stats compact`) ; seules les erreurs pas encore "
+                   "agrégées sont lues dans l'historique brut.",
+    'parameters': [
+        {
+            'name': 'group_by',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Dimensions séparées par des virgules, parmi : " + ', '.join(GROUP_BY)
+        },
+        {
+            'name': 'bucket',
+            'in': 'query',
+            'type': 'string',
+            'enum': list(BUCKETS),
+            'required': False,
+            'description': "Taille des créneaux (day par défaut)"
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Début de période, ISO 8601 (30 jours avant `to` par défaut)"
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Fin de période exclue, ISO 8601 (maintenant par défaut)"
+        },
+        {
+            'name': 'site_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Restreint les comptes à ce site"
+        }
+    ],
+    'responses': {
+        200: {
+            'description': "Comptes par créneau.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'bucket': {'type': 'string', 'example': 'day'},
+                    'group_by': {'type': 'array', 'items': {'type': 'string'}, 'example': ['etage']},
+                    'from': {'type': 'string', 'example': '2025-04-01T00:00:00+00:00'},
+                    'to': {'type': 'string', 'example': '2025-05-01T00:00:00+00:00'},
+                    'stats': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'bucket': {'type': 'string', 'example': '2025-04-03T00:00:00+00:00'},
+                                'etage_id': {'type': 'integer', 'example': 4},
+                                'count': {'type': 'integer', 'example': 17}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        400: {'description': "Paramètres invalides."}
+    }
+})
+def get_erreur_stats():
+    try:
+        bucket, group_by, start, end, site_id = parse_stats_args(request.args)
+    except StatsError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return jsonify(error_stats(bucket, group_by, start, end, site_id)), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_erreur_stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@historique_erreur_bp.route('/archive', methods=['GET'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Erreurs archivées par la rétention (résolues ou ignorées depuis plus de "
+                   "ERREURS_RETENTION_DAYS jours), paginées par id (en-tête Link vers la page suivante).",
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'baes_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les erreurs archivées de cette BAES"
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Erreurs survenues à partir de cette date (ISO 8601)"
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Erreurs survenues avant cette date (ISO 8601)"
+        }
+    ],
+    'responses': {
+        200: {
+            'description': "Erreurs archivées.",
+            'schema': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'integer', 'example': 1},
+                        'baes_id': {'type': 'integer', 'example': 12},
+                        'type_erreur': {'type': 'string', 'example': 'erreur_connexion'},
+                        'is_solved': {'type': 'boolean', 'example': True},
+                        'is_ignored': {'type': 'boolean', 'example': False},
+                        'timestamp': {'type': 'string', 'example': '2025-04-03T12:34:56Z'},
+                        'occurrences': {'type': 'integer', 'example': 1},
+                        'last_seen': {'type': 'string', 'example': '2025-04-03T12:40:12Z'},
+                        'archived_at': {'type': 'string', 'example': '2025-07-02T03:00:00Z'}
+                    }
+                }
+            }
+        },
+        400: {'description': "Paramètres invalides."}
+    }
+})
+def get_archived_erreurs():
+    try:
+        limit, after = page_params()
+        baes_id = int_arg('baes_id')
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'from et to doivent être des dates ISO 8601'}), 400
+    try:
+        query = HistoriqueErreurArchive.query
+        if baes_id is not None:
+            query = query.filter(HistoriqueErreurArchive.baes_id == baes_id)
+        if start is not None:
+            query = query.filter(HistoriqueErreurArchive.timestamp >= start)
+        if end is not None:
+            query = query.filter(HistoriqueErreurArchive.timestamp < end)
+        erreurs, next_after = keyset_page(query, HistoriqueErreurArchive.id, limit, after)
+        data = [dict(_erreur_dict(err), archived_at=err.archived_at.isoformat()) for err in erreurs]
+        return set_link_header(jsonify(data), limit, next_after), 200
+    except Exception as e:
+        current_app.logger.error(f"Error in get_archived_erreurs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@historique_erreur_bp.route('/status', methods=['PUT'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Résout ou ignore en une fois toutes les erreurs ouvertes d'une BAES, d'un étage, "
+                   "d'un bâtiment, d'une liste de BAES ou d'une liste d'ids, éventuellement restreintes à certains types. "
+                   "Exécuté par un seul UPDATE ensembliste ; l'état courant des BAES est recalculé.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'is_solved': {'type': 'boolean', 'example': True},
+                    'is_ignored': {'type': 'boolean', 'example': False},
+                    'baes_id': {'type': 'integer', 'example': 12},
+                    'baes_ids': {'type': 'array', 'items': {'type': 'integer'}, 'example': [12, 13]},
+                    'etage_id': {'type': 'integer', 'example': 3},
+                    'batiment_id': {'type': 'integer', 'example': 1},
+                    'ids': {'type': 'array', 'items': {'type': 'integer'}, 'example': [4, 8, 15]},
+                    'types': {'type': 'array', 'items': {'type': 'string', 'enum': list(error_types)},
+                              'example': ['erreur_batterie']}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': "Erreurs fermées.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'updated': {'type': 'integer', 'example': 42},
+                    'baes': {'type': 'integer', 'example': 17}
+                }
+            }
+        },
+        400: {'description': "Corps invalide (un seul statut et un seul périmètre sont attendus)."}
+    }
+})
+def close_erreurs_bulk():
+    try:
+        flag, scope, value, types = parse_close_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        updated, baes_count = close_erreurs(flag, scope, value, types)
+        return jsonify({'updated': updated, 'baes': baes_count}), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in close_erreurs_bulk: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@historique_erreur_bp.route('/export', methods=['GET'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Export de l'historique complet des erreurs d'un site (archive comprise), avec les noms "
+                   "de BAES, étage, bâtiment et site. La réponse est produite en flux depuis un curseur "
+                   "côté serveur : la mémoire du worker ne dépend pas du nombre de lignes.",
+    'produces': ['text/csv', 'application/x-ndjson'],
+    'parameters': [
+        {
+            'name': 'site_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': True,
+            'description': "Site à exporter"
+        },
+        {
+            'name': 'from',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Erreurs survenues à partir de cette date (ISO 8601)"
+        },
+        {
+            'name': 'to',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Erreurs survenues avant cette date (ISO 8601)"
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': list(FORMATS),
+            'required': False,
+            'description': "csv (par défaut) ou ndjson"
+        },
+        {
+            'name': 'archive',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'description': "Inclut les erreurs archivées (true par défaut)"
+        }
+    ],
+    'responses': {
+        200: {'description': "Fichier CSV ou NDJSON en flux."},
+        400: {'description': "Paramètres invalides."},
+        404: {'description': "Site non trouvé."}
+    }
+})
+def export_erreurs():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in FORMATS:
+        return jsonify({'error': f"format doit valoir l'une des valeurs : {', '.join(FORMATS)}"}), 400
+    try:
+        site_id = int_arg('site_id')
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'from et to doivent être des dates ISO 8601'}), 400
+    if site_id is None:
+        return jsonify({'error': 'Le paramètre site_id est requis'}), 400
+    if not db.session.get(Site, site_id):
+        return jsonify({'error': 'Site non trouvé'}), 404
+    include_archive = request.args.get('archive', 'true').lower() not in ('0', 'false', 'no')
+
+    rows = iter_export_rows(site_id, start, end, include_archive)
+    if export_format == 'csv':
+        body, mimetype = iter_csv(rows), 'text/csv'
+    else:
+        body, mimetype = iter_ndjson(rows, current_app.json.dumps), 'application/x-ndjson'
+    # Le générateur lit la base pendant l'envoi : il garde le contexte de la requête
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="erreurs_site_{site_id}.{export_format}"'
+    return response
+
+
+@historique_erreur_bp.route('/<int:erreur_id>/status', methods=['PUT'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Résout, ignore ou rouvre une erreur. L'état courant de sa BAES (baes_status) est "
+                   "recalculé dans la même transaction.",
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'erreur_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': "ID de l'erreur"
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'is_solved': {'type': 'boolean', 'example': True},
+                    'is_ignored': {'type': 'boolean', 'example': False}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': "Erreur mise à jour.",
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'integer', 'example': 1},
+                    'baes_id': {'type': 'integer', 'example': 12},
+                    'type_erreur': {'type': 'string', 'example': 'erreur_connexion'},
+                    'is_solved': {'type': 'boolean', 'example': True},
+                    'is_ignored': {'type': 'boolean', 'example': False},
+                    'timestamp': {'type': 'string', 'example': '2025-04-03T12:34:56Z'},
+                    'occurrences': {'type': 'integer', 'example': 1},
+                    'last_seen': {'type': 'string', 'example': '2025-04-03T12:40:12Z'}
+                }
+            }
+        },
+        400: {'description': "is_solved ou is_ignored (booléens) est requis."},
+        404: {'description': "Erreur non trouvée."}
+    }
+})
+def update_erreur_status(erreur_id):
+    data = request.get_json(silent=True) or {}
+    flags = {key: data[key] for key in ('is_solved', 'is_ignored') if key in data}
+    if not flags or not all(isinstance(value, bool) for value in flags.values()):
+        return jsonify({'error': 'is_solved ou is_ignored (booléens) est requis'}), 400
+    try:
+        erreur = HistoriqueErreur.query.get(erreur_id)
+        if not erreur:
+            return jsonify({'error': 'Erreur non trouvée'}), 404
+        for key, value in flags.items():
+            setattr(erreur, key, value)
+        db.session.flush()
+        refresh_open_errors([erreur.baes_id])
+        db.session.commit()
+        if erreur.is_solved or erreur.is_ignored:
+            # L'événement suivant de ce type ouvrira une nouvelle ligne
+            get_coalescer().forget(baes_ids=[erreur.baes_id], types=[erreur.type_erreur])
+        publish_erreurs('statut', [_erreur_dict(erreur)])
+        return jsonify(_erreur_dict(erreur)), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in update_erreur_status: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+def _sse_frames(broker, subscription, heartbeat, dumps):
+    """
+    Génère les trames SSE d'un abonnement, avec un commentaire de vie toutes les `heartbeat` secondes.
+
+    Le générateur s'exécute hors du contexte de la requête : il ne touche ni à la base ni à current_app.
+    """
+    try:
+        yield f"retry: {int(heartbeat * 1000)}\n\n"
+        while True:
+            event = subscription.get(heartbeat)
+            if subscription.overflowed:
+                # Des événements ont été perdus : le client doit recharger l'état complet
+                yield "event: resync\ndata: {}\n\n"
+                return
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            event_id, kind, data = event
+            yield f"id: {event_id}\nevent: {kind}\ndata: {dumps(data)}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
 
+@historique_erreur_bp.route('/stream', methods=['GET'])
+@swag_from({
+    'tags': ['Historique erreur'],
+    'description': "Flux Server-Sent Events des erreurs des sites de l'utilisateur connecté : "
+                   "`erreur` pour chaque nouvelle erreur ingérée, `statut` lorsqu'une erreur est résolue, "
+                   "ignorée ou rouverte. Un commentaire `heartbeat` est émis toutes les ERREURS_STREAM_HEARTBEAT "
+                   "secondes. Si le client ne suit pas, un événement `resync` est envoyé et le flux se ferme : "
+                   "recharger alors /general/user/<id>/alldata avant de se réabonner. "
+                   "La diffusion est propre à chaque worker : un flux ne reçoit que les erreurs ingérées ou "
+                   "modifiées par le worker qui le sert. Chaque flux occupe un thread de ce worker pendant "
+                   "toute sa durée ; au-delà de ERREURS_STREAM_MAX flux ouverts sur le worker, la connexion "
+                   "est refusée (503).",
+    'produces': ['text/event-stream'],
+    'parameters': [
+        {
+            'name': 'site_id',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': "Ids de sites séparés par des virgules (tous les sites de l'utilisateur par défaut)"
+        }
+    ],
+    'responses': {
+        200: {'description': "Flux text/event-stream."},
+        400: {'description': "site_id invalide."},
+        401: {'description': "Utilisateur non connecté."},
+        403: {'description': "Site non accessible à l'utilisateur."},
+        503: {'description': "Nombre maximal de flux atteint sur ce worker, réessayer après Retry-After secondes."}
+    }
+})
+def stream_erreurs():
+    """
+    Flux SSE des erreurs des sites de l'utilisateur.
 
-historique_erreur_bp = Blueprint('historique_erreur_bp', __name__)
\ No newline at end of file
+    Le diffuseur est en mémoire, propre au processus : avec plusieurs workers, un flux ne voit que
+    les événements du sien. Chaque connexion garde un thread du worker synchrone jusqu'à sa fermeture ;
+    le nombre de flux simultanés par processus est donc borné par ERREURS_STREAM_MAX.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Authentification requise'}), 401
+    try:
+        site_ids = set(get_user_site_ids(current_user.id))
+        requested = request.args.get('site_id')
+        if requested:
+            try:
+                requested = {int(site_id) for site_id in requested.split(',') if site_id.strip()}
+            except ValueError:
+                return jsonify({'error': 'Le paramètre site_id doit être une liste d\'entiers'}), 400
+            if not requested <= site_ids:
+                return jsonify({'error': 'Site non accessible'}), 403
+            site_ids = requested
+        broker = get_event_broker()
+        heartbeat = current_app.config.get('ERREURS_STREAM_HEARTBEAT', DEFAULT_STREAM_HEARTBEAT)
+        subscription = broker.subscribe(site_ids)
+        if subscription is None:
+            response = jsonify({'error': 'Trop de flux ouverts, réessayez plus tard'})
+            response.headers['Retry-After'] = str(max(1, math.ceil(heartbeat)))
+            return response, 503
+        response = Response(_sse_frames(broker, subscription, heartbeat, current_app.json.dumps), mimetype='text/event-stream')
+        # Libère la place même si la connexion est fermée avant la première trame
+        response.call_on_close(lambda: broker.unsubscribe(subscription))
+        response.headers['Cache-Control'] = 'no-cache'
+        # Désactive la mise en tampon des proxys (nginx) pour que chaque trame parte immédiatement
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        current_app.logger.error(f"Error in stream_erreurs: {e}")
+        return jsonify({'error': str(e)}), 500
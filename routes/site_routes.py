@@ -3,13 +3,17 @@ from flask import Blueprint, request, jsonify, current_app
 from flasgger import swag_from
 from models.site import Site
 from models import db
+from services.conditional import conditional_response, page_etag
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, keyset_page, page_params,
+                                 set_link_header)
 
 site_bp = Blueprint('site_bp', __name__)
 
 @site_bp.route('/', methods=['GET'])
 @swag_from({
     'tags': ['Site CRUD'],
-    'description': 'Récupère la liste de tous les sites.',
+    'description': 'Récupère la liste des sites, paginée par id (en-tête Link vers la page suivante).',
+    'parameters': PAGINATION_PARAMETERS,
     'responses': {
         200: {
             'description': 'Liste des sites.',
@@ -29,9 +33,19 @@ site_bp = Blueprint('site_bp', __name__)
 })
 def get_sites():
     try:
-        sites = Site.query.all()
-        result = [{'id': s.id, 'name': s.name} for s in sites]
-        return jsonify(result), 200
+        limit, after = page_params()
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = Site.query
+        etag = page_etag(query, Site, limit, after)
+
+        def build():
+            sites, next_after = keyset_page(query, Site.id, limit, after)
+            result = [{'id': s.id, 'name': s.name} for s in sites]
+            return set_link_header(jsonify(result), limit, next_after), 200
+
+        return conditional_response(etag, build)
     except Exception as e:
         current_app.logger.error(f"Error in get_sites: {e}")
         return jsonify({'error': str(e)}), 500
@@ -1,14 +1,28 @@
 from flask import Blueprint, request, jsonify, current_app
 from flasgger import swag_from
+from sqlalchemy.orm import joinedload
 from models.user import User
+from models.user_site_role import UserSiteRole
 from models import db
+from services.pagination import (PAGINATION_PARAMETERS, PaginationError, int_arg, keyset_page, page_params,
+                                 set_link_header)
 
 user_bp = Blueprint('user_bp', __name__)
 
 @user_bp.route('/', methods=['GET'])
 @swag_from({
     'tags': ['User CRUD'],
-    'description': 'Récupère la liste de tous les utilisateurs avec leurs sites et rôles associés.',
+    'description': 'Récupère la liste des utilisateurs avec leurs sites et rôles associés, '
+                   'paginée par id (en-tête Link vers la page suivante).',
+    'parameters': PAGINATION_PARAMETERS + [
+        {
+            'name': 'site_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': "Ne retourne que les utilisateurs ayant accès à ce site"
+        }
+    ],
     'responses': {
         '200': {
             'description': 'Liste des utilisateurs avec leurs sites et rôles.',
@@ -47,15 +61,35 @@ user_bp = Blueprint('user_bp', __name__)
 })
 def get_users():
     try:
-        users = User.query.all()
+        limit, after = page_params()
+        site_id = int_arg('site_id')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        query = User.query
+        if site_id is not None:
+            query = query.filter(User.user_site_roles.any(UserSiteRole.site_id == site_id))
+        users, next_after = keyset_page(query, User.id, limit, after)
+
+        # Associations de toute la page chargées en une requête, avec leurs sites et rôles
+        assocs_by_user = {}
+        if users:
+            assocs = (UserSiteRole.query
+                      .options(joinedload(UserSiteRole.site), joinedload(UserSiteRole.role))
+                      .filter(UserSiteRole.user_id.in_([u.id for u in users]))
+                      .all())
+            for assoc in assocs:
+                assocs_by_user.setdefault(assoc.user_id, []).append(assoc)
+
         result = []
         for user in users:
+            user_assocs = assocs_by_user.get(user.id, [])
             # Récupérer les rôles distincts via l'association
-            roles_set = {assoc.role.name for assoc in user.user_site_roles if assoc.role}
+            roles_set = {assoc.role.name for assoc in user_assocs if assoc.role}
             # Récupérer les sites distincts via l'association
             sites = []
             sites_ids = set()
-            for assoc in user.user_site_roles:
+            for assoc in user_assocs:
                 if assoc.site and assoc.site.id not in sites_ids:
                     sites.append({'id': assoc.site.id, 'name': assoc.site.name})
                     sites_ids.add(assoc.site.id)
@@ -65,7 +99,7 @@ def get_users():
                 'roles': list(roles_set),
                 'sites': sites
             })
-        return jsonify(result), 200
+        return set_link_header(jsonify(result), limit, next_after), 200
     except Exception as e:
         current_app.logger.error(f"Error in get_users: {e}")
         return jsonify({'error': str(e)}), 500
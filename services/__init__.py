@@ -0,0 +1,2 @@
+# services/__init__.py
+# Logique partagée entre les routes (chargement de la hiérarchie, instrumentation, ...).
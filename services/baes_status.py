@@ -0,0 +1,196 @@
+# services/baes_status.py
+from collections import defaultdict
+from datetime import timezone
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.baes_status import BaesStatus
+from models.historique_erreur import HistoriqueErreur
+from services.bulk import chunked, for_update
+from templates.TimestampMixin import current_time
+
+baes_status_cli = AppGroup('baes-status', help="Gestion de la table d'état courant des BAES (baes_status).")
+
+
+def _as_utc(value):
+    # Certains pilotes (SQLite) relisent les dates sans fuseau : elles sont stockées en UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _latest(*values):
+    values = [_as_utc(v) for v in values if v is not None]
+    return max(values) if values else None
+
+
+def _is_open():
+    return HistoriqueErreur.is_solved.is_(False), HistoriqueErreur.is_ignored.is_(False)
+
+
+def status_to_dict(status):
+    """Sérialise l'état d'une BAES ; une BAES sans ligne d'état n'a jamais eu d'erreur."""
+    if status is None:
+        return {'open_count': 0, 'open_types': {}, 'error_count': 0, 'last_error_at': None}
+    return {
+        'open_count': status.open_count,
+        'open_types': status.open_types or {},
+        'error_count': status.error_count,
+        'last_error_at': _as_utc(status.last_error_at).isoformat() if status.last_error_at else None,
+    }
+
+
+def record_errors(inserted=(), repeats=()):
+    """
+    Reporte dans baes_status des erreurs nouvellement insérées et des répétitions regroupées.
+
+    `inserted` contient les lignes insérées (baes_id, type_erreur, timestamp, last_seen éventuel),
+    `repeats` des couples (baes_id, date de la répétition). Les compteurs sont incrémentés en SQL
+    (open_count = open_count + n) ; le détail par type (JSON) est fusionné sur des lignes lues
+    WITH (UPDLOCK), pour qu'une ingestion concurrente sur les mêmes BAES ne perde aucune mise à jour.
+    À appeler dans la transaction de l'écriture des erreurs, avant son commit.
+    """
+    deltas = {}
+    for row in inserted:
+        delta = deltas.setdefault(row['baes_id'], {'new': 0, 'types': defaultdict(int), 'last': None})
+        delta['new'] += 1
+        delta['types'][row['type_erreur']] += 1
+        delta['last'] = _latest(delta['last'], row.get('last_seen'), row['timestamp'])
+    for baes_id, seen in repeats:
+        delta = deltas.setdefault(baes_id, {'new': 0, 'types': defaultdict(int), 'last': None})
+        delta['last'] = _latest(delta['last'], seen)
+    if not deltas:
+        return
+
+    missing = _apply_deltas(deltas)
+    if not missing:
+        return
+    now = current_time()
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(BaesStatus.__table__), [
+                {'baes_id': baes_id, 'open_count': delta['new'], 'open_types': dict(delta['types']),
+                 'error_count': delta['new'], 'last_error_at': delta['last'], 'created_at': now, 'updated_at': now}
+                for baes_id, delta in missing.items()
+            ])
+    except IntegrityError:
+        # Ligne créée entre-temps par une ingestion concurrente : elle est mise à jour à la place
+        _apply_deltas(missing)
+
+
+def _apply_deltas(deltas):
+    """Met à jour les lignes d'état existantes ; retourne les deltas des BAES qui n'en ont pas encore."""
+    table = BaesStatus.__table__
+    current = {}
+    # Verrous pris dans l'ordre des ids, pour que deux lots ne s'interbloquent pas
+    for chunk in chunked(sorted(deltas)):
+        current.update((row.baes_id, row) for row in db.session.execute(for_update(
+            select(table.c.baes_id, table.c.open_types, table.c.last_error_at)
+            .where(table.c.baes_id.in_(chunk)), table)))
+
+    updates = []
+    for baes_id, row in current.items():
+        delta = deltas[baes_id]
+        open_types = dict(row.open_types or {})
+        for type_erreur, count in delta['types'].items():
+            open_types[type_erreur] = open_types.get(type_erreur, 0) + count
+        updates.append({'b_id': baes_id, 'nb_nouvelles': delta['new'], 'types': open_types,
+                        'derniere': _latest(row.last_error_at, delta['last'])})
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.baes_id == bindparam('b_id'))
+            .values(open_count=table.c.open_count + bindparam('nb_nouvelles'),
+                    open_types=bindparam('types', type_=table.c.open_types.type),
+                    error_count=table.c.error_count + bindparam('nb_nouvelles'),
+                    last_error_at=bindparam('derniere', type_=table.c.last_error_at.type),
+                    updated_at=current_time()),
+            updates,
+        )
+    return {baes_id: delta for baes_id, delta in deltas.items() if baes_id not in current}
+
+
+def refresh_open_errors(baes_ids):
+    """
+    Recalcule les erreurs ouvertes des BAES données, après une résolution ou une mise en ignoré.
+
+    Seules les erreurs ouvertes de ces BAES sont relues (une requête groupée par tranche) ;
+    l'historique complet n'est pas parcouru. À appeler avant le commit de la résolution.
+    """
+    baes_ids = set(baes_ids)
+    if not baes_ids:
+        return
+    open_types = defaultdict(dict)
+    for chunk in chunked(baes_ids):
+        rows = db.session.execute(
+            select(HistoriqueErreur.baes_id, HistoriqueErreur.type_erreur, func.count())
+            .where(HistoriqueErreur.baes_id.in_(chunk), *_is_open())
+            .group_by(HistoriqueErreur.baes_id, HistoriqueErreur.type_erreur))
+        for baes_id, type_erreur, count in rows:
+            open_types[baes_id][type_erreur] = count
+
+    table = BaesStatus.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.baes_id == bindparam('b_id'))
+        .values(open_count=bindparam('nb_ouvertes'),
+                open_types=bindparam('types', type_=table.c.open_types.type),
+                updated_at=current_time()),
+        [{'b_id': baes_id, 'nb_ouvertes': sum(open_types[baes_id].values()), 'types': open_types[baes_id]}
+         for baes_id in baes_ids],
+    )
+
+
+def record_archived(counts):
+    """Retire des compteurs d'historique les erreurs archivées : {baes_id: nombre de lignes archivées}."""
+    if not counts:
+        return
+    table = BaesStatus.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.baes_id == bindparam('b_id'))
+        .values(error_count=table.c.error_count - bindparam('nb_archivees'), updated_at=current_time()),
+        [{'b_id': baes_id, 'nb_archivees': count} for baes_id, count in counts.items()],
+    )
+
+
+def rebuild_baes_status():
+    """
+    Reconstruit entièrement baes_status depuis historique_erreur.
+
+    Deux agrégations groupées (historique complet et erreurs ouvertes) remplacent le contenu
+    de la table dans une seule transaction. Retourne le nombre de lignes d'état écrites.
+    """
+    totals = db.session.execute(
+        select(HistoriqueErreur.baes_id, func.count(),
+               func.max(func.coalesce(HistoriqueErreur.last_seen, HistoriqueErreur.timestamp)))
+        .group_by(HistoriqueErreur.baes_id)).all()
+    open_types = defaultdict(dict)
+    for baes_id, type_erreur, count in db.session.execute(
+            select(HistoriqueErreur.baes_id, HistoriqueErreur.type_erreur, func.count())
+            .where(*_is_open())
+            .group_by(HistoriqueErreur.baes_id, HistoriqueErreur.type_erreur)):
+        open_types[baes_id][type_erreur] = count
+
+    table = BaesStatus.__table__
+    now = current_time()
+    db.session.execute(delete(table))
+    for chunk in chunked(totals):
+        db.session.execute(insert(table), [
+            {'baes_id': baes_id, 'open_count': sum(open_types[baes_id].values()), 'open_types': open_types[baes_id],
+             'error_count': count, 'last_error_at': _as_utc(last), 'created_at': now, 'updated_at': now}
+            for baes_id, count, last in chunk
+        ])
+    db.session.commit()
+    return len(totals)
+
+
+@baes_status_cli.command('rebuild')
+def rebuild_command():
+    """Reconstruit baes_status depuis l'historique des erreurs."""
+    count = rebuild_baes_status()
+    click.echo(f"baes_status reconstruite : {count} BAES")
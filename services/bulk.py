@@ -0,0 +1,21 @@
+# services/bulk.py
+
+# Taille des listes IN envoyées à SQL Server (limité à 2100 paramètres par requête)
+IN_CHUNK_SIZE = 1000
+
+
+def chunked(values, size=IN_CHUNK_SIZE):
+    """Découpe `values` en listes d'au plus `size` éléments."""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def for_update(statement, table):
+    """
+    Verrouille en mise à jour, jusqu'à la fin de la transaction, les lignes de `table` lues par `statement`.
+
+    SQLAlchemy n'émet pas FOR UPDATE pour SQL Server : le verrou y est posé par l'indicateur de table
+    WITH (UPDLOCK, ROWLOCK). Les autres bases reçoivent FOR UPDATE (sans effet sous SQLite).
+    """
+    return statement.with_for_update().with_hint(table, 'WITH (UPDLOCK, ROWLOCK)', 'mssql')
@@ -0,0 +1,157 @@
+# services/carte_images.py
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from services.carte_storage import atomic_write, content_key, derived_path, resolve_path
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow absent : seules les images d'origine sont servies
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Plus grand côté (pixels) de chaque dérivé ; `full` est le fichier d'origine
+DERIVATIVE_SIZES = {'thumb': 300, 'medium': 1600}
+IMAGE_SIZES = ('thumb', 'medium', 'full')
+
+DEFAULT_WORKERS = 2
+DEFAULT_WAIT = 30
+
+_SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+
+_create_lock = threading.Lock()
+
+
+def render_derivative(source, target, max_side):
+    """Écrit dans `target` une réduction de `source` dont le plus grand côté vaut au plus `max_side`."""
+    with Image.open(source) as image:
+        image_format = image.format
+        if image_format == 'JPEG':
+            # Le décodeur JPEG réduit directement à l'échelle 1/2, 1/4 ou 1/8 : bien plus rapide
+            image.draft('RGB', (max_side, max_side))
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        atomic_write(target, lambda tmp: image.save(tmp, format=image_format,
+                                                    **_SAVE_OPTIONS.get(image_format, {})))
+
+
+class DerivativePool:
+    """
+    Génération des fichiers dérivés des cartes (images réduites, tuiles) par un pool de threads.
+
+    Pillow libère le GIL pendant le décodage, le redimensionnement et l'encodage : les workers
+    travaillent réellement en parallèle. Une même image demandée plusieurs fois pendant sa
+    génération (envoi puis premier affichage) n'est générée qu'une fois.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.generated = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='carte-derivatives')
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, target, render, *args):
+        """
+        Planifie `render(*args)`, qui produit le fichier `target` ; retourne le Future
+        (partagé si déjà en cours). Rien n'est refait si `target` existe déjà.
+        """
+        with self._lock:
+            future = self._pending.get(target)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._generate, target, render, args)
+            self._pending[target] = future
+        # Hors du verrou : le rappel s'exécute immédiatement si la génération est déjà finie
+        future.add_done_callback(lambda _: self._forget(target))
+        return future
+
+    def _forget(self, target):
+        with self._lock:
+            self._pending.pop(target, None)
+
+    def _generate(self, target, render, args):
+        if not os.path.exists(target):
+            try:
+                render(*args)
+                self.generated += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Génération de %s impossible : %s", target, e)
+                raise
+        return target
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'generated': self.generated, 'failed': self.failed}
+
+
+def get_derivative_pool():
+    """Retourne le pool de l'application courante, créé à la première utilisation (après le fork)."""
+    pool = current_app.extensions.get('carte_derivatives')
+    if pool is None:
+        with _create_lock:
+            pool = current_app.extensions.get('carte_derivatives')
+            if pool is None:
+                pool = DerivativePool(current_app.config.get('CARTES_DERIVATIVE_WORKERS', DEFAULT_WORKERS))
+                current_app.extensions['carte_derivatives'] = pool
+    return pool
+
+
+def _derivative_target(chemin, size):
+    key = content_key(chemin)
+    if key is None:
+        return None
+    return derived_path(key, size, os.path.splitext(chemin)[1].lower())
+
+
+def enqueue_derivatives(chemin):
+    """Planifie en arrière-plan la génération de toutes les tailles réduites d'une carte."""
+    if Image is None:
+        return
+    source = resolve_path(chemin)
+    pool = get_derivative_pool()
+    for size, max_side in DERIVATIVE_SIZES.items():
+        target = _derivative_target(chemin, size)
+        if target is not None and not os.path.exists(target):
+            pool.submit(target, render_derivative, source, target, max_side)
+
+
+def carte_image_path(chemin, size, timeout=None):
+    """
+    Chemin disque de l'image d'une carte à la taille demandée ; retourne (chemin, repli).
+
+    Une taille réduite absente du cache disque (non encore générée, ou supprimée) est
+    générée à la demande, en attendant au plus `timeout` secondes. Sans Pillow, ou si la
+    génération échoue ou dépasse ce délai, l'image d'origine est retournée avec repli=True :
+    ce n'est pas la taille demandée, elle ne doit pas être mise en cache sous cette taille.
+    Lève FileNotFoundError si l'original manque.
+    """
+    source = resolve_path(chemin)
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if size == 'full':
+        return source, False
+    if Image is None:
+        return source, True
+    target = _derivative_target(chemin, size)
+    if os.path.exists(target):
+        return target, False
+    if timeout is None:
+        timeout = current_app.config.get('CARTES_DERIVATIVE_WAIT', DEFAULT_WAIT)
+    try:
+        future = get_derivative_pool().submit(target, render_derivative, source, target, DERIVATIVE_SIZES[size])
+        return future.result(timeout), False
+    except Exception as e:
+        logger.warning("Image réduite %s indisponible, envoi de l'original : %s", target, e)
+        return source, True
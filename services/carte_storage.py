@@ -0,0 +1,258 @@
+# services/carte_storage.py
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from models import db
+from models.carte import Carte
+from services.bulk import chunked
+
+CHUNK_SIZE = 64 * 1024
+
+# Âge minimal (secondes) d'un fichier non référencé avant sa suppression par le balayage
+DEFAULT_SWEEP_GRACE = 3600
+
+# Extensions équivalentes ramenées à une seule, pour qu'un même contenu n'ait qu'une adresse
+_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+# Signatures des formats d'image acceptés (ALLOWED_EXTENSIONS)
+_MAGIC_NUMBERS = ((b'\x89PNG\r\n\x1a\n', 'png'), (b'\xff\xd8\xff', 'jpg'))
+_HEADER_SIZE = 8
+
+# Adresse de contenu relative au magasin : ab/cd/<sha256>.<ext>
+_CONTENT_ADDRESS = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$')
+
+cartes_store_cli = AppGroup('cartes-store', help="Magasin des fichiers de cartes.")
+
+
+def store_root():
+    """Répertoire du magasin des cartes (CARTES_STORE_FOLDER, par défaut UPLOAD_FOLDER/cartes)."""
+    config = current_app.config
+    return config.get('CARTES_STORE_FOLDER') or os.path.join(config['UPLOAD_FOLDER'], 'cartes')
+
+
+def content_address(digest, extension):
+    """Chemin relatif d'un contenu : deux niveaux de répertoires tirés du condensat, puis le condensat."""
+    extension = extension.lower()
+    extension = _EXTENSION_ALIASES.get(extension, extension)
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+
+def content_digest(chemin):
+    """Condensat SHA-256 d'une adresse de contenu, ou None pour un ancien chemin (nom de fichier d'origine)."""
+    match = _CONTENT_ADDRESS.match(chemin or '')
+    return match.group(1) if match else None
+
+
+def content_key(chemin):
+    """
+    Clé des fichiers dérivés d'une carte : son condensat, ou pour un ancien chemin une empreinte
+    du chemin, de la date et de la taille du fichier (qui pouvait être écrasé sous le même nom).
+    Retourne None si le fichier d'un ancien chemin n'existe plus.
+    """
+    digest = content_digest(chemin)
+    if digest is not None:
+        return digest
+    try:
+        stat = os.stat(chemin)
+    except OSError:
+        return None
+    return hashlib.sha256(f"{chemin}|{stat.st_mtime_ns}|{stat.st_size}".encode('utf-8')).hexdigest()
+
+
+def derived_path(key, kind, suffix=''):
+    """Chemin d'un fichier dérivé (miniature, tuiles...) : derived/<kind>/ab/cd/<clé><suffix>."""
+    return os.path.join(store_root(), 'derived', kind, key[:2], key[2:4], key + suffix)
+
+
+def atomic_write(path, write):
+    """Écrit un fichier par `write(fichier)` dans un temporaire voisin, puis le renomme atomiquement."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            write(tmp)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def resolve_path(chemin):
+    """Chemin disque d'une carte : les anciennes cartes portent un chemin absolu, les nouvelles une adresse."""
+    if os.path.isabs(chemin):
+        return chemin
+    return os.path.join(store_root(), chemin)
+
+
+def sniff_extension(header):
+    """Type d'image reconnu d'après les premiers octets du contenu ('png', 'jpg'), ou None."""
+    for magic, extension in _MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return extension
+    return None
+
+
+class ContentWriter:
+    """
+    Écriture d'un contenu dans le magasin, bloc par bloc.
+
+    Chaque bloc est haché (SHA-256) et écrit dans un fichier temporaire du magasin ; les premiers
+    octets sont conservés pour reconnaître le type d'image. `commit` renomme atomiquement le fichier
+    à son adresse de contenu, `abort` le supprime. La mémoire utilisée ne dépend pas de la taille.
+    """
+
+    def __init__(self):
+        root = store_root()
+        tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.root = root
+        self.size = 0
+        self._header = b''
+        self._digest = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self._tmp = os.fdopen(fd, 'wb')
+
+    @property
+    def image_type(self):
+        return sniff_extension(self._header)
+
+    def write(self, chunk):
+        if len(self._header) < _HEADER_SIZE:
+            self._header += chunk[:_HEADER_SIZE - len(self._header)]
+        self._digest.update(chunk)
+        self._tmp.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, extension):
+        """Range le contenu à son adresse ; retourne l'adresse (Carte.chemin)."""
+        try:
+            self._tmp.close()
+            chemin = content_address(self._digest.hexdigest(), extension)
+            path = os.path.join(self.root, chemin)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Un contenu déjà présent est remplacé par une copie identique
+            os.replace(self._tmp_path, path)
+        except BaseException:
+            self.abort()
+            raise
+        return chemin
+
+    def abort(self):
+        self._tmp.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def store_stream(stream, extension, chunk_size=CHUNK_SIZE):
+    """
+    Copie un flux dans le magasin sous son adresse de contenu ; retourne l'adresse (Carte.chemin).
+
+    Le flux est lu par blocs de `chunk_size` octets. Le type d'image reconnu dans le contenu
+    l'emporte sur `extension` (extension du nom de fichier d'origine). Deux envois du même plan
+    partagent un fichier.
+    """
+    writer = ContentWriter()
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(writer.image_type or extension)
+
+
+def sweep_unreferenced(grace=None):
+    """
+    Supprime les contenus du magasin qu'aucune carte ne référence depuis plus de `grace` secondes,
+    avec leurs fichiers dérivés, ainsi que les temporaires abandonnés ; retourne (contenus, temporaires).
+
+    Un contenu n'est jamais supprimé au moment où sa dernière carte l'est : un envoi concurrent du
+    même plan a pu le réécrire (os.replace) sans avoir encore enregistré sa carte. Ce renommage
+    rajeunit le fichier ; le délai de grâce couvre donc tout envoi en cours. Le fichier est écarté
+    par renommage avant d'être supprimé, et remis en place si un envoi l'a réécrit entre-temps.
+    Les anciens chemins (hors magasin) ne sont jamais supprimés.
+    """
+    if grace is None:
+        grace = current_app.config.get('CARTES_SWEEP_GRACE', DEFAULT_SWEEP_GRACE)
+    root = store_root()
+    cutoff = time.time() - grace
+
+    candidates = {}
+    for directory, subdirectories, filenames in os.walk(root):
+        if directory == root:
+            subdirectories[:] = [name for name in subdirectories if name not in ('tmp', 'derived')]
+        for name in filenames:
+            path = os.path.join(directory, name)
+            chemin = os.path.relpath(path, root).replace(os.sep, '/')
+            if content_digest(chemin) is not None and os.stat(path).st_mtime < cutoff:
+                candidates[chemin] = path
+    referenced = set()
+    for chunk in chunked(candidates):
+        referenced.update(db.session.execute(select(Carte.chemin).where(Carte.chemin.in_(chunk))).scalars())
+
+    removed = 0
+    for chemin, path in candidates.items():
+        if chemin not in referenced and _discard(path, cutoff):
+            _remove_derived(content_digest(chemin))
+            removed += 1
+
+    abandoned = 0
+    tmp_dir = os.path.join(root, 'tmp')
+    for name in os.listdir(tmp_dir) if os.path.isdir(tmp_dir) else ():
+        path = os.path.join(tmp_dir, name)
+        if os.stat(path).st_mtime < cutoff:
+            os.remove(path)
+            abandoned += 1
+    return removed, abandoned
+
+
+def _discard(path, cutoff):
+    trash = path + '.sweep'
+    try:
+        os.replace(path, trash)
+    except FileNotFoundError:
+        return False
+    if os.stat(trash).st_mtime >= cutoff:
+        # Réécrit par un envoi concurrent depuis l'inventaire : le contenu est remis en place
+        os.replace(trash, path)
+        return False
+    os.remove(trash)
+    return True
+
+
+def _remove_derived(key):
+    derived_root = os.path.join(store_root(), 'derived')
+    if not os.path.isdir(derived_root):
+        return
+    for kind in os.listdir(derived_root):
+        directory = os.path.dirname(derived_path(key, kind))
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith(key):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+
+@cartes_store_cli.command('sweep')
+@click.option('--grace', type=int, default=None, help="Âge minimal (secondes) des fichiers non référencés à supprimer.")
+def sweep_command(grace):
+    """Supprime les fichiers de cartes qui ne sont plus référencés (à planifier périodiquement)."""
+    removed, abandoned = sweep_unreferenced(grace)
+    click.echo(f"{removed} contenus supprimés, {abandoned} temporaires abandonnés supprimés")
@@ -0,0 +1,130 @@
+# services/carte_tiles.py
+import functools
+import math
+import os
+
+from flask import current_app
+
+from services.carte_images import DEFAULT_WAIT, Image, get_derivative_pool
+from services.carte_storage import atomic_write, content_key, derived_path, resolve_path
+
+TILE_SIZE = 256
+
+# Format des tuiles selon celui de l'original, et couleur de remplissage des tuiles de bord
+_TILE_FORMATS = {
+    'JPEG': ('jpg', 'RGB', (255, 255, 255)),
+    'PNG': ('png', 'RGBA', (0, 0, 0, 0)),
+}
+
+# Fichier témoin d'un niveau entièrement découpé
+_LEVEL_DONE = 'complete'
+
+
+class TilesUnavailable(RuntimeError):
+    """Tuiles impossibles à produire (Pillow absent ou format d'image non pris en charge)."""
+
+
+@functools.lru_cache(maxsize=1024)
+def _pyramid(source, key):
+    # Seul l'en-tête est lu : Image.open ne décode pas les pixels
+    with Image.open(source) as image:
+        width, height = image.size
+        image_format = image.format
+    if image_format not in _TILE_FORMATS:
+        raise TilesUnavailable(f"Format d'image non pris en charge : {image_format}")
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': TILE_SIZE,
+        'max_zoom': max(0, math.ceil(math.log2(max(width, height) / TILE_SIZE))),
+        'format': _TILE_FORMATS[image_format][0],
+    }
+
+
+def tile_pyramid(chemin):
+    """
+    Géométrie de la pyramide de tuiles d'une carte : dimensions, taille des tuiles, niveau maximal.
+
+    Au niveau `max_zoom` l'image est à pleine résolution ; chaque niveau inférieur la divise par deux,
+    jusqu'au niveau 0 qui tient dans une tuile. Le résultat est mémorisé par contenu.
+    Lève FileNotFoundError si le fichier manque, TilesUnavailable si l'image ne peut être découpée.
+    """
+    if Image is None:
+        raise TilesUnavailable("Pillow n'est pas installé")
+    source = resolve_path(chemin)
+    key = content_key(chemin)
+    if key is None or not os.path.exists(source):
+        raise FileNotFoundError(source)
+    return dict(_pyramid(source, key))
+
+
+def level_size(pyramid, z):
+    scale = 2 ** (pyramid['max_zoom'] - z)
+    return math.ceil(pyramid['width'] / scale), math.ceil(pyramid['height'] / scale)
+
+
+def level_tiles(pyramid, z):
+    """Nombre de colonnes et de lignes de tuiles au niveau `z`."""
+    width, height = level_size(pyramid, z)
+    return math.ceil(width / TILE_SIZE), math.ceil(height / TILE_SIZE)
+
+
+def _tile_file(directory, z, x, y, extension):
+    return os.path.join(directory, str(z), str(x), f"{y}.{extension}")
+
+
+def render_level(source, directory, z, pyramid):
+    """
+    Découpe tout le niveau `z` en une passe : l'original est décodé et réduit une seule fois,
+    puis chaque tuile est écrite atomiquement. Les tuiles de bord sont complétées à 256 px.
+    """
+    width, height = level_size(pyramid, z)
+    columns, rows = level_tiles(pyramid, z)
+    with Image.open(source) as image:
+        extension, mode, fill = _TILE_FORMATS[image.format]
+        image_format = image.format
+        if image_format == 'JPEG':
+            # Décodage directement à l'échelle 1/2, 1/4 ou 1/8 la plus proche
+            image.draft('RGB', (width, height))
+        level = image.convert(mode) if image.mode != mode else image
+        if level.size != (width, height):
+            level = level.resize((width, height), Image.Resampling.LANCZOS)
+        for x in range(columns):
+            for y in range(rows):
+                tile = level.crop((x * TILE_SIZE, y * TILE_SIZE,
+                                   min((x + 1) * TILE_SIZE, width), min((y + 1) * TILE_SIZE, height)))
+                if tile.size != (TILE_SIZE, TILE_SIZE):
+                    padded = Image.new(mode, (TILE_SIZE, TILE_SIZE), fill)
+                    padded.paste(tile, (0, 0))
+                    tile = padded
+                atomic_write(_tile_file(directory, z, x, y, extension),
+                             lambda tmp: tile.save(tmp, format=image_format))
+    atomic_write(os.path.join(directory, str(z), _LEVEL_DONE), lambda tmp: None)
+
+
+def carte_tile_path(chemin, z, x, y, timeout=None):
+    """
+    Chemin disque de la tuile z/x/y d'une carte, ou None si elle est hors de la pyramide.
+
+    Une tuile absente du cache disque déclenche la découpe de tout son niveau dans le pool
+    des fichiers dérivés (une seule découpe par niveau, même sous requêtes concurrentes),
+    attendue au plus `timeout` secondes. Lève TimeoutError au-delà.
+    """
+    pyramid = tile_pyramid(chemin)
+    if not 0 <= z <= pyramid['max_zoom']:
+        return None
+    columns, rows = level_tiles(pyramid, z)
+    if not (0 <= x < columns and 0 <= y < rows):
+        return None
+    directory = derived_path(content_key(chemin), 'tiles')
+    path = _tile_file(directory, z, x, y, pyramid['format'])
+    if os.path.exists(path):
+        return path
+    if timeout is None:
+        timeout = current_app.config.get('CARTES_DERIVATIVE_WAIT', DEFAULT_WAIT)
+    done = os.path.join(directory, str(z), _LEVEL_DONE)
+    if os.path.exists(done):
+        # Niveau découpé dont une tuile a disparu du cache : il est redécoupé
+        os.remove(done)
+    get_derivative_pool().submit(done, render_level, resolve_path(chemin), directory, z, pyramid).result(timeout)
+    return path
@@ -0,0 +1,71 @@
+# services/carte_upload.py
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from services.carte_storage import CHUNK_SIZE, ContentWriter
+
+# Taille maximale d'un champ texte du formulaire, et nombre maximal de parties
+MAX_FIELD_SIZE = 64 * 1024
+MAX_PARTS = 20
+
+
+class UploadError(ValueError):
+    """Corps multipart invalide pour un envoi de carte en flux."""
+
+
+def read_streaming_upload(stream, content_type, file_field='file', chunk_size=CHUNK_SIZE):
+    """
+    Lit un corps multipart/form-data au fil de l'eau ; retourne (champs, nom du fichier, ContentWriter).
+
+    Le flux est lu par blocs de `chunk_size` octets et passé au décodeur incrémental de Werkzeug :
+    les octets de la partie `file_field` sont écrits (et hachés) directement dans le magasin,
+    sans copie intermédiaire du corps ; seuls les champs texte, bornés, restent en mémoire.
+    Le fichier n'est pas encore rangé : l'appelant valide les champs puis appelle commit ou abort.
+    """
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise UploadError('Un corps multipart/form-data est attendu')
+
+    # Le tampon du décodeur ne garde qu'un bloc et la fin du précédent ; la borne coupe les en-têtes sans fin
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=chunk_size + MAX_FIELD_SIZE,
+                               max_parts=MAX_PARTS)
+    fields = {}
+    filename = None
+    writer = None
+    file_part = part = None
+    buffer = []
+    complete = False
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File) and event.name == file_field and writer is None:
+                    file_part = part = event
+                    filename, writer = event.filename, ContentWriter()
+                elif isinstance(event, (Field, File)):
+                    part, buffer = event, []
+                elif isinstance(event, Data):
+                    if part is file_part:
+                        writer.write(event.data)
+                    else:
+                        buffer.append(event.data)
+                        if sum(len(data) for data in buffer) > MAX_FIELD_SIZE:
+                            raise UploadError(f'Champ {part.name} trop volumineux')
+                        if not event.more_data and isinstance(part, Field):
+                            fields[part.name] = b''.join(buffer).decode('utf-8', 'replace')
+                event = decoder.next_event()
+            complete = isinstance(event, Epilogue)
+            if complete or not chunk:
+                break
+        if not complete:
+            raise UploadError('Corps multipart incomplet')
+        if writer is None:
+            raise UploadError('Aucun fichier fourni')
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    return fields, filename, writer
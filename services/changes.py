@@ -0,0 +1,289 @@
+# services/changes.py
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import db
+from models.site import Site
+from models.batiment import Batiment
+from models.etage import Etage
+from models.baes import Baes
+from models.carte import Carte
+from models.historique_erreur import HistoriqueErreur
+from models.user_site_role import UserSiteRole
+from models.tombstone import Tombstone
+from services.bulk import IN_CHUNK_SIZE, chunked
+from services.hierarchy import scoped_queries
+from templates.TimestampMixin import current_time
+
+# Marge de recouvrement appliquée au curseur : une ligne dont updated_at a été fixé juste
+# avant l'émission du curseur mais committée après reste ainsi visible au poll suivant.
+DEFAULT_OVERLAP_SECONDS = 5
+
+# Durée de conservation des tombstones : un client qui n'a pas synchronisé depuis plus longtemps
+# repart d'une synchronisation complète (sans `since`)
+DEFAULT_TOMBSTONE_DAYS = 30
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _site_of_site(s):
+    return s.id
+
+
+def _site_of_batiment(bat):
+    return bat.site_id
+
+
+def _site_of_etage(e):
+    return e.batiment.site_id if e.batiment else None
+
+
+def _site_of_baes(b):
+    return _site_of_etage(b.etage) if b.etage else None
+
+
+def _site_of_carte(c):
+    if c.site_id is not None:
+        return c.site_id
+    return _site_of_etage(c.etage) if c.etage else None
+
+
+def _site_of_erreur(err):
+    return _site_of_baes(err.baes) if err.baes else None
+
+
+# Modèle -> (type d'entité, site de rattachement, sérialiseur à plat)
+CHANGE_MODELS = {
+    Site: ('sites', _site_of_site,
+           lambda s: {'id': s.id, 'name': s.name}),
+    Batiment: ('batiments', _site_of_batiment,
+               lambda bat: {'id': bat.id, 'name': bat.name, 'polygon_points': bat.polygon_points,
+                            'site_id': bat.site_id}),
+    Etage: ('etages', _site_of_etage,
+            lambda e: {'id': e.id, 'name': e.name, 'batiment_id': e.batiment_id}),
+    Baes: ('baes', _site_of_baes,
+           lambda b: {'id': b.id, 'name': b.name, 'position': b.position, 'etage_id': b.etage_id}),
+    Carte: ('cartes', _site_of_carte,
+            lambda c: {'id': c.id, 'chemin': c.chemin, 'center_lat': c.center_lat,
+                       'center_lng': c.center_lng, 'zoom': c.zoom,
+                       'site_id': c.site_id, 'etage_id': c.etage_id}),
+    HistoriqueErreur: ('historique_erreur', _site_of_erreur,
+                       lambda err: {'id': err.id, 'baes_id': err.baes_id, 'type_erreur': err.type_erreur,
+                                    'is_solved': err.is_solved, 'is_ignored': err.is_ignored,
+                                    'timestamp': err.timestamp.isoformat(), 'occurrences': err.occurrences,
+                                    'last_seen': err.last_seen.isoformat() if err.last_seen else None}),
+}
+
+
+def cursor_from_datetime(dt):
+    """Convertit un instant en curseur entier (microsecondes depuis l'epoch, UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def datetime_from_cursor(cursor):
+    return _EPOCH + timedelta(microseconds=cursor)
+
+
+def cursor_expired(since, tombstone_days=DEFAULT_TOMBSTONE_DAYS):
+    """Vrai si des tombstones postérieurs au curseur ont pu être purgés : le client doit tout resynchroniser."""
+    return bool(since) and datetime_from_cursor(since) < current_time() - timedelta(days=tombstone_days)
+
+
+def collect_changes(user_id, site_ids, since, overlap_seconds=DEFAULT_OVERLAP_SECONDS):
+    """
+    Retourne les lignes de la hiérarchie de l'utilisateur créées, modifiées ou supprimées après `since`.
+
+    Le curseur renvoyé ne décroît jamais ; le client le repasse tel quel au poll suivant.
+    Les lignes de la fenêtre de recouvrement peuvent être renvoyées deux fois : elles
+    s'appliquent de façon idempotente côté client.
+    """
+    now = datetime.now(timezone.utc)
+    since_dt = datetime_from_cursor(since) - timedelta(seconds=overlap_seconds)
+
+    changes = {entity_type: [] for entity_type, _, _ in CHANGE_MODELS.values()}
+    deleted = {entity_type: [] for entity_type, _, _ in CHANGE_MODELS.values()}
+
+    # Sites dont l'accès a été accordé depuis le curseur : leur sous-arbre est envoyé en entier
+    granted = sorted({assoc.site_id for assoc in UserSiteRole.query.filter(
+        UserSiteRole.user_id == user_id,
+        UserSiteRole.created_at > since_dt,
+    )} & set(site_ids))
+    known = [site_id for site_id in site_ids if site_id not in granted]
+
+    if granted:
+        for model, query in scoped_queries(granted).items():
+            entity_type, _, serialize = CHANGE_MODELS[model]
+            changes[entity_type].extend(serialize(row) for row in query.order_by(model.id))
+    if known:
+        for model, query in scoped_queries(known).items():
+            entity_type, _, serialize = CHANGE_MODELS[model]
+            rows = query.filter(model.updated_at > since_dt).order_by(model.id)
+            changes[entity_type].extend(serialize(row) for row in rows)
+
+    # Synchronisation complète (since=0) : le client n'a encore rien, aucune suppression à lui signaler
+    if since and site_ids:
+        tombstones = (Tombstone.query
+                      .filter(Tombstone.created_at > since_dt,
+                              Tombstone.site_id.in_(site_ids),
+                              Tombstone.user_id.is_(None))
+                      .order_by(Tombstone.id))
+        for tombstone in tombstones:
+            deleted[tombstone.entity_type].append(tombstone.entity_id)
+        # Ligne déplacée d'un site de l'utilisateur vers un autre de ses sites : elle reste visible
+        for entity_type, ids in deleted.items():
+            present = {row['id'] for row in changes[entity_type]}
+            if present:
+                deleted[entity_type] = [entity_id for entity_id in ids if entity_id not in present]
+
+    # Retraits d'accès : le site disparaît pour cet utilisateur s'il n'y a plus aucune association
+    revoked = (Tombstone.query
+               .filter(Tombstone.created_at > since_dt,
+                       Tombstone.entity_type == 'user_site_role',
+                       Tombstone.user_id == user_id)) if since else ()
+    for tombstone in revoked:
+        if tombstone.site_id not in site_ids and tombstone.site_id not in deleted['sites']:
+            deleted['sites'].append(tombstone.site_id)
+
+    return {
+        'cursor': max(since, cursor_from_datetime(now)),
+        'changes': changes,
+        'deleted': deleted,
+    }
+
+
+# --- Enregistrement des suppressions ----------------------------------------
+
+def record_deleted(entity_type, rows):
+    """
+    Écrit les tombstones de lignes supprimées hors ORM (DELETE Core), en un INSERT executemany.
+
+    `rows` contient des couples (id de la ligne, site de rattachement). Les suppressions ORM
+    sont tracées par le listener before_flush ; tout DELETE Core sur une table synchronisée
+    doit appeler cette fonction dans sa transaction, sans quoi /changes ne le verrait pas.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    now = current_time()
+    db.session.execute(insert(Tombstone.__table__), [
+        {'entity_type': entity_type, 'entity_id': entity_id, 'site_id': site_id, 'created_at': now, 'updated_at': now}
+        for entity_id, site_id in rows
+    ])
+
+
+def prune_tombstones(older_than_days=DEFAULT_TOMBSTONE_DAYS, batch_size=IN_CHUNK_SIZE):
+    """
+    Supprime les tombstones plus anciens que `older_than_days` jours, par lots d'au plus `batch_size`
+    (une courte transaction par lot). Les curseurs antérieurs sont refusés par /changes (cursor_expired).
+    Retourne le nombre de tombstones supprimés.
+    """
+    cutoff = current_time() - timedelta(days=older_than_days)
+    table = Tombstone.__table__
+    pruned = 0
+    while True:
+        ids = db.session.execute(
+            select(table.c.id).where(table.c.created_at < cutoff)
+            .order_by(table.c.created_at).limit(min(batch_size, IN_CHUNK_SIZE))).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        pruned += len(ids)
+    return pruned
+
+
+def _touch(session, targets):
+    """Avance updated_at des lignes visées ((table, critère), ...), pour qu'elles soient renvoyées au poll suivant."""
+    now = current_time()
+    for table, criterion in targets:
+        session.execute(update(table).where(criterion).values(updated_at=now))
+
+
+def _batiment_subtree(batiment_id):
+    etage_ids = select(Etage.id).where(Etage.batiment_id == batiment_id)
+    return [(Etage.__table__, Etage.__table__.c.batiment_id == batiment_id)] + _etages_subtree(etage_ids)
+
+
+def _etages_subtree(etage_ids):
+    baes_ids = select(Baes.id).where(Baes.etage_id.in_(etage_ids))
+    return [(Baes.__table__, Baes.__table__.c.etage_id.in_(etage_ids)),
+            (Carte.__table__, Carte.__table__.c.etage_id.in_(etage_ids))] + _baes_subtree(baes_ids)
+
+
+def _baes_subtree(baes_ids):
+    return [(HistoriqueErreur.__table__, HistoriqueErreur.__table__.c.baes_id.in_(baes_ids))]
+
+
+def _site_of_batiment_id(session, batiment_id):
+    return session.execute(select(Batiment.site_id).where(Batiment.id == batiment_id)).scalar()
+
+
+def _site_of_etage_id(session, etage_id):
+    return session.execute(select(Batiment.site_id).join(Etage, Etage.batiment_id == Batiment.id)
+                           .where(Etage.id == etage_id)).scalar()
+
+
+# Rattachements modifiables : modèle -> (colonne du parent, site d'un parent, sous-arbre à renvoyer)
+_MOVES = {
+    Batiment: ('site_id', lambda session, site_id: site_id, _batiment_subtree),
+    Etage: ('batiment_id', _site_of_batiment_id, lambda etage_id: _etages_subtree([etage_id])),
+    Baes: ('etage_id', _site_of_etage_id, lambda baes_id: _baes_subtree([baes_id])),
+}
+
+
+def record_baes_moves(etage_ids):
+    """
+    Trace des changements d'étage faits hors ORM (UPDATE Core) ; `etage_ids` associe une BAES à son nouvel étage.
+
+    À appeler avant l'UPDATE, dans sa transaction. Comme pour un déplacement par l'ORM, une BAES
+    passée sur un autre site reçoit un tombstone pour l'ancien et son historique est renvoyé au nouveau.
+    """
+    old_sites, new_sites = {}, {}
+    for chunk in chunked(etage_ids):
+        old_sites.update(db.session.execute(
+            select(Baes.id, Batiment.site_id)
+            .join(Etage, Baes.etage_id == Etage.id)
+            .join(Batiment, Etage.batiment_id == Batiment.id)
+            .where(Baes.id.in_(chunk))).all())
+    for chunk in chunked(set(etage_ids.values())):
+        new_sites.update(db.session.execute(
+            select(Etage.id, Batiment.site_id)
+            .join(Batiment, Etage.batiment_id == Batiment.id)
+            .where(Etage.id.in_(chunk))).all())
+    moved = [(baes_id, old_sites[baes_id]) for baes_id, etage_id in etage_ids.items()
+             if baes_id in old_sites and old_sites[baes_id] != new_sites.get(etage_id)]
+    record_deleted('baes', moved)
+    for chunk in chunked([baes_id for baes_id, _ in moved]):
+        _touch(db.session, _baes_subtree(chunk))
+
+
+@event.listens_for(Session, 'before_flush')
+def _record_tombstones(session, flush_context, instances):
+    for obj in list(session.dirty):
+        move = _MOVES.get(type(obj))
+        if move is None:
+            continue
+        # Ligne rattachée à un autre site : elle disparaît pour les clients de l'ancien, et son
+        # sous-arbre (dont updated_at ne change pas sinon) est renvoyé à ceux du nouveau
+        column, site_of_parent, subtree = move
+        previous = inspect(obj).attrs[column].history.deleted
+        if not previous or previous[0] is None or previous[0] == getattr(obj, column):
+            continue
+        old_site = site_of_parent(session, previous[0])
+        if old_site is not None and old_site != site_of_parent(session, getattr(obj, column)):
+            session.add(Tombstone(entity_type=CHANGE_MODELS[type(obj)][0], entity_id=obj.id, site_id=old_site))
+            _touch(session, subtree(obj.id))
+    for obj in list(session.deleted):
+        if isinstance(obj, UserSiteRole):
+            session.add(Tombstone(entity_type='user_site_role', entity_id=obj.site_id,
+                                  site_id=obj.site_id, user_id=obj.user_id))
+            continue
+        spec = CHANGE_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        entity_type, site_of, _ = spec
+        session.add(Tombstone(entity_type=entity_type, entity_id=obj.id, site_id=site_of(obj)))
@@ -0,0 +1,67 @@
+# services/conditional.py
+import hashlib
+
+from flask import request, make_response
+from sqlalchemy import func, select
+
+from models import db
+from services.pagination import keyset_window
+
+
+def compute_etag(scopes, extra=()):
+    """
+    Calcule un ETag à partir de MAX(updated_at) et COUNT(*) sur chaque périmètre.
+
+    `scopes` est une liste de couples (modèle, requête filtrée) ; tous les agrégats
+    sont évalués en une seule instruction SQL. `extra` ajoute à l'empreinte des valeurs
+    déjà lues par l'appelant. Le chemin et les paramètres de la requête HTTP entrent
+    dans l'empreinte, chaque variante de réponse ayant son ETag.
+    """
+    columns = []
+    for model, query in scopes:
+        columns.append(query.with_entities(func.max(model.updated_at)).scalar_subquery())
+        columns.append(query.with_entities(func.count()).scalar_subquery())
+    row = tuple(db.session.execute(select(*columns)).one()) if columns else ()
+    return _digest(row, extra)
+
+
+def page_etag(query, model, limit, after):
+    """
+    Calcule l'ETag d'une page de collection à partir des seules lignes de la page.
+
+    Seuls (id, updated_at) des `limit + 1` lignes de la fenêtre de pagination par clé sont lus,
+    à partir de l'index de la clé primaire : le coût ne dépend pas de la taille de la collection.
+    La ligne suivant la page entre dans l'empreinte, l'en-tête Link en dépendant.
+    """
+    rows = keyset_window(query.with_entities(model.id, model.updated_at), model.id, limit, after).all()
+    return _digest([value for row in rows for value in row])
+
+
+def _digest(values, extra=()):
+    digest = hashlib.sha1()
+    digest.update(request.path.encode('utf-8'))
+    digest.update(repr(sorted(request.args.items(multi=True))).encode('utf-8'))
+    for value in values:
+        digest.update(b'|')
+        digest.update((value.isoformat() if hasattr(value, 'isoformat') else repr(value)).encode('utf-8'))
+    for value in extra:
+        digest.update(b'|')
+        digest.update(repr(value).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def conditional_response(etag, build):
+    """
+    Retourne 304 si le client possède déjà la version `etag`, sinon la réponse produite par `build()`.
+
+    `build` n'est appelé qu'en cas de changement : la sérialisation est entièrement évitée sur un 304.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        # Le client peut garder la réponse mais doit la revalider à chaque utilisation
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,139 @@
+# services/erreur_coalescing.py
+import threading
+from datetime import timedelta
+
+from flask import current_app
+
+DEFAULT_COALESCE_WINDOW = 300
+
+_create_lock = threading.Lock()
+
+
+class ErreurCoalescer:
+    """
+    Regroupe les répétitions d'une même erreur (baes_id, type_erreur) en une seule ligne.
+
+    Garde en mémoire, pour chaque couple, la dernière erreur ouverte insérée et la date
+    de sa dernière occurrence. Un événement qui survient moins de `window` après cette
+    date incrémente `occurrences` de la ligne existante au lieu d'en créer une nouvelle.
+    La table est propre au processus : après un redémarrage ou dans un autre worker,
+    la première répétition recrée une ligne, qui sert ensuite de point de regroupement.
+
+    Le verrou ne protège que la table : l'écriture en base se fait hors verrou. Un couple dont
+    une nouvelle ligne est en cours d'écriture est réservé (reserve) jusqu'au commit (release) ;
+    seul un lot portant sur un couple réservé attend, les autres s'écrivent en parallèle.
+    """
+
+    def __init__(self, window_seconds=DEFAULT_COALESCE_WINDOW):
+        self.window = timedelta(seconds=window_seconds)
+        self.lock = threading.RLock()
+        self.coalesced = 0
+        self._open = {}
+        self._reserved = set()
+        self._released = threading.Condition(self.lock)
+
+    @property
+    def enabled(self):
+        return self.window > timedelta(0)
+
+    def plan(self, rows):
+        """
+        Répartit les événements entre nouvelles lignes et regroupements.
+
+        Retourne (lignes à insérer avec occurrences/last_seen,
+        {id d'erreur: [nombre, dernière date, premier événement regroupé]}).
+        Les répétitions internes au lot sont regroupées elles aussi.
+        """
+        inserts = []
+        folds = {}
+        pending = {}
+        for row in sorted(rows, key=lambda r: r['timestamp']):
+            key = (row['baes_id'], row['type_erreur'])
+            timestamp = row['timestamp']
+            new = pending.get(key)
+            if new is not None:
+                if self.enabled and timestamp - (new['last_seen'] or new['timestamp']) <= self.window:
+                    new['occurrences'] += 1
+                    new['last_seen'] = max(new['last_seen'] or timestamp, timestamp)
+                    continue
+            else:
+                entry = self._open.get(key)
+                if self.enabled and entry is not None and timestamp - entry[1] <= self.window:
+                    fold = folds.setdefault(entry[0], [0, entry[1], row])
+                    fold[0] += 1
+                    fold[1] = max(fold[1], timestamp)
+                    entry[1] = fold[1]
+                    continue
+            new = {**row, 'occurrences': 1, 'last_seen': None}
+            pending[key] = new
+            inserts.append(new)
+        return inserts, folds
+
+    def reserve(self, rows):
+        """
+        Planifie un lot (voir plan) et réserve les couples dont il insère une nouvelle ligne ;
+        retourne (lignes à insérer, regroupements, couples réservés).
+
+        Si un autre lot écrit une nouvelle ligne pour l'un des couples, attend son commit, pour
+        regrouper sur cette ligne plutôt que d'en créer une seconde. Un lot en attente ne détient
+        aucune réservation : deux lots ne peuvent s'attendre mutuellement.
+        """
+        keys = {(row['baes_id'], row['type_erreur']) for row in rows}
+        with self.lock:
+            while keys & self._reserved:
+                self._released.wait()
+            inserts, folds = self.plan(rows)
+            reserved = {(row['baes_id'], row['type_erreur']) for row in inserts}
+            self._reserved |= reserved
+        return inserts, folds, reserved
+
+    def release(self, reserved, inserted=(), coalesced=0):
+        """Après le commit (ou l'échec) d'un lot : mémorise ses nouvelles lignes et libère ses couples."""
+        with self.lock:
+            for row in inserted:
+                self.register(row['baes_id'], row['type_erreur'], row['id'], row['last_seen'] or row['timestamp'])
+            self.coalesced += coalesced
+            self._reserved -= reserved
+            self._released.notify_all()
+
+    def register(self, baes_id, type_erreur, error_id, last_seen):
+        """Mémorise la ligne ouverte d'un couple, comme cible des répétitions suivantes."""
+        if self.enabled:
+            self._open[(baes_id, type_erreur)] = [error_id, last_seen]
+
+    def forget(self, baes_ids=None, types=None):
+        """
+        Oublie les erreurs ouvertes mémorisées (toutes, ou celles des BAES / types donnés).
+
+        À appeler lorsque des erreurs sont résolues ou ignorées, pour que l'événement
+        suivant ouvre une nouvelle ligne.
+        """
+        with self.lock:
+            if baes_ids is None and types is None:
+                self._open.clear()
+                return
+            baes_ids = set(baes_ids) if baes_ids is not None else None
+            types = set(types) if types is not None else None
+            for key in list(self._open):
+                if (baes_ids is None or key[0] in baes_ids) and (types is None or key[1] in types):
+                    del self._open[key]
+
+    def stats(self):
+        return {
+            'window_seconds': self.window.total_seconds(),
+            'tracked': len(self._open),
+            'coalesced': self.coalesced,
+        }
+
+
+def get_coalescer():
+    """Retourne le regroupeur de l'application courante, créé à la première utilisation."""
+    coalescer = current_app.extensions.get('erreur_coalescer')
+    if coalescer is None:
+        with _create_lock:
+            coalescer = current_app.extensions.get('erreur_coalescer')
+            if coalescer is None:
+                coalescer = ErreurCoalescer(
+                    current_app.config.get('ERREURS_COALESCE_WINDOW', DEFAULT_COALESCE_WINDOW))
+                current_app.extensions['erreur_coalescer'] = coalescer
+    return coalescer
@@ -0,0 +1,139 @@
+# services/erreur_events.py
+import itertools
+import queue
+import threading
+
+from flask import current_app
+
+from models import db
+from models.baes import Baes
+from models.etage import Etage
+from models.batiment import Batiment
+from services.bulk import chunked
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_MAX_SUBSCRIBERS = 16
+
+_create_lock = threading.Lock()
+
+
+class Subscription:
+    """
+    Abonnement d'un flux SSE aux événements de certains sites, avec un tampon borné.
+
+    Si le client ne consomme pas assez vite et que le tampon est plein, les événements suivants
+    sont perdus et `overflowed` est levé : le flux en informe le client, qui doit se resynchroniser.
+    """
+
+    def __init__(self, site_ids, maxsize):
+        self.site_ids = frozenset(site_ids)
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Retourne le prochain événement, ou None si aucun n'arrive avant `timeout` secondes."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ErreurEventBroker:
+    """
+    Diffusion en mémoire des événements d'erreur vers les flux SSE ouverts sur ce processus.
+
+    Les chemins d'ingestion et de résolution publient après leur commit ; chaque abonnement
+    ne reçoit que les événements des sites qu'il suit. Le diffuseur est propre au processus :
+    un flux ne reçoit que les événements écrits par son propre worker.
+    Chaque flux occupe un thread du worker pendant toute sa durée : au plus `max_subscribers`
+    abonnements sont acceptés, pour laisser des threads aux autres requêtes.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, site_ids):
+        """Ouvre un abonnement ; retourne None si le nombre maximal de flux est atteint."""
+        subscription = Subscription(site_ids, self.buffer_size)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def publish(self, site_id, kind, data):
+        """Transmet un événement du site donné aux abonnements concernés (sans jamais bloquer)."""
+        with self._lock:
+            targets = [s for s in self._subscriptions if site_id in s.site_ids]
+            event = (next(self._ids), kind, data)
+        for subscription in targets:
+            subscription.offer(event)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'max_subscribers': self.max_subscribers,
+                'rejected': self.rejected,
+                'overflowed': sum(1 for s in self._subscriptions if s.overflowed),
+            }
+
+
+def get_event_broker():
+    """Retourne le diffuseur de l'application courante, créé à la première utilisation."""
+    broker = current_app.extensions.get('erreur_event_broker')
+    if broker is None:
+        with _create_lock:
+            broker = current_app.extensions.get('erreur_event_broker')
+            if broker is None:
+                config = current_app.config
+                broker = ErreurEventBroker(config.get('ERREURS_STREAM_BUFFER', DEFAULT_BUFFER_SIZE),
+                                           config.get('ERREURS_STREAM_MAX', DEFAULT_MAX_SUBSCRIBERS))
+                current_app.extensions['erreur_event_broker'] = broker
+    return broker
+
+
+def _sites_of_baes(baes_ids):
+    sites = {}
+    for chunk in chunked(set(baes_ids)):
+        sites.update(db.session.query(Baes.id, Batiment.site_id)
+                     .join(Etage, Baes.etage_id == Etage.id)
+                     .join(Batiment, Etage.batiment_id == Batiment.id)
+                     .filter(Baes.id.in_(chunk)))
+    return sites
+
+
+def publish_erreurs(kind, erreurs):
+    """
+    Publie des erreurs (dicts portant au moins baes_id) sous le type d'événement `kind`.
+
+    Le site de chaque BAES est résolu par une requête IN par tranche, et seulement
+    si au moins un flux est ouvert sur ce processus.
+    """
+    broker = get_event_broker()
+    if not erreurs or not broker.has_subscribers():
+        return
+    sites = _sites_of_baes(erreur['baes_id'] for erreur in erreurs)
+    for erreur in erreurs:
+        site_id = sites.get(erreur['baes_id'])
+        if site_id is not None:
+            broker.publish(site_id, kind, dict(erreur, site_id=site_id))
@@ -0,0 +1,99 @@
+# services/erreur_export.py
+import csv
+import io
+
+from sqlalchemy import null, select
+
+from models import db
+from models.site import Site
+from models.batiment import Batiment
+from models.etage import Etage
+from models.baes import Baes
+from models.historique_erreur import HistoriqueErreur
+from models.historique_erreur_archive import HistoriqueErreurArchive
+
+FORMATS = ('csv', 'ndjson')
+
+# Colonnes exportées, dans l'ordre de l'en-tête CSV
+COLUMNS = ('id', 'timestamp', 'last_seen', 'occurrences', 'type_erreur', 'is_solved', 'is_ignored',
+           'baes_id', 'baes_name', 'etage_id', 'etage_name', 'batiment_id', 'batiment_name',
+           'site_id', 'site_name', 'archived_at')
+
+# Lignes lues par aller-retour sur le curseur serveur, et par morceau de réponse
+DEFAULT_YIELD_PER = 1000
+
+
+def _statement(model, site_id, start, end):
+    if model is HistoriqueErreurArchive:
+        # L'archive porte son rattachement : les erreurs des BAES supprimées depuis restent exportées
+        statement = (select(model.id, model.timestamp, model.last_seen, model.occurrences, model.type_erreur,
+                            model.is_solved, model.is_ignored, model.baes_id, model.baes_name, model.etage_id,
+                            model.etage_name, model.batiment_id, model.batiment_name, model.site_id,
+                            model.site_name, model.archived_at)
+                     .where(model.site_id == site_id))
+    else:
+        statement = (select(model.id, model.timestamp, model.last_seen, model.occurrences, model.type_erreur,
+                            model.is_solved, model.is_ignored, model.baes_id, Baes.name, Baes.etage_id, Etage.name,
+                            Etage.batiment_id, Batiment.name, Batiment.site_id, Site.name, null())
+                     .join(Baes, model.baes_id == Baes.id)
+                     .join(Etage, Baes.etage_id == Etage.id)
+                     .join(Batiment, Etage.batiment_id == Batiment.id)
+                     .join(Site, Batiment.site_id == Site.id)
+                     .where(Site.id == site_id))
+    statement = statement.order_by(model.id)
+    if start is not None:
+        statement = statement.where(model.timestamp >= start)
+    if end is not None:
+        statement = statement.where(model.timestamp < end)
+    return statement
+
+
+def iter_export_rows(site_id, start=None, end=None, include_archive=True, yield_per=DEFAULT_YIELD_PER):
+    """
+    Parcourt l'historique d'un site (archive comprise), joint aux noms de BAES, étage, bâtiment et site.
+
+    Chaque requête est lue par un curseur côté serveur (`yield_per`) : seules `yield_per` lignes
+    sont en mémoire à la fois, quel que soit le volume exporté. Les erreurs archivées sont émises
+    d'abord, puis l'historique courant, chacun dans l'ordre des ids.
+    """
+    models = (HistoriqueErreurArchive, HistoriqueErreur) if include_archive else (HistoriqueErreur,)
+    for model in models:
+        result = db.session.execute(_statement(model, site_id, start, end).execution_options(yield_per=yield_per))
+        try:
+            for row in result:
+                yield row
+        finally:
+            result.close()
+
+
+def _text(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def iter_csv(rows, chunk_rows=DEFAULT_YIELD_PER):
+    """Encode les lignes en CSV, par morceaux de `chunk_rows` lignes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow([_text(value) for value in row])
+        pending += 1
+        if pending == chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, dumps, chunk_rows=DEFAULT_YIELD_PER):
+    """Encode les lignes en NDJSON (un objet par ligne), par morceaux de `chunk_rows` lignes."""
+    lines = []
+    for row in rows:
+        lines.append(dumps(dict(zip(COLUMNS, (_text(value) for value in row)))))
+        if len(lines) == chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
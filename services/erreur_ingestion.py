@@ -0,0 +1,166 @@
+# services/erreur_ingestion.py
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, update
+
+from models import db
+from models.baes import Baes
+from models.historique_erreur import HistoriqueErreur, error_types
+from services.baes_status import record_errors
+from services.bulk import chunked
+from services.erreur_coalescing import get_coalescer
+from services.erreur_events import publish_erreurs
+from services.erreur_stats import rolled_up_erreur_id_column
+from templates.TimestampMixin import current_time
+
+_ERROR_TYPES = frozenset(error_types)
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return current_time()
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def validate_events(events):
+    """
+    Valide un lot d'événements d'erreur en une passe et résout les BAES.
+
+    Chaque événement désigne sa BAES par `baes_id` ou par `baes_name`. Les ids et les noms
+    du lot sont vérifiés ensemble (une requête IN par tranche), pas événement par événement.
+    Retourne (lignes prêtes à insérer, rejets [{'index', 'error'}]).
+    """
+    rejected = []
+    candidates = []
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            rejected.append({'index': index, 'error': 'Événement invalide'})
+            continue
+        if event.get('type_erreur') not in _ERROR_TYPES:
+            rejected.append({'index': index, 'error': f"type_erreur doit valoir : {', '.join(error_types)}"})
+            continue
+        baes_id, baes_name = event.get('baes_id'), event.get('baes_name')
+        # bool est une sous-classe de int : true ne doit pas désigner la BAES 1
+        if isinstance(baes_id, bool):
+            rejected.append({'index': index, 'error': 'baes_id doit être un entier'})
+            continue
+        if not isinstance(baes_id, int) and not isinstance(baes_name, str):
+            rejected.append({'index': index, 'error': 'baes_id ou baes_name est requis'})
+            continue
+        try:
+            timestamp = _parse_timestamp(event.get('timestamp'))
+        except (TypeError, ValueError):
+            rejected.append({'index': index, 'error': 'timestamp doit être une date ISO 8601'})
+            continue
+        candidates.append((index, baes_id if isinstance(baes_id, int) else None, baes_name,
+                           event['type_erreur'], timestamp))
+
+    ids = {c[1] for c in candidates if c[1] is not None}
+    names = {c[2] for c in candidates if c[1] is None}
+    known_ids = set()
+    for chunk in chunked(ids):
+        known_ids.update(baes_id for (baes_id,) in db.session.query(Baes.id).filter(Baes.id.in_(chunk)))
+    ids_by_name = {}
+    for chunk in chunked(names):
+        ids_by_name.update(db.session.query(Baes.name, Baes.id).filter(Baes.name.in_(chunk)))
+
+    rows = []
+    for index, baes_id, baes_name, type_erreur, timestamp in candidates:
+        if baes_id is None:
+            baes_id = ids_by_name.get(baes_name)
+        elif baes_id not in known_ids:
+            baes_id = None
+        if baes_id is None:
+            rejected.append({'index': index, 'error': 'BAES non trouvée'})
+            continue
+        rows.append({'baes_id': baes_id, 'type_erreur': type_erreur, 'timestamp': timestamp})
+
+    rejected.sort(key=lambda r: r['index'])
+    return rows, rejected
+
+
+def insert_events(rows):
+    """
+    Écrit les lignes validées : les répétitions sont regroupées, le reste est inséré.
+
+    Les regroupements sont appliqués par un UPDATE exécuté en executemany et les nouvelles
+    lignes par un unique INSERT Core (executemany, RETURNING des ids pour le regroupeur).
+    L'état courant des BAES (baes_status) est mis à jour dans la même transaction. Le regroupeur
+    n'est verrouillé que pour planifier le lot puis, après le commit, mémoriser ses nouvelles
+    lignes : l'aller-retour en base ne bloque pas les autres lots du worker.
+    Les nouvelles erreurs sont publiées aux flux SSE (/erreurs/stream) après le commit.
+    Retourne (lignes insérées, événements regroupés dans des lignes existantes).
+    """
+    if not rows:
+        return 0, 0
+    coalescer = get_coalescer()
+    inserts, folds, reserved = coalescer.reserve(rows)
+    try:
+        inserts = _write(inserts, folds)
+    except Exception:
+        # La table en mémoire a pu diverger de la base : on oublie les BAES concernées
+        coalescer.forget(baes_ids={row['baes_id'] for row in rows})
+        coalescer.release(reserved)
+        raise
+    coalescer.release(reserved, inserts, len(rows) - len(inserts))
+    try:
+        publish_erreurs('erreur', [_event(row) for row in inserts])
+    except Exception as e:
+        # Les erreurs sont écrites : un échec de diffusion ne doit pas faire échouer l'ingestion
+        current_app.logger.error(f"Publication des erreurs impossible : {e}")
+    return len(inserts), len(rows) - len(inserts)
+
+
+def _event(row):
+    return {
+        'id': row['id'],
+        'baes_id': row['baes_id'],
+        'type_erreur': row['type_erreur'],
+        'timestamp': row['timestamp'].isoformat(),
+        'occurrences': row['occurrences'],
+        'last_seen': row['last_seen'].isoformat() if row['last_seen'] else None,
+    }
+
+
+def _write(inserts, folds):
+    table = HistoriqueErreur.__table__
+    now = current_time()
+    if folds:
+        # Une erreur résolue ou ignorée entre-temps (par ce worker ou un autre), ou déjà comptée
+        # dans les tables de cumul, ne reçoit plus de répétitions : celles-ci rouvrent une nouvelle ligne.
+        still_open = set()
+        for chunk in chunked(folds):
+            still_open.update(erreur_id for (erreur_id,) in db.session.execute(
+                select(table.c.id).where(table.c.id.in_(chunk),
+                                         table.c.id > rolled_up_erreur_id_column(),
+                                         table.c.is_solved.is_(False),
+                                         table.c.is_ignored.is_(False))))
+        for erreur_id in [erreur_id for erreur_id in folds if erreur_id not in still_open]:
+            count, last_seen, first = folds.pop(erreur_id)
+            inserts.append({**first, 'occurrences': count,
+                            'last_seen': last_seen if count > 1 else None})
+    if folds:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('erreur_id'))
+            .values(occurrences=table.c.occurrences + bindparam('repetitions'),
+                    last_seen=bindparam('vu_le'),
+                    updated_at=now),
+            [{'erreur_id': erreur_id, 'repetitions': count, 'vu_le': last_seen}
+             for erreur_id, (count, last_seen, _) in folds.items()],
+        )
+    if inserts:
+        result = db.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            [{**row, 'is_solved': False, 'is_ignored': False, 'created_at': now, 'updated_at': now}
+             for row in inserts],
+        )
+        for row, (erreur_id,) in zip(inserts, result.all()):
+            row['id'] = erreur_id
+    record_errors(inserts, [(first['baes_id'], last_seen) for _, last_seen, first in folds.values()])
+    db.session.commit()
+    return inserts
@@ -0,0 +1,240 @@
+# services/erreur_queue.py
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db
+from services.erreur_ingestion import insert_events, validate_events
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 50000
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 1.0
+DEFAULT_DEAD_LETTER_FILE = 'erreurs_dead_letter.jsonl'
+
+_create_lock = threading.Lock()
+
+erreur_queue_cli = AppGroup('erreurs-queue', help="Écriture différée des erreurs ingérées.")
+
+
+def dead_letter_path(app):
+    """Fichier des lots abandonnés par l'écriture différée (ERREURS_DEAD_LETTER_FILE, sinon dans instance/)."""
+    return app.config.get('ERREURS_DEAD_LETTER_FILE') or os.path.join(app.instance_path, DEFAULT_DEAD_LETTER_FILE)
+
+
+class ErreurWriteQueue:
+    """
+    File d'écriture différée des événements d'erreur validés.
+
+    Les requêtes HTTP déposent leurs lignes dans une file bornée ; un thread d'écriture
+    la vide par micro-lots (au plus `batch_size` lignes ou toutes les `flush_interval`
+    secondes) vers historique_erreur. La latence des passerelles ne dépend ainsi plus
+    de celle des commits SQL Server.
+    Un lot en échec est réessayé `retries` fois, avec un délai doublé à chaque tentative ;
+    s'il échoue encore, il est ajouté (une ligne JSON par événement) au fichier `dead_letter`,
+    à rejouer par `flask erreurs-queue replay` : le client ayant déjà reçu un 202, rien n'est jeté.
+    La file est propre au processus : les événements en attente sont perdus si le
+    worker est tué brutalement (ils sont écrits lors d'un arrêt normal).
+    """
+
+    def __init__(self, app, maxsize=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY, dead_letter=None):
+        self.app = app
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dead_letter = dead_letter or dead_letter_path(app)
+        self.written = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._put_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='erreur-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def submit(self, rows):
+        """Dépose un lot entier dans la file ; retourne False si elle n'a pas la place."""
+        with self._put_lock:
+            if self._queue.qsize() + len(rows) > self.maxsize:
+                return False
+            for row in rows:
+                self._queue.put_nowait(row)
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=10):
+        """Arrête le thread d'écriture après avoir vidé la file."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        """Écrit un lot, en le réessayant avec un délai croissant ; abandonné au fichier dead_letter sinon."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                # L'attente est écourtée à l'arrêt, pour tenir dans le délai de stop()
+                self._stopping.wait(self.retry_delay * 2 ** (attempt - 1))
+            with self.app.app_context():
+                try:
+                    insert_events(batch)
+                    self.written += len(batch)
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning("Écriture différée de %d erreurs impossible (tentative %d/%d) : %s",
+                                   len(batch), attempt + 1, self.retries + 1, e)
+                finally:
+                    db.session.remove()
+        self._dead_letter(batch)
+
+    def _dead_letter(self, batch):
+        lines = ''.join(json.dumps({'baes_id': row['baes_id'], 'type_erreur': row['type_erreur'],
+                                    'timestamp': row['timestamp'].isoformat()}) + '\n'
+                        for row in batch)
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter) or '.', exist_ok=True)
+            # Un seul write en mode ajout : les lignes de plusieurs workers ne s'entremêlent pas
+            with open(self.dead_letter, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            self.dead_lettered += len(batch)
+            logger.error("%d erreurs non écrites reportées dans %s", len(batch), self.dead_letter)
+        except OSError as e:
+            self.failed += len(batch)
+            logger.critical("%d erreurs perdues, écriture de %s impossible (%s) : %s",
+                            len(batch), self.dead_letter, e, lines)
+
+    def stats(self):
+        return {
+            'queued': self.qsize(),
+            'maxsize': self.maxsize,
+            'written': self.written,
+            'retried': self.retried,
+            'dead_lettered': self.dead_lettered,
+            'failed': self.failed,
+        }
+
+
+def get_write_queue():
+    """
+    Retourne la file de l'application courante, créée et démarrée à la première utilisation.
+
+    Le démarrage paresseux garantit que le thread est lancé dans chaque worker, après le fork.
+    """
+    write_queue = current_app.extensions.get('erreur_write_queue')
+    if write_queue is None:
+        with _create_lock:
+            write_queue = current_app.extensions.get('erreur_write_queue')
+            if write_queue is None:
+                config = current_app.config
+                write_queue = ErreurWriteQueue(
+                    current_app._get_current_object(),
+                    maxsize=config.get('ERREURS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                    batch_size=config.get('ERREURS_QUEUE_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                    flush_interval=config.get('ERREURS_QUEUE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                    retries=config.get('ERREURS_QUEUE_RETRIES', DEFAULT_RETRIES),
+                    retry_delay=config.get('ERREURS_QUEUE_RETRY_DELAY', DEFAULT_RETRY_DELAY),
+                )
+                current_app.extensions['erreur_write_queue'] = write_queue
+                write_queue.start()
+    return write_queue
+
+
+def write_queue_stats():
+    """
+    Statistiques de la file du worker courant, sans la créer : sans écriture différée,
+    aucun thread d'écriture n'est démarré pour les consulter.
+    """
+    config = current_app.config
+    write_queue = current_app.extensions.get('erreur_write_queue')
+    if write_queue is None:
+        stats = {'queued': 0, 'maxsize': config.get('ERREURS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                 'written': 0, 'retried': 0, 'dead_lettered': 0, 'failed': 0}
+    else:
+        stats = write_queue.stats()
+    return {'enabled': bool(config.get('ERREURS_WRITE_BEHIND', False)), **stats}
+
+
+def replay_dead_letters(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Réinjecte les événements du fichier dead_letter ; retourne (écrits, regroupés, rejetés).
+
+    Le fichier est d'abord renommé, pour que les workers en démarrent un nouveau pendant le rejeu.
+    Les événements sont revalidés (une BAES supprimée entre-temps est rejetée) puis écrits par lots ;
+    en cas d'échec, les lots non écrits sont remis dans le fichier dead_letter.
+    """
+    if not os.path.exists(path):
+        return 0, 0, 0
+    replaying = f"{path}.{os.getpid()}.replay"
+    os.replace(path, replaying)
+    with open(replaying, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    inserted = coalesced = rejected = 0
+    for start in range(0, len(events), batch_size):
+        try:
+            rows, refused = validate_events(events[start:start + batch_size])
+            written, folded = insert_events(rows)
+        except Exception:
+            db.session.rollback()
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(event) + '\n' for event in events[start:]))
+            os.remove(replaying)
+            raise
+        inserted += written
+        coalesced += folded
+        rejected += len(refused)
+    os.remove(replaying)
+    return inserted, coalesced, rejected
+
+
+@erreur_queue_cli.command('replay')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Nombre d'événements par transaction.")
+def replay_command(batch_size):
+    """Rejoue les événements abandonnés par l'écriture différée (fichier ERREURS_DEAD_LETTER_FILE)."""
+    inserted, coalesced, rejected = replay_dead_letters(dead_letter_path(current_app), batch_size)
+    click.echo(f"{inserted} erreurs écrites, {coalesced} regroupées, {rejected} rejetées")
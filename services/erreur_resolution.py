@@ -0,0 +1,100 @@
+# services/erreur_resolution.py
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db
+from models.baes import Baes
+from models.etage import Etage
+from models.historique_erreur import HistoriqueErreur, error_types
+from services.baes_status import refresh_open_errors
+from services.bulk import chunked
+from services.erreur_coalescing import get_coalescer
+from services.erreur_events import publish_erreurs
+from templates.TimestampMixin import current_time
+
+# Périmètres acceptés par close_erreurs
+SCOPES = ('baes_id', 'baes_ids', 'etage_id', 'batiment_id', 'ids')
+FLAGS = ('is_solved', 'is_ignored')
+
+
+def _scope_criteria(scope, value):
+    """Critères WHERE désignant les erreurs d'un périmètre, en sous-requêtes sur baes et etages."""
+    table = HistoriqueErreur.__table__
+    if scope == 'baes_id':
+        return [[table.c.baes_id == value]]
+    if scope == 'etage_id':
+        return [[table.c.baes_id.in_(select(Baes.id).where(Baes.etage_id == value))]]
+    if scope == 'batiment_id':
+        return [[table.c.baes_id.in_(select(Baes.id)
+                                     .join(Etage, Baes.etage_id == Etage.id)
+                                     .where(Etage.batiment_id == value))]]
+    # Listes explicites : une instruction par tranche pour rester sous la limite de paramètres
+    column = table.c.baes_id if scope == 'baes_ids' else table.c.id
+    return [[column.in_(chunk)] for chunk in chunked(set(value))]
+
+
+def close_erreurs(flag, scope, value, types=None):
+    """
+    Résout (`is_solved`) ou ignore (`is_ignored`) toutes les erreurs ouvertes d'un périmètre.
+
+    Le périmètre est une BAES, une liste de BAES, un étage, un bâtiment ou une liste d'ids ; `types` restreint
+    éventuellement aux types d'erreur donnés. Chaque périmètre est traité par un seul
+    UPDATE ... WHERE (une instruction par tranche de 1000 ids pour une liste), dont la clause
+    RETURNING fournit les lignes touchées sans les charger au préalable. baes_status est
+    recalculé dans la même transaction ; le regroupeur et les flux SSE sont prévenus après le commit.
+    Retourne (nombre d'erreurs fermées, nombre de BAES concernées).
+    """
+    table = HistoriqueErreur.__table__
+    now = current_time()
+    closed = []
+    for criteria in _scope_criteria(scope, value):
+        statement = (update(table)
+                     .where(*criteria, table.c.is_solved.is_(False), table.c.is_ignored.is_(False))
+                     .values({flag: True, 'updated_at': now})
+                     .returning(table.c.id, table.c.baes_id, table.c.type_erreur))
+        if types:
+            statement = statement.where(table.c.type_erreur.in_(types))
+        closed.extend(db.session.execute(statement).all())
+    baes_ids = {row.baes_id for row in closed}
+    refresh_open_errors(baes_ids)
+    db.session.commit()
+
+    if closed:
+        get_coalescer().forget(baes_ids=baes_ids, types=types or None)
+        try:
+            publish_erreurs('statut', [
+                {'id': row.id, 'baes_id': row.baes_id, 'type_erreur': row.type_erreur,
+                 'is_solved': flag == 'is_solved', 'is_ignored': flag == 'is_ignored'}
+                for row in closed
+            ])
+        except Exception as e:
+            current_app.logger.error(f"Publication des erreurs impossible : {e}")
+    return len(closed), len(baes_ids)
+
+
+def parse_close_request(data):
+    """
+    Valide le corps d'une fermeture groupée ; retourne (flag, scope, value, types) ou lève ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Un objet JSON est attendu")
+    flags = [flag for flag in FLAGS if data.get(flag) is True]
+    if len(flags) != 1:
+        raise ValueError("Exactement un des champs is_solved ou is_ignored doit valoir true")
+    scopes = [scope for scope in SCOPES if data.get(scope) is not None]
+    if len(scopes) != 1:
+        raise ValueError(f"Exactement un périmètre est requis parmi : {', '.join(SCOPES)}")
+    scope = scopes[0]
+    value = data[scope]
+    # bool est une sous-classe de int : true ne doit pas désigner l'id 1
+    if scope in ('ids', 'baes_ids'):
+        if not isinstance(value, list) or not value \
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in value):
+            raise ValueError(f"{scope} doit être une liste non vide d'entiers")
+    elif not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{scope} doit être un entier")
+    types = data.get('types')
+    if types is not None:
+        if not isinstance(types, list) or not types or any(t not in error_types for t in types):
+            raise ValueError(f"types doit être une liste parmi : {', '.join(error_types)}")
+    return flags[0], scope, value, types
@@ -0,0 +1,108 @@
+# services/erreur_retention.py
+from collections import Counter
+from datetime import timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, delete, insert, literal, or_, select
+
+from models import db
+from models.baes import Baes
+from models.etage import Etage
+from models.batiment import Batiment
+from models.site import Site
+from models.historique_erreur import HistoriqueErreur
+from models.historique_erreur_archive import HistoriqueErreurArchive
+from services.baes_status import record_archived
+from services.bulk import IN_CHUNK_SIZE
+from services.changes import DEFAULT_TOMBSTONE_DAYS, prune_tombstones, record_deleted
+from services.erreur_stats import rolled_up_erreur_id
+from templates.TimestampMixin import current_time
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_ARCHIVE_BATCH = 1000
+
+# Colonnes recopiées telles quelles dans l'archive
+_ARCHIVED_COLUMNS = ('id', 'baes_id', 'type_erreur', 'is_solved', 'is_ignored', 'timestamp', 'occurrences',
+                     'last_seen', 'created_at', 'updated_at')
+# Rattachement de la BAES au moment de l'archivage
+_PLACEMENT_COLUMNS = ('baes_name', 'etage_id', 'etage_name', 'batiment_id', 'batiment_name', 'site_id', 'site_name')
+
+erreur_retention_cli = AppGroup('erreurs-retention', help="Rétention et archivage de l'historique des erreurs.")
+
+
+def archive_closed_errors(older_than_days=None, batch_size=None, max_batches=None):
+    """
+    Déplace vers historique_erreur_archive les erreurs résolues ou ignorées depuis plus de `older_than_days` jours.
+
+    Les erreurs sont traitées par lots d'au plus `batch_size` lignes, chacun dans sa propre courte
+    transaction (INSERT ... SELECT vers l'archive puis DELETE par id), pour ne jamais verrouiller
+    longtemps la table chaude. La sélection s'appuie sur l'index de updated_at, date de la fermeture.
+    Seules les erreurs déjà comptées dans les cumuls de /erreurs/stats sont archivées, pour que
+    les statistiques restent exactes. Chaque lot met à jour baes_status et laisse des tombstones
+    pour la synchronisation incrémentale. Retourne le nombre d'erreurs archivées.
+    """
+    config = current_app.config
+    if older_than_days is None:
+        older_than_days = config.get('ERREURS_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    if batch_size is None:
+        batch_size = config.get('ERREURS_ARCHIVE_BATCH', DEFAULT_ARCHIVE_BATCH)
+    # Les ids d'un lot sont envoyés en une seule liste IN
+    batch_size = min(batch_size, IN_CHUNK_SIZE)
+    cutoff = current_time() - timedelta(days=older_than_days)
+
+    table = HistoriqueErreur.__table__
+    archive = HistoriqueErreurArchive.__table__
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = db.session.execute(
+            select(table.c.id, table.c.baes_id, Batiment.site_id)
+            .select_from(table)
+            .outerjoin(Baes, table.c.baes_id == Baes.id)
+            .outerjoin(Etage, Baes.etage_id == Etage.id)
+            .outerjoin(Batiment, Etage.batiment_id == Batiment.id)
+            .where(table.c.updated_at < cutoff,
+                   or_(table.c.is_solved.is_(True), table.c.is_ignored.is_(True)),
+                   table.c.id <= rolled_up_erreur_id())
+            .order_by(table.c.updated_at, table.c.id)
+            .limit(batch_size)).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        now = current_time()
+        # Rattachement et noms recopiés : l'export du site reste complet si la BAES est supprimée ensuite
+        db.session.execute(insert(archive).from_select(
+            _ARCHIVED_COLUMNS + ('archived_at',) + _PLACEMENT_COLUMNS,
+            select(*[table.c[name] for name in _ARCHIVED_COLUMNS], literal(now, DateTime(timezone=True)),
+                   Baes.name, Etage.id, Etage.name, Batiment.id, Batiment.name, Site.id, Site.name)
+            .select_from(table)
+            .outerjoin(Baes, table.c.baes_id == Baes.id)
+            .outerjoin(Etage, Baes.etage_id == Etage.id)
+            .outerjoin(Batiment, Etage.batiment_id == Batiment.id)
+            .outerjoin(Site, Batiment.site_id == Site.id)
+            .where(table.c.id.in_(ids))))
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        record_deleted('historique_erreur', [(row.id, row.site_id) for row in rows])
+        record_archived(Counter(row.baes_id for row in rows))
+        db.session.commit()
+        archived += len(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+    return archived
+
+
+@erreur_retention_cli.command('archive')
+@click.option('--days', type=int, default=None, help="Âge minimal (jours) des erreurs fermées à archiver.")
+@click.option('--batch-size', type=int, default=None, help="Nombre d'erreurs par transaction.")
+@click.option('--max-batches', type=int, default=None, help="Nombre maximal de lots pour ce passage.")
+def archive_command(days, batch_size, max_batches):
+    """
+    Archive les erreurs résolues ou ignorées plus anciennes que la rétention (à planifier périodiquement),
+    puis purge les tombstones plus anciens que CHANGES_TOMBSTONE_DAYS, dont ceux des erreurs archivées.
+    """
+    count = archive_closed_errors(days, batch_size, max_batches)
+    click.echo(f"{count} erreurs archivées")
+    pruned = prune_tombstones(current_app.config.get('CHANGES_TOMBSTONE_DAYS', DEFAULT_TOMBSTONE_DAYS))
+    click.echo(f"{pruned} tombstones purgés")
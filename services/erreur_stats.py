@@ -0,0 +1,246 @@
+# services/erreur_stats.py
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, insert, select, update
+
+from models import db
+from models.baes import Baes
+from models.etage import Etage
+from models.batiment import Batiment
+from models.historique_erreur import HistoriqueErreur
+from models.erreur_rollup import ErreurRollupDay, ErreurRollupHour, ErreurRollupState
+from services.bulk import chunked
+from templates.TimestampMixin import current_time
+
+BUCKETS = ('hour', 'day', 'month')
+# Dimension demandée -> colonne renvoyée
+GROUP_BY = {'site': 'site_id', 'batiment': 'batiment_id', 'etage': 'etage_id', 'type_erreur': 'type_erreur'}
+
+DEFAULT_COMPACT_BATCH = 50000
+# Délai entre la lecture du plus grand id visible et l'agrégation jusqu'à cet id : une transaction
+# d'insertion qui détenait alors un id inférieur a eu le temps d'être validée, et ne peut pas
+# être dépassée par le curseur d'agrégation.
+DEFAULT_SAFETY_SECONDS = 5
+
+_STATE_ID = 1
+
+erreur_stats_cli = AppGroup('erreurs-stats', help="Agrégation horaire et journalière de l'historique des erreurs.")
+
+
+class StatsError(ValueError):
+    pass
+
+
+def _as_utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def floor_bucket(value, bucket):
+    """Tronque une date (UTC) au début de son créneau."""
+    value = _as_utc(value)
+    if bucket == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_bucket(value, bucket):
+    """Retourne le début du créneau suivant celui qui commence à `value`."""
+    if bucket == 'hour':
+        return value + timedelta(hours=1)
+    if bucket == 'day':
+        return value + timedelta(days=1)
+    return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+
+
+def rolled_up_erreur_id():
+    """Id de la dernière erreur comptée dans les tables de cumul (0 si aucune)."""
+    state = db.session.get(ErreurRollupState, _STATE_ID)
+    return state.last_erreur_id if state is not None else 0
+
+
+def rolled_up_erreur_id_column():
+    """Même curseur, sous forme de sous-requête scalaire à comparer en SQL."""
+    return func.coalesce(select(ErreurRollupState.last_erreur_id)
+                         .where(ErreurRollupState.id == _STATE_ID)
+                         .scalar_subquery(), 0)
+
+
+def _add_counts(model, deltas):
+    """Ajoute {(bucket, etage_id, type_erreur): [count, batiment_id, site_id]} à une table de cumul."""
+    table = model.__table__
+    existing = set()
+    for chunk in chunked({key[0] for key in deltas}):
+        existing.update(db.session.execute(
+            select(table.c.bucket, table.c.etage_id, table.c.type_erreur).where(table.c.bucket.in_(chunk))))
+    existing = {(_as_utc(bucket), etage_id, type_erreur) for bucket, etage_id, type_erreur in existing}
+    now = current_time()
+    updates = [{'b_bucket': key[0], 'b_etage': key[1], 'b_type': key[2], 'delta': count}
+               for key, (count, _, _) in deltas.items() if key in existing]
+    inserts = [{'bucket': key[0], 'etage_id': key[1], 'type_erreur': key[2], 'batiment_id': batiment_id,
+                'site_id': site_id, 'count': count, 'created_at': now, 'updated_at': now}
+               for key, (count, batiment_id, site_id) in deltas.items() if key not in existing]
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.bucket == bindparam('b_bucket', type_=table.c.bucket.type),
+                   table.c.etage_id == bindparam('b_etage'),
+                   table.c.type_erreur == bindparam('b_type'))
+            .values(count=table.c.count + bindparam('delta'), updated_at=now),
+            updates,
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+
+
+def _raw_rows(*criteria):
+    """Erreurs brutes avec leur rattachement (étage, bâtiment, site)."""
+    return (db.session.query(HistoriqueErreur.id, HistoriqueErreur.timestamp, HistoriqueErreur.type_erreur,
+                             HistoriqueErreur.occurrences, Baes.etage_id, Etage.batiment_id, Batiment.site_id)
+            .join(Baes, HistoriqueErreur.baes_id == Baes.id)
+            .join(Etage, Baes.etage_id == Etage.id)
+            .join(Batiment, Etage.batiment_id == Batiment.id)
+            .filter(*criteria))
+
+
+def compact_rollups(batch_size=DEFAULT_COMPACT_BATCH, safety_seconds=DEFAULT_SAFETY_SECONDS):
+    """
+    Reporte dans les tables horaire et journalière les erreurs créées depuis le dernier passage.
+
+    Le plus grand id visible est lu au départ, puis `safety_seconds` sont attendues : les erreurs
+    d'id inférieur encore en cours d'insertion ont alors été validées. Seule la plage d'ids
+    ]curseur, plafond] est ensuite lue, par lots d'au plus `batch_size` lignes dans l'ordre des ids
+    (la date de création, prise à l'horloge du worker, ne suit pas l'ordre des ids).
+    Pour chaque lot, le curseur est d'abord avancé par un UPDATE conditionnel : si un autre
+    processus a agrégé le même lot entre-temps, la transaction est annulée plutôt que de compter
+    deux fois ; l'ingestion cesse alors de regrouper des répétitions dans ces lignes.
+    Chaque lot est agrégé en mémoire puis ajouté aux deux tables, dans la même transaction.
+    Les erreurs comptent pour leurs `occurrences` à la date de leur `timestamp`, y compris
+    lorsqu'elles arrivent en retard. Retourne le nombre d'erreurs agrégées.
+    """
+    state = db.session.get(ErreurRollupState, _STATE_ID)
+    if state is None:
+        db.session.add(ErreurRollupState(id=_STATE_ID, last_erreur_id=0))
+        db.session.commit()
+    ceiling = db.session.execute(select(func.max(HistoriqueErreur.id))).scalar()
+    db.session.commit()
+    if ceiling is None or ceiling <= rolled_up_erreur_id():
+        return 0
+    time.sleep(max(0, safety_seconds))
+
+    state_table = ErreurRollupState.__table__
+    total = 0
+    while True:
+        watermark = rolled_up_erreur_id()
+        in_range = (HistoriqueErreur.id > watermark, HistoriqueErreur.id <= ceiling)
+        batch_end = db.session.execute(
+            select(HistoriqueErreur.id).where(*in_range)
+            .order_by(HistoriqueErreur.id).offset(batch_size - 1).limit(1)).scalar()
+        if batch_end is None:
+            batch_end = ceiling
+        if batch_end <= watermark:
+            return total
+        advanced = db.session.execute(
+            update(state_table)
+            .where(state_table.c.id == _STATE_ID, state_table.c.last_erreur_id == watermark)
+            .values(last_erreur_id=batch_end, updated_at=current_time()))
+        if advanced.rowcount != 1:
+            db.session.rollback()
+            return total
+        rows = _raw_rows(HistoriqueErreur.id > watermark, HistoriqueErreur.id <= batch_end).all()
+        hourly, daily = {}, {}
+        for _, timestamp, type_erreur, occurrences, etage_id, batiment_id, site_id in rows:
+            for deltas, bucket in ((hourly, 'hour'), (daily, 'day')):
+                entry = deltas.setdefault((floor_bucket(timestamp, bucket), etage_id, type_erreur),
+                                          [0, batiment_id, site_id])
+                entry[0] += occurrences
+        if hourly:
+            _add_counts(ErreurRollupHour, hourly)
+            _add_counts(ErreurRollupDay, daily)
+        db.session.commit()
+        total += len(rows)
+        if batch_end >= ceiling:
+            return total
+
+
+def parse_stats_args(args):
+    """Lit group_by, bucket, from et to ; lève StatsError si un paramètre est invalide."""
+    bucket = args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise StatsError(f"bucket doit valoir l'une des valeurs : {', '.join(BUCKETS)}")
+    group_by = [g.strip() for g in args.get('group_by', '').split(',') if g.strip()]
+    unknown = [g for g in group_by if g not in GROUP_BY]
+    if unknown:
+        raise StatsError(f"group_by doit être choisi parmi : {', '.join(GROUP_BY)}")
+    try:
+        end = _as_utc(datetime.fromisoformat(args['to'])) if args.get('to') else current_time()
+        start = _as_utc(datetime.fromisoformat(args['from'])) if args.get('from') else end - timedelta(days=30)
+    except ValueError:
+        raise StatsError("from et to doivent être des dates ISO 8601")
+    if start >= end:
+        raise StatsError("from doit précéder to")
+    site_id = args.get('site_id')
+    if site_id is not None:
+        try:
+            site_id = int(site_id)
+        except ValueError:
+            raise StatsError("Le paramètre site_id doit être un entier")
+    return bucket, group_by, start, end, site_id
+
+
+def error_stats(bucket, group_by, start, end, site_id=None):
+    """
+    Compte les erreurs par créneau et par dimensions demandées sur [start, end).
+
+    Les répétitions regroupées dans une erreur comptent chacune. Les bornes sont étendues
+    aux créneaux entiers. Les comptes viennent des tables de cumul
+    (journalière pour bucket=day/month, horaire pour bucket=hour) ; seules les erreurs pas
+    encore agrégées (id au-delà du curseur) sont lues dans l'historique brut.
+    """
+    start = floor_bucket(start, bucket)
+    last = floor_bucket(end, bucket)
+    end = last if last == _as_utc(end) else next_bucket(last, bucket)
+    columns = [GROUP_BY[g] for g in group_by]
+    counts = defaultdict(int)
+
+    model = ErreurRollupHour if bucket == 'hour' else ErreurRollupDay
+    query = (db.session.query(model.bucket, *[getattr(model, c) for c in columns], func.sum(model.count))
+             .filter(model.bucket >= start, model.bucket < end)
+             .group_by(model.bucket, *[getattr(model, c) for c in columns]))
+    if site_id is not None:
+        query = query.filter(model.site_id == site_id)
+    for row in query:
+        counts[(floor_bucket(row[0], bucket), *row[1:-1])] += row[-1]
+
+    raw = _raw_rows(HistoriqueErreur.id > rolled_up_erreur_id(),
+                    HistoriqueErreur.timestamp >= start, HistoriqueErreur.timestamp < end)
+    if site_id is not None:
+        raw = raw.filter(Batiment.site_id == site_id)
+    for row in raw:
+        values = {'type_erreur': row.type_erreur, 'etage_id': row.etage_id,
+                  'batiment_id': row.batiment_id, 'site_id': row.site_id}
+        counts[(floor_bucket(row.timestamp, bucket), *[values[c] for c in columns])] += row.occurrences
+
+    stats = []
+    for key in sorted(counts, key=lambda k: tuple((v is None, v) for v in k)):
+        entry = {'bucket': key[0].isoformat(), 'count': counts[key]}
+        entry.update(zip(columns, key[1:]))
+        stats.append(entry)
+    return {'bucket': bucket, 'group_by': group_by, 'from': start.isoformat(), 'to': end.isoformat(),
+            'stats': stats}
+
+
+@erreur_stats_cli.command('compact')
+@click.option('--batch-size', default=DEFAULT_COMPACT_BATCH, show_default=True,
+              help="Nombre maximal d'erreurs agrégées par transaction.")
+def compact_command(batch_size):
+    """Agrège les nouvelles erreurs dans les tables horaire et journalière (à planifier périodiquement)."""
+    count = compact_rollups(batch_size=batch_size)
+    click.echo(f"{count} erreurs agrégées")
@@ -0,0 +1,351 @@
+# services/heartbeat.py
+import atexit
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+
+from models import db
+from models.baes import Baes
+from models.baes_heartbeat import BaesHeartbeat
+from models.historique_erreur import HistoriqueErreur
+from services.baes_status import _as_utc, _is_open
+from services.bulk import chunked, for_update
+from services.erreur_ingestion import insert_events
+from services.erreur_resolution import close_erreurs
+from templates.TimestampMixin import current_time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 30
+DEFAULT_TIMEOUT = 180
+
+# Type d'erreur levé pour une BAES muette, et résolu à la reprise de ses battements
+CONNEXION_ERREUR = 'erreur_connexion'
+
+_create_lock = threading.Lock()
+
+
+def _open_connexion_erreurs(baes_ids):
+    """BAES, parmi `baes_ids`, ayant déjà une erreur_connexion ouverte (une requête IN par tranche)."""
+    table = HistoriqueErreur.__table__
+    found = set()
+    for chunk in chunked(set(baes_ids)):
+        found.update(db.session.execute(
+            select(table.c.baes_id).distinct()
+            .where(table.c.baes_id.in_(chunk), table.c.type_erreur == CONNEXION_ERREUR, *_is_open())).scalars())
+    return found
+
+
+class HeartbeatMonitor:
+    """
+    Suivi en mémoire des battements de cœur des BAES (id -> date du dernier battement).
+
+    Un battement ne fait que mettre à jour la table en mémoire. Toutes les `interval` secondes,
+    un thread recopie dans baes_heartbeat les BAES ayant battu depuis le passage précédent
+    (un UPDATE par tranche de 1000 BAES, pas un par BAES), puis :
+      - lève en un lot une erreur_connexion pour les BAES muettes depuis plus de `timeout` secondes ;
+      - résout les erreur_connexion ouvertes des BAES dont les battements ont repris.
+    La table est propre au processus ; avant de lever une erreur, la date recopiée en base par
+    les autres workers est consultée, pour ne pas déclarer muette une BAES qui bat ailleurs.
+    """
+
+    def __init__(self, app, interval=DEFAULT_INTERVAL, timeout=DEFAULT_TIMEOUT):
+        self.app = app
+        self.interval = interval
+        self.timeout = timeout
+        self.beats = 0
+        self.flushed = 0
+        self.raised = 0
+        self.resolved = 0
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._dirty = set()
+        self._beaten = set()
+        self._raised = set()
+        self._known = set()
+        self._persisted = set()
+        self._loaded = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Reprend les dernières dates recopiées en base, pour détecter les BAES muettes depuis un redémarrage."""
+        rows = db.session.execute(select(BaesHeartbeat.baes_id, BaesHeartbeat.last_seen_at)).all()
+        with self._lock:
+            for baes_id, last_seen_at in rows:
+                self._seen.setdefault(baes_id, _as_utc(last_seen_at))
+                self._persisted.add(baes_id)
+                self._known.add(baes_id)
+            self._loaded = True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='baes-heartbeat', daemon=True)
+            self._thread.start()
+
+    def _restart_after_fork(self):
+        # Le thread du processus parent n'existe pas dans le worker forké : il est relancé
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.start()
+
+    def stop(self, timeout=10):
+        """Arrête le thread après une dernière recopie des battements."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def beat(self, baes_ids):
+        """
+        Enregistre un battement pour chaque BAES ; retourne (nombre accepté, ids inconnus).
+
+        Seuls les ids jamais vus par ce processus sont vérifiés en base (une requête IN par tranche).
+        """
+        ids = set(baes_ids)
+        unknown = ids - self._known
+        if unknown:
+            found = set()
+            for chunk in chunked(unknown):
+                found.update(db.session.execute(select(Baes.id).where(Baes.id.in_(chunk))).scalars())
+            with self._lock:
+                self._known.update(found)
+            unknown -= found
+        accepted = ids - unknown
+        now = current_time()
+        with self._lock:
+            for baes_id in accepted:
+                self._seen[baes_id] = now
+            self._dirty.update(accepted)
+            self._beaten.update(accepted)
+            self.beats += len(accepted)
+        return len(accepted), sorted(unknown)
+
+    def flush(self):
+        """
+        Recopie en base les battements reçus depuis la dernière recopie ; retourne le nombre de BAES écrites.
+
+        Les BAES sont triées par date puis traitées par tranches de 1000 : chaque tranche est écrite
+        par un seul UPDATE ... WHERE baes_id IN (...) avec la plus ancienne date de la tranche, ce qui
+        borne l'imprécision à l'intervalle de recopie. La condition sur last_seen_at empêche un worker
+        de faire reculer une date écrite par un autre. Les BAES encore absentes sont insérées en executemany.
+        """
+        with self._lock:
+            pending = sorted(((self._seen[baes_id], baes_id) for baes_id in self._dirty if baes_id in self._seen),
+                             key=lambda item: item[0])
+            self._dirty.clear()
+        if not pending:
+            return 0
+        table = BaesHeartbeat.__table__
+        now = current_time()
+        baes_ids = [baes_id for _, baes_id in pending]
+        new = [(seen, baes_id) for seen, baes_id in pending if baes_id not in self._persisted]
+        try:
+            if new:
+                # Une BAES a pu être supprimée depuis son battement (l'INSERT violerait la clé étrangère),
+                # ou déjà insérée par un autre worker depuis le chargement
+                existing, already = set(), set()
+                for chunk in chunked([baes_id for _, baes_id in new]):
+                    for baes_id, persisted in db.session.execute(
+                            select(Baes.id, table.c.baes_id)
+                            .outerjoin(table, table.c.baes_id == Baes.id)
+                            .where(Baes.id.in_(chunk))):
+                        existing.add(baes_id)
+                        if persisted is not None:
+                            already.add(baes_id)
+                gone = {baes_id for _, baes_id in new} - existing
+                if gone:
+                    self._forget(gone)
+                    new = [(seen, baes_id) for seen, baes_id in new if baes_id not in gone]
+                    pending = [(seen, baes_id) for seen, baes_id in pending if baes_id not in gone]
+                    baes_ids = [baes_id for _, baes_id in pending]
+                rows = [{'baes_id': baes_id, 'last_seen_at': seen, 'created_at': now, 'updated_at': now}
+                        for seen, baes_id in new if baes_id not in already]
+                if rows:
+                    db.session.execute(insert(table), rows)
+                inserted = {row['baes_id'] for row in rows}
+                pending = [(seen, baes_id) for seen, baes_id in pending if baes_id not in inserted]
+            for chunk in chunked(pending):
+                seen_at = chunk[0][0]
+                db.session.execute(
+                    update(table)
+                    .where(table.c.baes_id.in_([baes_id for _, baes_id in chunk]), table.c.last_seen_at < seen_at)
+                    .values(last_seen_at=seen_at, updated_at=now))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Les battements seront recopiés au passage suivant (les BAES supprimées entre-temps
+            # y seront écartées par la vérification ci-dessus)
+            with self._lock:
+                self._dirty.update(baes_id for baes_id in baes_ids if baes_id in self._known)
+            raise
+        self._persisted.update(baes_ids)
+        self.flushed += len(baes_ids)
+        return len(baes_ids)
+
+    def _forget(self, baes_ids):
+        """Oublie des BAES supprimées : plus de recopie ni de détection pour elles."""
+        with self._lock:
+            for baes_id in baes_ids:
+                self._seen.pop(baes_id, None)
+            self._known.difference_update(baes_ids)
+            self._persisted.difference_update(baes_ids)
+            self._dirty.difference_update(baes_ids)
+            self._beaten.difference_update(baes_ids)
+            self._raised.difference_update(baes_ids)
+
+    def sweep(self):
+        """
+        Résout les erreur_connexion des BAES revenues, puis lève celles des BAES muettes ;
+        retourne (erreurs levées, erreurs résolues).
+        """
+        now = current_time()
+        deadline = now - timedelta(seconds=self.timeout)
+        with self._lock:
+            resumed = set(self._beaten)
+            self._beaten.clear()
+            self._raised -= resumed
+            silent = {baes_id for baes_id, seen in self._seen.items()
+                      if seen < deadline and baes_id not in self._raised}
+
+        resolved = 0
+        back = _open_connexion_erreurs(resumed) if resumed else set()
+        if back:
+            resolved, _ = close_erreurs('is_solved', 'baes_ids', sorted(back), [CONNEXION_ERREUR])
+
+        raised = 0
+        if silent:
+            silent = self._confirm_silent(silent, deadline)
+        if silent:
+            # Les BAES restent verrouillées jusqu'au commit de l'insertion : deux workers qui les
+            # détectent ensemble ne lèvent qu'une erreur_connexion, le second voyant celle du premier
+            for chunk in chunked(sorted(silent)):
+                db.session.execute(for_update(select(Baes.id).where(Baes.id.in_(chunk)), Baes.__table__)).all()
+            # Déjà signalées (par ce worker avant un redémarrage, ou par un autre)
+            already = _open_connexion_erreurs(silent)
+            silent -= already
+            with self._lock:
+                self._raised.update(already)
+            if silent:
+                raised, _ = insert_events([{'baes_id': baes_id, 'type_erreur': CONNEXION_ERREUR, 'timestamp': now}
+                                           for baes_id in sorted(silent)])
+                with self._lock:
+                    self._raised.update(silent)
+            else:
+                db.session.commit()
+        self.raised += raised
+        self.resolved += resolved
+        return raised, resolved
+
+    def _confirm_silent(self, candidates, deadline):
+        """
+        Écarte des candidats les BAES supprimées et celles dont un autre worker a recopié
+        un battement récent (la date en mémoire est alors avancée).
+        """
+        rows = {}
+        for chunk in chunked(candidates):
+            rows.update(db.session.execute(
+                select(Baes.id, BaesHeartbeat.last_seen_at)
+                .outerjoin(BaesHeartbeat, BaesHeartbeat.baes_id == Baes.id)
+                .where(Baes.id.in_(chunk))).all())
+        self._forget(set(candidates) - set(rows))
+        confirmed = set()
+        with self._lock:
+            for baes_id in candidates:
+                if baes_id not in rows:
+                    continue
+                stored = _as_utc(rows[baes_id])
+                if stored is not None and stored > self._seen.get(baes_id, stored):
+                    self._seen[baes_id] = stored
+                if stored is None or stored < deadline:
+                    confirmed.add(baes_id)
+        return confirmed
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._tick()
+        self._tick(sweep=False)
+
+    def _tick(self, sweep=True):
+        with self.app.app_context():
+            try:
+                try:
+                    if not self._loaded:
+                        # Base indisponible au démarrage : le chargement est retenté à chaque passage
+                        self.load()
+                    self.flush()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Recopie des battements de cœur impossible : %s", e)
+                # La détection des BAES muettes ne dépend pas de la recopie : elle a lieu même si celle-ci échoue
+                if sweep:
+                    try:
+                        self.sweep()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error("Détection des BAES muettes impossible : %s", e)
+            finally:
+                db.session.remove()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked': len(self._seen),
+                'pending': len(self._dirty),
+                'silent': len(self._raised),
+                'beats': self.beats,
+                'flushed': self.flushed,
+                'raised': self.raised,
+                'resolved': self.resolved,
+            }
+
+
+def init_heartbeat_monitor(app):
+    """
+    Crée le suivi des battements de l'application, recharge baes_heartbeat et lance le thread.
+
+    Appelé au démarrage des seuls processus qui servent des requêtes (wsgi.py, `python app.py`),
+    pas à l'import de l'application : les commandes flask (db upgrade, tâches planifiées) et le
+    processus parent du rechargeur ne suivent pas les battements. Après un redémarrage sans aucun
+    battement reçu, les BAES restées muettes sont quand même signalées. Un worker forké après
+    le chargement de l'application (gunicorn --preload) relance son propre thread.
+    """
+    config = app.config
+    monitor = HeartbeatMonitor(
+        app,
+        interval=config.get('BAES_HEARTBEAT_INTERVAL', DEFAULT_INTERVAL),
+        timeout=config.get('BAES_HEARTBEAT_TIMEOUT', DEFAULT_TIMEOUT),
+    )
+    with app.app_context():
+        try:
+            monitor.load()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Chargement des battements de cœur impossible : %s", e)
+        finally:
+            db.session.remove()
+    app.extensions['baes_heartbeat'] = monitor
+    monitor.start()
+    atexit.register(monitor.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=monitor._restart_after_fork)
+    return monitor
+
+
+def get_heartbeat_monitor():
+    """
+    Retourne le suivi des battements de l'application courante.
+
+    Créé ici, au premier battement, si le processus n'a pas appelé init_heartbeat_monitor (flask run).
+    """
+    monitor = current_app.extensions.get('baes_heartbeat')
+    if monitor is None:
+        with _create_lock:
+            monitor = current_app.extensions.get('baes_heartbeat')
+            if monitor is None:
+                monitor = init_heartbeat_monitor(current_app._get_current_object())
+    return monitor
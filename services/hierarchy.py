@@ -0,0 +1,292 @@
+# services/hierarchy.py
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import func, literal_column, or_, union_all
+from sqlalchemy.orm import defer
+
+from models import db
+from models.site import Site
+from models.batiment import Batiment
+from models.etage import Etage
+from models.baes import Baes
+from models.baes_status import BaesStatus
+from models.carte import Carte
+from models.historique_erreur import HistoriqueErreur
+from models.user_site_role import UserSiteRole
+
+# Nombre de requêtes émises par load_site_hierarchy, quel que soit le nombre de nœuds :
+# sites, bâtiments, étages, BAES, états des BAES, erreurs et cartes.
+HIERARCHY_QUERY_COUNT = 7
+
+
+# Niveaux de l'arbre, du plus haut au plus profond
+LEVELS = ('site', 'batiment', 'etage', 'baes', 'erreurs')
+
+# Champs pouvant être retirés des réponses via `fields` (l'id est toujours renvoyé)
+PROJECTABLE_FIELDS = frozenset(('name', 'carte', 'polygon_points', 'position', 'type_erreur', 'timestamp',
+                                'occurrences', 'last_seen', 'status'))
+
+
+class Projection:
+    """
+    Profondeur, champs et bornes de l'historique demandés pour la hiérarchie.
+
+    Les niveaux au-delà de `depth` ne sont ni chargés ni sérialisés ; les champs
+    absents de `fields` sont retirés à tous les niveaux (tous sont conservés si `fields` est None).
+    L'historique de chaque BAES peut être restreint aux erreurs ouvertes (`erreurs_open`),
+    aux `erreurs_limit` plus récentes et/ou à celles postérieures à `erreurs_since`.
+    """
+
+    def __init__(self, depth='erreurs', fields=None, erreurs_open=False, erreurs_limit=None, erreurs_since=None):
+        if depth not in LEVELS:
+            raise ValueError(f"depth doit valoir l'une des valeurs : {', '.join(LEVELS)}")
+        if fields is not None:
+            fields = frozenset(fields)
+            unknown = fields - PROJECTABLE_FIELDS - {'id'}
+            if unknown:
+                raise ValueError(f"Champs inconnus : {', '.join(sorted(unknown))}")
+        if erreurs_limit is not None and erreurs_limit < 1:
+            raise ValueError("erreurs_limit doit être un entier positif")
+        if erreurs_since is not None and erreurs_since.tzinfo is None:
+            erreurs_since = erreurs_since.replace(tzinfo=timezone.utc)
+        self.depth = depth
+        self.fields = fields
+        self.erreurs_open = erreurs_open
+        self.erreurs_limit = erreurs_limit
+        self.erreurs_since = erreurs_since
+
+    @classmethod
+    def from_args(cls, args):
+        fields = args.get('fields')
+        if fields is not None:
+            fields = [f.strip() for f in fields.split(',') if f.strip()]
+        erreurs = args.get('erreurs', 'all')
+        if erreurs not in ('all', 'open'):
+            raise ValueError("erreurs doit valoir 'all' ou 'open'")
+        erreurs_limit = args.get('erreurs_limit')
+        if erreurs_limit is not None:
+            try:
+                erreurs_limit = int(erreurs_limit)
+            except ValueError:
+                raise ValueError("erreurs_limit doit être un entier positif")
+        erreurs_since = args.get('erreurs_since')
+        if erreurs_since is not None:
+            try:
+                erreurs_since = datetime.fromisoformat(erreurs_since)
+            except ValueError:
+                raise ValueError("erreurs_since doit être une date ISO 8601")
+        return cls(args.get('depth', 'erreurs'), fields, erreurs == 'open', erreurs_limit, erreurs_since)
+
+    def includes(self, level):
+        return LEVELS.index(level) <= LEVELS.index(self.depth)
+
+    def wants(self, field):
+        return self.fields is None or field in self.fields
+
+    @property
+    def key(self):
+        """Identifie la variante de réponse (clé de cache)."""
+        return (self.depth, tuple(sorted(self.fields)) if self.fields is not None else None,
+                self.erreurs_open, self.erreurs_limit, self.erreurs_since)
+
+
+FULL_PROJECTION = Projection()
+
+
+def _group_by(rows, attr):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, attr)].append(row)
+    return grouped
+
+
+class SiteHierarchy:
+    """
+    Arborescence Site -> Batiment -> Etage -> BAES -> HistoriqueErreur préchargée.
+
+    Les enfants de chaque nœud sont indexés par l'id du parent, ce qui permet aux
+    sérialiseurs de parcourir l'arbre sans déclencher de chargement paresseux.
+    """
+
+    def __init__(self, sites, batiments, etages, baes, erreurs, cartes, projection=FULL_PROJECTION, statuses=()):
+        self.projection = projection
+        self.sites = sites
+        self._batiments = _group_by(batiments, 'site_id')
+        self._etages = _group_by(etages, 'batiment_id')
+        self._baes = _group_by(baes, 'etage_id')
+        self._erreurs = _group_by(erreurs, 'baes_id')
+        self._status = {s.baes_id: s for s in statuses}
+        self._carte_by_site = {c.site_id: c for c in cartes if c.site_id is not None}
+        self._carte_by_etage = {c.etage_id: c for c in cartes if c.etage_id is not None}
+
+    def batiments_of(self, site):
+        return self._batiments.get(site.id, [])
+
+    def etages_of(self, batiment):
+        return self._etages.get(batiment.id, [])
+
+    def baes_of(self, etage):
+        return self._baes.get(etage.id, [])
+
+    def erreurs_of(self, baes):
+        return self._erreurs.get(baes.id, [])
+
+    def status_of(self, baes):
+        return self._status.get(baes.id)
+
+    def carte_of_site(self, site):
+        return self._carte_by_site.get(site.id)
+
+    def carte_of_etage(self, etage):
+        return self._carte_by_etage.get(etage.id)
+
+
+def get_user_site_ids(user_id):
+    """Retourne les ids distincts des sites accessibles à l'utilisateur, triés."""
+    rows = (db.session.query(UserSiteRole.site_id)
+            .filter(UserSiteRole.user_id == user_id)
+            .distinct()
+            .all())
+    return sorted(site_id for (site_id,) in rows)
+
+
+def scoped_queries(site_ids):
+    """Requêtes (non ordonnées) restreignant chaque niveau de l'arbre aux sites donnés."""
+    return {
+        Site: Site.query.filter(Site.id.in_(site_ids)),
+        Batiment: Batiment.query.filter(Batiment.site_id.in_(site_ids)),
+        Etage: (Etage.query
+                .join(Batiment, Etage.batiment_id == Batiment.id)
+                .filter(Batiment.site_id.in_(site_ids))),
+        Baes: (Baes.query
+               .join(Etage, Baes.etage_id == Etage.id)
+               .join(Batiment, Etage.batiment_id == Batiment.id)
+               .filter(Batiment.site_id.in_(site_ids))),
+        HistoriqueErreur: (HistoriqueErreur.query
+                           .join(Baes, HistoriqueErreur.baes_id == Baes.id)
+                           .join(Etage, Baes.etage_id == Etage.id)
+                           .join(Batiment, Etage.batiment_id == Batiment.id)
+                           .filter(Batiment.site_id.in_(site_ids))),
+        # Cartes de site et cartes d'étage en une seule requête
+        Carte: (Carte.query
+                .outerjoin(Etage, Carte.etage_id == Etage.id)
+                .outerjoin(Batiment, Etage.batiment_id == Batiment.id)
+                .filter(or_(Carte.site_id.in_(site_ids), Batiment.site_id.in_(site_ids)))),
+    }
+
+
+def scoped_status_query(site_ids):
+    """États courants (baes_status) des BAES des sites donnés."""
+    return (BaesStatus.query
+            .join(Baes, BaesStatus.baes_id == Baes.id)
+            .join(Etage, Baes.etage_id == Etage.id)
+            .join(Batiment, Etage.batiment_id == Batiment.id)
+            .filter(Batiment.site_id.in_(site_ids)))
+
+
+def hierarchy_etag_scopes(user_id):
+    """Périmètres (modèle, requête) propres à l'utilisateur, à combiner aux validateurs de ses sites pour l'ETag."""
+    return [(UserSiteRole, UserSiteRole.query.filter(UserSiteRole.user_id == user_id))]
+
+
+def site_validators(site_ids):
+    """
+    Retourne {site_id: validateur}, le validateur étant le MAX(updated_at) et le COUNT(*) de chaque niveau de l'arbre du site.
+
+    Tous les niveaux sont agrégés par site en une seule requête (UNION ALL de GROUP BY).
+    Lues en base, ces valeurs sont les mêmes dans tous les workers : elles entrent dans l'ETag
+    de la hiérarchie et indexent les fragments en cache, qui ne peuvent donc pas lui survivre.
+    """
+    if not site_ids:
+        return {}
+    queries = scoped_queries(site_ids)
+    queries[BaesStatus] = scoped_status_query(site_ids)
+    # Colonne portant le site de chaque niveau (les requêtes joignent déjà Batiment)
+    site_columns = {
+        Site: Site.id,
+        Batiment: Batiment.site_id,
+        Etage: Batiment.site_id,
+        Baes: Batiment.site_id,
+        HistoriqueErreur: Batiment.site_id,
+        Carte: func.coalesce(Carte.site_id, Batiment.site_id),
+        BaesStatus: Batiment.site_id,
+    }
+    parts = []
+    for level, (model, query) in enumerate(queries.items()):
+        site_id = site_columns[model]
+        parts.append(query.with_entities(site_id.label('site_id'),
+                                         literal_column(str(level)).label('niveau'),
+                                         func.max(model.updated_at).label('updated_at'),
+                                         func.count().label('total'))
+                     .group_by(site_id).statement)
+
+    rows = defaultdict(list)
+    for site_id, level, updated_at, total in db.session.execute(union_all(*parts)):
+        rows[site_id].append((level, updated_at, total))
+    return {site_id: tuple(sorted(rows[site_id], key=lambda row: row[0])) for site_id in site_ids}
+
+
+def _bounded_erreurs(query, projection):
+    """
+    Applique les bornes de l'historique en SQL.
+
+    La limite par BAES est calculée par ROW_NUMBER() sur une seule requête fenêtrée,
+    plutôt qu'en chargeant tout l'historique pour le découper en Python.
+    """
+    if projection.erreurs_open:
+        query = query.filter(HistoriqueErreur.is_solved.is_(False), HistoriqueErreur.is_ignored.is_(False))
+    if projection.erreurs_since is not None:
+        query = query.filter(HistoriqueErreur.timestamp >= projection.erreurs_since)
+    if projection.erreurs_limit is not None:
+        rank = func.row_number().over(
+            partition_by=HistoriqueErreur.baes_id,
+            order_by=(HistoriqueErreur.timestamp.desc(), HistoriqueErreur.id.desc()),
+        ).label('rang')
+        ranked = query.with_entities(HistoriqueErreur.id.label('id'), rank).subquery()
+        query = (HistoriqueErreur.query
+                 .join(ranked, ranked.c.id == HistoriqueErreur.id)
+                 .filter(ranked.c.rang <= projection.erreurs_limit))
+    return query
+
+
+def load_site_hierarchy(site_ids, projection=FULL_PROJECTION):
+    """
+    Charge l'arborescence des sites donnés en au plus HIERARCHY_QUERY_COUNT requêtes.
+
+    Chaque niveau est récupéré par une seule requête ensembliste filtrée par jointure
+    sur les sites demandés, au lieu d'une requête par relation parcourue. Les niveaux
+    exclus par `projection` ne sont pas interrogés et les colonnes JSON non demandées
+    ne sont pas lues. L'état courant de chaque BAES est lu dans baes_status, sans parcourir
+    l'historique.
+    """
+    site_ids = list(site_ids)
+    if not site_ids:
+        return SiteHierarchy([], [], [], [], [], [], projection)
+
+    queries = scoped_queries(site_ids)
+    batiments = etages = baes = erreurs = cartes = statuses = []
+    sites = queries[Site].order_by(Site.id).all()
+    if projection.includes('batiment'):
+        query = queries[Batiment]
+        if not projection.wants('polygon_points'):
+            query = query.options(defer(Batiment.polygon_points))
+        batiments = query.order_by(Batiment.id).all()
+    if projection.includes('etage'):
+        etages = queries[Etage].order_by(Etage.id).all()
+    if projection.includes('baes'):
+        query = queries[Baes]
+        if not projection.wants('position'):
+            query = query.options(defer(Baes.position))
+        baes = query.order_by(Baes.id).all()
+        if projection.wants('status'):
+            statuses = scoped_status_query(site_ids).all()
+    if projection.includes('erreurs'):
+        erreurs = _bounded_erreurs(queries[HistoriqueErreur], projection).order_by(HistoriqueErreur.id).all()
+    if projection.wants('carte'):
+        if projection.includes('etage'):
+            cartes = queries[Carte].all()
+        else:
+            cartes = Carte.query.filter(Carte.site_id.in_(site_ids)).all()
+
+    return SiteHierarchy(sites, batiments, etages, baes, erreurs, cartes, projection, statuses)
@@ -0,0 +1,66 @@
+# services/hierarchy_cache.py
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class HierarchyCache:
+    """
+    Cache LRU borné des fragments sérialisés de la hiérarchie, indexés par (site_id, validateur, variante).
+
+    Le validateur est lu en base (services.hierarchy.site_validators) : toute écriture sur
+    l'arbre du site, quel que soit le worker qui l'a faite, change la clé. Un fragment périmé
+    n'est donc plus jamais servi ; il finit simplement évincé par les entrées plus récentes.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, site_id, validator, variant=None):
+        key = (site_id, validator, variant)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def set(self, site_id, validator, fragment, variant=None):
+        key = (site_id, validator, variant)
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def get_hierarchy_cache():
+    """Retourne le cache de l'application courante, créé à la première utilisation."""
+    cache = current_app.extensions.get('hierarchy_cache')
+    if cache is None:
+        cache = HierarchyCache(current_app.config.get('HIERARCHY_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+        current_app.extensions['hierarchy_cache'] = cache
+    return cache
+
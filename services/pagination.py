@@ -0,0 +1,82 @@
+# services/pagination.py
+from flask import request, current_app, url_for
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Paramètres communs documentés dans Swagger par les routes de collection
+PAGINATION_PARAMETERS = [
+    {
+        'name': 'limit',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'description': "Nombre maximal d'éléments retournés (100 par défaut, 1000 au plus)"
+    },
+    {
+        'name': 'after',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'description': "Retourne les éléments d'id strictement supérieur (curseur de la page précédente)"
+    }
+]
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def int_arg(name):
+    """Lit un paramètre entier optionnel de la query string, ou lève PaginationError."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f"Le paramètre {name} doit être un entier")
+
+
+def page_params():
+    default = current_app.config.get('PAGE_SIZE_DEFAULT', DEFAULT_PAGE_SIZE)
+    maximum = current_app.config.get('PAGE_SIZE_MAX', MAX_PAGE_SIZE)
+    limit = int_arg('limit')
+    after = int_arg('after')
+    if limit is None:
+        limit = default
+    if limit < 1 or limit > maximum:
+        raise PaginationError(f"limit doit être compris entre 1 et {maximum}")
+    return limit, after
+
+
+def keyset_window(query, id_column, limit, after):
+    """Restreint `query` aux `limit + 1` lignes qui suivent le curseur `after`, dans l'ordre de `id_column`."""
+    if after is not None:
+        query = query.filter(id_column > after)
+    return query.order_by(id_column).limit(limit + 1)
+
+
+def keyset_page(query, id_column, limit, after):
+    """
+    Retourne une page (lignes, curseur suivant) par pagination par clé sur `id_column`.
+
+    La requête ne lit que `limit + 1` lignes à partir de l'index de la clé primaire,
+    quelle que soit la profondeur de la page ; le curseur suivant vaut None en fin de collection.
+    """
+    rows = keyset_window(query, id_column, limit, after).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def set_link_header(response, limit, next_after):
+    """Ajoute l'en-tête Link (rel="next") vers la page suivante, en conservant les filtres."""
+    if next_after is None:
+        return response
+    args = request.args.to_dict()
+    args.update({'limit': limit, 'after': next_after})
+    url = url_for(request.endpoint, _external=True, **(request.view_args or {}), **args)
+    response.headers['Link'] = f'<{url}>; rel="next"'
+    return response
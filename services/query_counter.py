@@ -0,0 +1,36 @@
+# services/query_counter.py
+import threading
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """
+    Compte les requêtes SQL émises par le thread courant sur un moteur donné.
+
+    Utilisation :
+        with QueryCounter(db.engine) as counter:
+            ...
+        counter.count
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+        self._thread_id = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Le moteur est partagé entre les threads du worker : on ne compte que les nôtres.
+        if threading.get_ident() == self._thread_id:
+            self.count += 1
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return False
@@ -0,0 +1,41 @@
+# tests/conftest.py
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from models import db, Baes, Batiment, Etage, Site
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    Application sur une base SQLite dans un fichier (une connexion par thread, comme sur SQL Server),
+    clés étrangères vérifiées.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'baes.db'}"
+    db.init_app(app)
+    with app.app_context():
+        event.listen(db.engine, 'connect', lambda connection, _: connection.execute('PRAGMA foreign_keys=ON'))
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def baes_ids(app):
+    """Trois BAES sur un même étage ; retourne leurs ids."""
+    site = Site(name='site')
+    db.session.add(site)
+    db.session.flush()
+    batiment = Batiment(name='bat', site_id=site.id)
+    db.session.add(batiment)
+    db.session.flush()
+    etage = Etage(name='etage', batiment_id=batiment.id)
+    db.session.add(etage)
+    db.session.flush()
+    baes = [Baes(name=f'baes {i}', position={'x': i}, etage_id=etage.id) for i in range(3)]
+    db.session.add_all(baes)
+    db.session.commit()
+    return [b.id for b in baes]
@@ -0,0 +1,101 @@
+# tests/test_baes_status.py
+from datetime import timedelta
+
+import services.baes_status as baes_status
+from models import db, BaesStatus
+from services.baes_status import _as_utc, rebuild_baes_status, record_archived, record_errors
+from services.erreur_ingestion import insert_events
+from services.erreur_resolution import close_erreurs
+from templates.TimestampMixin import current_time
+
+
+def _status(baes_id):
+    db.session.expire_all()
+    return db.session.get(BaesStatus, baes_id)
+
+
+def _inserted(baes_id, at, type_erreur='erreur_batterie'):
+    return {'baes_id': baes_id, 'type_erreur': type_erreur, 'timestamp': at, 'last_seen': None}
+
+
+def test_first_error_creates_status_row(app, baes_ids):
+    now = current_time()
+    insert_events([{'baes_id': baes_ids[0], 'type_erreur': 'erreur_batterie', 'timestamp': now},
+                   {'baes_id': baes_ids[0], 'type_erreur': 'erreur_connexion', 'timestamp': now}])
+    status = _status(baes_ids[0])
+    assert (status.open_count, status.error_count) == (2, 2)
+    assert status.open_types == {'erreur_batterie': 1, 'erreur_connexion': 1}
+    assert _status(baes_ids[1]) is None
+
+
+def test_counters_are_incremented_not_overwritten(app, baes_ids):
+    now = current_time()
+    # Ligne déjà avancée par un autre worker depuis la dernière lecture de celui-ci
+    db.session.add(BaesStatus(baes_id=baes_ids[0], open_count=5, open_types={'erreur_batterie': 5},
+                              error_count=7, last_error_at=now + timedelta(hours=1)))
+    db.session.commit()
+    record_errors([_inserted(baes_ids[0], now), _inserted(baes_ids[0], now, 'erreur_connexion')])
+    db.session.commit()
+    status = _status(baes_ids[0])
+    assert (status.open_count, status.error_count) == (7, 9)
+    assert status.open_types == {'erreur_batterie': 6, 'erreur_connexion': 1}
+    # La date la plus récente est conservée
+    assert _as_utc(status.last_error_at) == now + timedelta(hours=1)
+
+
+def test_repeats_only_move_last_error_at(app, baes_ids):
+    now = current_time()
+    record_errors([_inserted(baes_ids[0], now)])
+    record_errors(repeats=[(baes_ids[0], now + timedelta(minutes=3))])
+    db.session.commit()
+    status = _status(baes_ids[0])
+    assert (status.open_count, status.error_count) == (1, 1)
+    assert _as_utc(status.last_error_at) == now + timedelta(minutes=3)
+
+
+def test_row_created_concurrently_falls_back_to_update(app, baes_ids, monkeypatch):
+    now = current_time()
+    db.session.add(BaesStatus(baes_id=baes_ids[0], open_count=1, open_types={'erreur_batterie': 1},
+                              error_count=1, last_error_at=now))
+    db.session.commit()
+    apply_deltas = baes_status._apply_deltas
+    calls = []
+
+    def stale_read(deltas):
+        # Premier passage : la ligne, insérée par un autre worker, n'était pas encore visible
+        calls.append(deltas)
+        return dict(deltas) if len(calls) == 1 else apply_deltas(deltas)
+
+    monkeypatch.setattr(baes_status, '_apply_deltas', stale_read)
+    record_errors([_inserted(baes_ids[0], now)])
+    db.session.commit()
+    assert len(calls) == 2
+    status = _status(baes_ids[0])
+    assert (status.open_count, status.error_count) == (2, 2)
+    assert status.open_types == {'erreur_batterie': 2}
+
+
+def test_resolution_and_archiving_update_counters(app, baes_ids):
+    now = current_time()
+    insert_events([{'baes_id': baes_ids[0], 'type_erreur': 'erreur_batterie', 'timestamp': now},
+                   {'baes_id': baes_ids[0], 'type_erreur': 'erreur_connexion', 'timestamp': now}])
+    close_erreurs('is_solved', 'baes_id', baes_ids[0], ['erreur_batterie'])
+    status = _status(baes_ids[0])
+    assert (status.open_count, status.error_count) == (1, 2)
+    assert status.open_types == {'erreur_connexion': 1}
+
+    record_archived({baes_ids[0]: 1})
+    db.session.commit()
+    assert _status(baes_ids[0]).error_count == 1
+
+
+def test_rebuild_matches_incremental_state(app, baes_ids):
+    now = current_time()
+    insert_events([{'baes_id': baes_id, 'type_erreur': 'erreur_batterie', 'timestamp': now}
+                   for baes_id in baes_ids[:2]])
+    close_erreurs('is_ignored', 'baes_id', baes_ids[1])
+    incremental = {baes_id: (s.open_count, s.open_types, s.error_count)
+                   for baes_id in baes_ids[:2] for s in [_status(baes_id)]}
+    assert rebuild_baes_status() == 2
+    assert {baes_id: (s.open_count, s.open_types, s.error_count)
+            for baes_id in baes_ids[:2] for s in [_status(baes_id)]} == incremental
@@ -0,0 +1,99 @@
+# tests/test_erreur_coalescing.py
+import threading
+from datetime import timedelta
+
+import pytest
+
+import services.erreur_ingestion as erreur_ingestion
+from models import db, HistoriqueErreur
+from services.erreur_coalescing import get_coalescer
+from services.erreur_ingestion import insert_events
+from templates.TimestampMixin import current_time
+
+
+def _event(baes_id, at, type_erreur='erreur_batterie'):
+    return {'baes_id': baes_id, 'type_erreur': type_erreur, 'timestamp': at}
+
+
+def _rows():
+    db.session.expire_all()
+    return [(e.baes_id, e.occurrences) for e in HistoriqueErreur.query.order_by(HistoriqueErreur.id)]
+
+
+def test_repeats_fold_into_open_row(app, baes_ids):
+    now = current_time()
+    assert insert_events([_event(baes_ids[0], now), _event(baes_ids[0], now + timedelta(seconds=10))]) == (1, 1)
+    assert insert_events([_event(baes_ids[0], now + timedelta(seconds=20))]) == (0, 1)
+    assert _rows() == [(baes_ids[0], 3)]
+    assert get_coalescer().stats()['coalesced'] == 2
+
+
+def test_repeat_after_window_opens_new_row(app, baes_ids):
+    now = current_time()
+    insert_events([_event(baes_ids[0], now)])
+    assert insert_events([_event(baes_ids[0], now + timedelta(seconds=301))]) == (1, 0)
+    assert _rows() == [(baes_ids[0], 1), (baes_ids[0], 1)]
+
+
+def test_closed_row_receives_no_repeats(app, baes_ids):
+    now = current_time()
+    insert_events([_event(baes_ids[0], now)])
+    # Résolue par un autre worker : le regroupeur de celui-ci se souvient encore de la ligne
+    HistoriqueErreur.query.update({'is_solved': True})
+    db.session.commit()
+    assert insert_events([_event(baes_ids[0], now + timedelta(seconds=5))]) == (1, 0)
+    assert _rows() == [(baes_ids[0], 1), (baes_ids[0], 1)]
+
+
+def test_failed_write_releases_reserved_keys(app, baes_ids, monkeypatch):
+    def unavailable(inserts, folds):
+        raise RuntimeError('base indisponible')
+
+    monkeypatch.setattr(erreur_ingestion, '_write', unavailable)
+    with pytest.raises(RuntimeError):
+        insert_events([_event(baes_ids[0], current_time())])
+    monkeypatch.undo()
+    assert get_coalescer()._reserved == set()
+    assert insert_events([_event(baes_ids[0], current_time())]) == (1, 0)
+
+
+def test_write_in_flight_blocks_only_its_keys(app, baes_ids):
+    coalescer = get_coalescer()
+    now = current_time()
+    # Un lot a réservé la BAES 0 et n'a pas encore écrit
+    inserts, folds, reserved = coalescer.reserve([_event(baes_ids[0], now)])
+
+    other_done, same_done = threading.Event(), threading.Event()
+
+    def ingest(baes_id, done):
+        with app.app_context():
+            insert_events([_event(baes_id, now + timedelta(seconds=1))])
+        done.set()
+
+    threads = [threading.Thread(target=ingest, args=(baes_ids[1], other_done)),
+               threading.Thread(target=ingest, args=(baes_ids[0], same_done))]
+    for thread in threads:
+        thread.start()
+    assert other_done.wait(5)
+    assert not same_done.wait(0.2)
+
+    coalescer.release(reserved, erreur_ingestion._write(inserts, folds))
+    assert same_done.wait(5)
+    for thread in threads:
+        thread.join()
+    # La répétition a attendu la ligne en cours d'écriture et s'y est regroupée
+    assert sorted(_rows()) == [(baes_ids[0], 2), (baes_ids[1], 1)]
+
+
+def test_concurrent_batches_fold_onto_one_row(app, baes_ids):
+    def ingest():
+        for i in range(10):
+            with app.app_context():
+                insert_events([_event(baes_ids[i % 2], current_time())])
+
+    threads = [threading.Thread(target=ingest) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(_rows()) == [(baes_ids[0], 20), (baes_ids[1], 20)]
@@ -0,0 +1,79 @@
+# tests/test_erreur_stats.py
+from datetime import timedelta
+
+import services.erreur_stats as erreur_stats
+from models import db, HistoriqueErreur
+from services.erreur_ingestion import insert_events
+from services.erreur_stats import compact_rollups, error_stats, rolled_up_erreur_id
+from templates.TimestampMixin import current_time
+
+
+def _add(baes_id, at, occurrences=1, type_erreur='erreur_batterie'):
+    db.session.add(HistoriqueErreur(baes_id=baes_id, type_erreur=type_erreur, timestamp=at,
+                                    occurrences=occurrences))
+    db.session.commit()
+
+
+def _total(start, end):
+    return sum(entry['count'] for entry in error_stats('day', ['type_erreur'], start, end)['stats'])
+
+
+def _max_id():
+    return db.session.query(db.func.max(HistoriqueErreur.id)).scalar()
+
+
+def test_compaction_counts_occurrences(app, baes_ids):
+    now = current_time()
+    _add(baes_ids[0], now, occurrences=4)
+    _add(baes_ids[1], now)
+    before = _total(now - timedelta(days=1), now + timedelta(days=1))
+    assert compact_rollups(safety_seconds=0) == 2
+    assert rolled_up_erreur_id() == _max_id()
+    # Même total avant (historique brut) et après agrégation (tables de cumul)
+    assert before == _total(now - timedelta(days=1), now + timedelta(days=1)) == 5
+
+
+def test_compaction_is_incremental(app, baes_ids):
+    now = current_time()
+    _add(baes_ids[0], now)
+    compact_rollups(safety_seconds=0)
+    # Arrivée tardive : comptée à la date de son timestamp, pas deux fois pour la première
+    _add(baes_ids[0], now - timedelta(days=3), occurrences=2)
+    assert compact_rollups(safety_seconds=0) == 1
+    assert compact_rollups(safety_seconds=0) == 0
+    assert _total(now - timedelta(days=1), now + timedelta(days=1)) == 1
+    assert _total(now - timedelta(days=4), now - timedelta(days=2)) == 2
+
+
+def test_batches_advance_the_watermark(app, baes_ids):
+    now = current_time()
+    for i in range(5):
+        _add(baes_ids[i % 3], now)
+    assert compact_rollups(batch_size=2, safety_seconds=0) == 5
+    assert rolled_up_erreur_id() == _max_id()
+    assert _total(now - timedelta(days=1), now + timedelta(days=1)) == 5
+
+
+def test_batch_claimed_elsewhere_is_not_counted_twice(app, baes_ids, monkeypatch):
+    now = current_time()
+    _add(baes_ids[0], now)
+    compact_rollups(safety_seconds=0)
+    _add(baes_ids[0], now)
+    # Curseur lu avant qu'un autre processus n'agrège le même lot
+    monkeypatch.setattr(erreur_stats, 'rolled_up_erreur_id', lambda: 0)
+    assert compact_rollups(safety_seconds=0) == 0
+    monkeypatch.undo()
+    assert compact_rollups(safety_seconds=0) == 1
+    assert _total(now - timedelta(days=1), now + timedelta(days=1)) == 2
+
+
+def test_rolled_up_rows_receive_no_repeats(app, baes_ids):
+    now = current_time()
+    insert_events([{'baes_id': baes_ids[0], 'type_erreur': 'erreur_batterie', 'timestamp': now}])
+    compact_rollups(safety_seconds=0)
+    # Une répétition dans la fenêtre ouvre une nouvelle ligne : l'ancienne est déjà comptée
+    assert insert_events([{'baes_id': baes_ids[0], 'type_erreur': 'erreur_batterie',
+                           'timestamp': now + timedelta(seconds=5)}]) == (1, 0)
+    assert _total(now - timedelta(days=1), now + timedelta(days=1)) == 2
+    compact_rollups(safety_seconds=0)
+    assert _total(now - timedelta(days=1), now + timedelta(days=1)) == 2
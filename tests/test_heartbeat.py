@@ -0,0 +1,128 @@
+# tests/test_heartbeat.py
+from datetime import timedelta
+
+from sqlalchemy import delete
+
+from models import db, Baes, BaesHeartbeat, HistoriqueErreur
+from services.baes_status import _as_utc
+from services.heartbeat import CONNEXION_ERREUR, HeartbeatMonitor
+from templates.TimestampMixin import current_time
+
+TIMEOUT = 180
+
+
+def _monitor(app):
+    # Le thread n'est jamais lancé : les passages sont déclenchés par le test
+    monitor = HeartbeatMonitor(app, interval=30, timeout=TIMEOUT)
+    monitor.load()
+    return monitor
+
+
+def _silence(monitor, *baes_ids):
+    """Recule le dernier battement en mémoire au-delà du délai, comme si la BAES s'était tue depuis."""
+    for baes_id in baes_ids:
+        monitor._seen[baes_id] = current_time() - timedelta(seconds=TIMEOUT + 60)
+        monitor._beaten.discard(baes_id)
+
+
+def _persisted():
+    db.session.expire_all()
+    return {h.baes_id: _as_utc(h.last_seen_at) for h in BaesHeartbeat.query}
+
+
+def _connexion_erreurs():
+    db.session.expire_all()
+    return [(e.baes_id, e.is_solved) for e in
+            HistoriqueErreur.query.filter_by(type_erreur=CONNEXION_ERREUR).order_by(HistoriqueErreur.id)]
+
+
+def test_beat_rejects_unknown_ids(app, baes_ids):
+    monitor = _monitor(app)
+    assert monitor.beat([baes_ids[0], 9999]) == (1, [9999])
+    assert monitor.flush() == 1
+    assert set(_persisted()) == {baes_ids[0]}
+
+
+def test_flush_skips_baes_deleted_since_their_beat(app, baes_ids):
+    monitor = _monitor(app)
+    monitor.beat(baes_ids)
+    db.session.execute(delete(Baes.__table__).where(Baes.id == baes_ids[2]))
+    db.session.commit()
+    # Sans vérification, l'INSERT de la BAES supprimée violerait la clé étrangère à chaque passage
+    assert monitor.flush() == 2
+    assert set(_persisted()) == set(baes_ids[:2])
+    assert monitor.stats()['tracked'] == 2
+
+    monitor.beat(baes_ids[:2])
+    assert monitor.flush() == 2
+    assert monitor.stats()['pending'] == 0
+
+
+def test_flush_never_moves_a_date_backwards(app, baes_ids):
+    monitor = _monitor(app)
+    monitor.beat([baes_ids[0]])
+    monitor.flush()
+    later = current_time() + timedelta(minutes=5)
+    # Date plus récente recopiée par un autre worker
+    BaesHeartbeat.query.update({'last_seen_at': later})
+    db.session.commit()
+    monitor.beat([baes_ids[0]])
+    monitor.flush()
+    assert _persisted()[baes_ids[0]] == later
+
+
+def test_sweep_runs_when_flush_fails(app, baes_ids, monkeypatch):
+    monitor = _monitor(app)
+    monitor.beat([baes_ids[0]])
+    _silence(monitor, baes_ids[0])
+
+    def unavailable():
+        raise RuntimeError('base indisponible')
+
+    monkeypatch.setattr(monitor, 'flush', unavailable)
+    monitor._tick()
+    assert _connexion_erreurs() == [(baes_ids[0], False)]
+
+
+def test_silent_baes_is_raised_once_across_workers(app, baes_ids):
+    first, second = _monitor(app), _monitor(app)
+    for monitor in (first, second):
+        monitor.beat([baes_ids[0]])
+        _silence(monitor, baes_ids[0])
+    assert first.sweep() == (1, 0)
+    # Le second worker voit l'erreur ouverte par le premier
+    assert second.sweep() == (0, 0)
+    assert first.sweep() == (0, 0)
+    assert _connexion_erreurs() == [(baes_ids[0], False)]
+
+
+def test_resumed_beats_resolve_the_error(app, baes_ids):
+    monitor = _monitor(app)
+    monitor.beat([baes_ids[0]])
+    _silence(monitor, baes_ids[0])
+    monitor.sweep()
+    monitor.beat([baes_ids[0]])
+    assert monitor.sweep() == (0, 1)
+    assert _connexion_erreurs() == [(baes_ids[0], True)]
+    assert monitor.stats()['silent'] == 0
+
+
+def test_recent_beat_from_another_worker_prevents_raise(app, baes_ids):
+    other = _monitor(app)
+    other.beat([baes_ids[0]])
+    other.flush()
+    monitor = _monitor(app)
+    _silence(monitor, baes_ids[0])
+    assert monitor.sweep() == (0, 0)
+    assert _connexion_erreurs() == []
+    # La date en mémoire a été avancée à celle recopiée par l'autre worker
+    assert monitor._seen[baes_ids[0]] == _persisted()[baes_ids[0]]
+
+
+def test_silence_since_restart_is_raised(app, baes_ids):
+    db.session.add(BaesHeartbeat(baes_id=baes_ids[1],
+                                 last_seen_at=current_time() - timedelta(seconds=TIMEOUT + 60)))
+    db.session.commit()
+    # Aucun battement reçu depuis le redémarrage : la date rechargée suffit
+    assert _monitor(app).sweep() == (1, 0)
+    assert _connexion_erreurs() == [(baes_ids[1], False)]
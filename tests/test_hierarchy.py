@@ -0,0 +1,67 @@
+# tests/test_hierarchy.py
+import itertools
+
+import pytest
+
+from models import db, Baes, Batiment, Carte, Etage, HistoriqueErreur, Role, Site, User, UserSiteRole
+from services.hierarchy import HIERARCHY_QUERY_COUNT, Projection, load_site_hierarchy
+from services.query_counter import QueryCounter
+
+
+def _seed(nsites=3, nbat=2, neta=2, nbaes=3, nerr=2):
+    """Crée un arbre complet (cartes et erreurs comprises) ; retourne les ids des sites."""
+    user = User(login='u')
+    user.set_password('p')
+    role = Role(name='admin')
+    db.session.add_all([user, role])
+    db.session.flush()
+    numbers = itertools.count(1)
+    site_ids = []
+    for s in range(nsites):
+        site = Site(name=f'site {s}')
+        db.session.add(site)
+        db.session.flush()
+        site_ids.append(site.id)
+        db.session.add(UserSiteRole(user_id=user.id, site_id=site.id, role_id=role.id))
+        db.session.add(Carte(chemin='site.png', site_id=site.id))
+        for b in range(nbat):
+            batiment = Batiment(name=f'bat {b}', site_id=site.id)
+            db.session.add(batiment)
+            db.session.flush()
+            for e in range(neta):
+                etage = Etage(name=f'etage {e}', batiment_id=batiment.id)
+                db.session.add(etage)
+                db.session.flush()
+                db.session.add(Carte(chemin='etage.png', etage_id=etage.id))
+                for x in range(nbaes):
+                    baes = Baes(name=f'baes {next(numbers)}', position={'x': x}, etage_id=etage.id)
+                    db.session.add(baes)
+                    db.session.flush()
+                    for _ in range(nerr):
+                        db.session.add(HistoriqueErreur(baes_id=baes.id, type_erreur='erreur_batterie'))
+    db.session.commit()
+    db.session.expunge_all()
+    return site_ids
+
+
+@pytest.mark.parametrize('nsites', [1, 3])
+def test_load_site_hierarchy_query_count(app, nsites):
+    site_ids = _seed(nsites=nsites)
+    with QueryCounter(db.engine) as counter:
+        hierarchy = load_site_hierarchy(site_ids)
+        # Le parcours de l'arbre préchargé n'émet aucune requête supplémentaire
+        baes = [b for site in hierarchy.sites for bat in hierarchy.batiments_of(site)
+                for etage in hierarchy.etages_of(bat) for b in hierarchy.baes_of(etage)]
+        erreurs = [err for b in baes for err in hierarchy.erreurs_of(b)]
+    assert counter.count <= HIERARCHY_QUERY_COUNT, counter.statements
+    assert len(hierarchy.sites) == nsites
+    assert len(baes) == nsites * 2 * 2 * 3
+    assert len(erreurs) == len(baes) * 2
+
+
+def test_projection_skips_excluded_levels(app):
+    site_ids = _seed()
+    with QueryCounter(db.engine) as counter:
+        hierarchy = load_site_hierarchy(site_ids, Projection(depth='etage'))
+    assert counter.count < HIERARCHY_QUERY_COUNT, counter.statements
+    assert all(hierarchy.etages_of(bat) for site in hierarchy.sites for bat in hierarchy.batiments_of(site))
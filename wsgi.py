@@ -0,0 +1,12 @@
+# wsgi.py
+"""
+Point d'entrée des serveurs WSGI : gunicorn wsgi:app
+
+Contrairement à `app`, importé aussi par les commandes flask (db upgrade, tâches planifiées),
+ce module n'est chargé que par les processus qui servent des requêtes : il y démarre le suivi
+des battements de cœur des BAES.
+"""
+from app import app
+from services.heartbeat import init_heartbeat_monitor
+
+init_heartbeat_monitor(app)